@@ -0,0 +1,184 @@
+###################################################
+#               Bit Rate Controller               #
+#                                                 #
+#  Description: Adapts the drone's video bit rate #
+#               to the link quality. Watches      #
+#               dropped frames, frame conversion  #
+#               time and Wi-Fi SNR once per       #
+#               window and steps the bit rate     #
+#               down or up (with hysteresis) to   #
+#               keep video latency under a target #
+#               budget.                           #
+###################################################
+
+# Required Imports
+import threading
+import time
+import numpy as np
+
+class BitRateController:
+    """  CLASS CONSTANTS  """
+    # Tello bit rate settings (1-5 Mbps, 0 is auto and not used here)
+    MIN_LEVEL = 1
+    MAX_LEVEL = 5
+
+    # Nominal camera frame rate used to count dropped frames
+    FRAME_RATE = 30.0
+
+    # Seconds of frames evaluated per decision
+    WINDOW = 1.0
+
+    # Target end-to-end video latency (seconds)
+    LATENCY_BUDGET = 0.25
+
+    # Fraction of dropped frames considered bad
+    MAX_DROP_RATIO = 0.1
+
+    # SNR (dB) below which the link is considered bad (0 disables the check)
+    MIN_SNR = 0
+
+    # Consecutive bad windows before stepping down / good windows before stepping up
+    DOWN_WINDOWS = 2
+    UP_WINDOWS = 5
+
+    # Fraction of the budget a window must stay under to count as good
+    UP_MARGIN = 0.6
+
+    # Seconds between get_wifi() queries (0 disables, the query shares the command channel)
+    SNR_PERIOD = 0.0
+
+
+    def __init__(self, drone, video_stream, latency_budget: float=LATENCY_BUDGET,
+                 level: int=MAX_LEVEL, snr_period: float=SNR_PERIOD, min_snr: int=MIN_SNR):
+        self.drone = drone
+        self.video_stream = video_stream
+        self.latency_budget = latency_budget
+        self.level = level
+        self.snr_period = snr_period
+        self.min_snr = min_snr
+
+        # Frame statistics collected since the last window
+        self.grab_times = []
+        self.convert_latencies = []
+        self.lock = threading.Lock()
+
+        # Set once the stream has produced frames, windows without frames count as bad from then on
+        self.streaming = False
+
+        # Decision state
+        self.snr = None
+        self.last_snr_query = 0.0
+        self.bad_windows = 0
+        self.good_windows = 0
+        self.changes = []
+        self.last_stats = None
+
+        # Initialize control thread
+        self.running = False
+        self.control_thread = None
+
+
+    # Apply the starting bit rate and begin adapting
+    def start(self):
+        self.drone.set_bit_rate(self.level)
+        self.video_stream.subscribe(self.on_frame)
+        self.running = True
+        self.control_thread = threading.Thread(target=self._control_thread)
+        self.control_thread.daemon = True
+        self.control_thread.start()
+
+
+    # Stop adapting
+    def stop(self):
+        self.running = False
+        self.video_stream.unsubscribe(self.on_frame)
+
+
+    # Frame callback from the video stream
+    def on_frame(self, frame):
+        with self.lock:
+            self.streaming = True
+            self.grab_times.append(frame.grab_time)
+            self.convert_latencies.append(frame.convert_time - frame.grab_time)
+
+
+    # Record an SNR value obtained elsewhere (e.g. a telemetry query)
+    def update_snr(self, snr: int):
+        self.snr = snr
+
+
+    # Evaluate one window at a time
+    def _control_thread(self):
+        while self.running:
+            time.sleep(self.WINDOW)
+            if self.snr_period > 0 and time.monotonic() - self.last_snr_query > self.snr_period:
+                self.last_snr_query = time.monotonic()
+                # Keep the previous SNR if the query timed out or returned something unexpected
+                try:
+                    self.snr = self.drone.int_response(self.drone.get_wifi())
+                except ValueError:
+                    pass
+            self.step(self.window_stats())
+
+
+    # Summarize and reset the frames collected in the current window
+    def window_stats(self):
+        with self.lock:
+            grab_times = np.array(self.grab_times)
+            convert_latencies = np.array(self.convert_latencies)
+            self.grab_times = []
+            self.convert_latencies = []
+
+        # Without at least two frames there is no latency or drop ratio (stream not started yet, or stalled)
+        stats = {'frames': len(grab_times), 'drop_ratio': None, 'latency': None, 'snr': self.snr}
+        if len(grab_times) < 2:
+            return stats
+
+        # A gap of n frame periods means n - 1 frames were dropped
+        gaps = np.diff(grab_times)
+        dropped = np.sum(np.maximum(np.round(gaps * self.FRAME_RATE) - 1, 0))
+        stats['drop_ratio'] = float(dropped / (dropped + len(grab_times)))
+
+        # Conversion time plus the worst frame gap approximates how stale the picture gets
+        stats['latency'] = float(np.percentile(convert_latencies, 90) + np.percentile(gaps, 90))
+        return stats
+
+
+    # Decide whether to change the bit rate based on a window's statistics
+    def step(self, stats: dict):
+        self.last_stats = stats
+        if stats['latency'] is None:
+            # Nothing to judge before the first frames, after them a window without frames means the stream stalled
+            if not self.streaming:
+                return self.level
+            bad, good = True, False
+        else:
+            snr_bad = self.min_snr > 0 and stats['snr'] is not None and stats['snr'] < self.min_snr
+            bad = stats['latency'] > self.latency_budget or stats['drop_ratio'] > self.MAX_DROP_RATIO or snr_bad
+            good = (stats['latency'] < self.UP_MARGIN * self.latency_budget
+                    and stats['drop_ratio'] < self.MAX_DROP_RATIO / 2 and not snr_bad)
+
+        if bad:
+            self.bad_windows += 1
+            self.good_windows = 0
+        elif good:
+            self.good_windows += 1
+            self.bad_windows = 0
+        else:
+            self.bad_windows = 0
+            self.good_windows = 0
+
+        if self.bad_windows >= self.DOWN_WINDOWS and self.level > self.MIN_LEVEL:
+            self.set_level(self.level - 1, stats)
+        elif self.good_windows >= self.UP_WINDOWS and self.level < self.MAX_LEVEL:
+            self.set_level(self.level + 1, stats)
+        return self.level
+
+
+    # Send a new bit rate to the drone
+    def set_level(self, level: int, stats: dict):
+        self.bad_windows = 0
+        self.good_windows = 0
+        self.level = level
+        self.changes.append((time.monotonic(), level, stats))
+        self.drone.set_bit_rate(level)
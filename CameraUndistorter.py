@@ -0,0 +1,206 @@
+###################################################
+#               Camera Undistorter                #
+#                                                 #
+#  Description: Loads camera intrinsics in the    #
+#               rpg_svo camera yaml format        #
+#               (Pinhole or ATAN) and rectifies   #
+#               drone frames. Remap tables are    #
+#               built once per resolution in      #
+#               fixed point form and cached on    #
+#               disk. Feature coordinates can be  #
+#               rectified on their own so whole   #
+#               images don't have to be.          #
+###################################################
+
+# Required Imports
+import hashlib
+import os
+import cv2
+import numpy as np
+
+class CameraUndistorter:
+    """  CLASS CONSTANTS  """
+    # Default calibration file (Tello camera)
+    CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'camera_tello.yaml')
+
+    # Directory remap tables are cached in
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'autodrone')
+
+    # Iterations used to invert the pinhole distortion of feature coordinates
+    POINT_ITERATIONS = 20
+
+
+    def __init__(self, calibration_file: str=CALIBRATION_FILE, cache_dir: str=CACHE_DIR, sparse: bool=False):
+        self.params = self.load_calibration(calibration_file)
+        self.model = self.params['cam_model'].lower()
+        if self.model not in ('pinhole', 'atan'):
+            raise ValueError('Unsupported camera model: ' + self.params['cam_model'])
+        self.calib_size = (int(self.params['cam_width']), int(self.params['cam_height']))
+
+        # Only rectify feature coordinates, never whole frames
+        self.sparse = sparse
+
+        # Remap tables per (width, height), kept in memory and on disk
+        self.cache_dir = cache_dir
+        self.maps = {}
+
+
+    # Read a "key: value" camera yaml file as used in svo_ros/param
+    @staticmethod
+    def load_calibration(filename: str):
+        params = {}
+        with open(filename) as file:
+            for line in file:
+                line = line.split('#')[0].strip()
+                key, sep, value = line.partition(':')
+                if not sep:
+                    continue
+                value = value.strip()
+                try:
+                    params[key.strip()] = float(value)
+                except ValueError:
+                    params[key.strip()] = value
+        return params
+
+
+    # Intrinsics scaled to a frame size: (fx, fy, cx, cy, distortion)
+    def intrinsics(self, size):
+        sx = size[0] / self.calib_size[0]
+        sy = size[1] / self.calib_size[1]
+        p = self.params
+        if self.model == 'pinhole':
+            # Principal point scales about the pixel corner, hence the half pixel shifts
+            fx, fy = p['cam_fx'] * sx, p['cam_fy'] * sy
+            cx, cy = (p['cam_cx'] + 0.5) * sx - 0.5, (p['cam_cy'] + 0.5) * sy - 0.5
+            dist = np.array([p.get('cam_d0', 0.0), p.get('cam_d1', 0.0), p.get('cam_d2', 0.0), p.get('cam_d3', 0.0)])
+        else:
+            # ATAN parameters are normalized by the image size (same as vikit's ATANCamera)
+            fx, fy = p['cam_fx'] * size[0], p['cam_fy'] * size[1]
+            cx, cy = p['cam_cx'] * size[0] - 0.5, p['cam_cy'] * size[1] - 0.5
+            dist = np.array([p.get('cam_d0', 0.0)])
+        return fx, fy, cx, cy, dist
+
+
+    # Camera matrix of the rectified (pinhole, distortion free) image
+    def camera_matrix(self, size):
+        fx, fy, cx, cy, dist = self.intrinsics(size)
+        return np.array([[fx, 0.0, cx], [0.0, fy, cy], [0.0, 0.0, 1.0]])
+
+
+    # Get the fixed point remap tables for a frame size, building or loading them once
+    def get_maps(self, size):
+        size = (int(size[0]), int(size[1]))
+        if size in self.maps:
+            return self.maps[size]
+
+        # Cache files are keyed by the calibration and resolution
+        key = hashlib.sha1(repr(sorted(self.params.items())).encode('utf-8')).hexdigest()[:12]
+        cache_file = os.path.join(self.cache_dir, 'undistort_%s_%dx%d.npz' % (key, size[0], size[1]))
+        if os.path.exists(cache_file):
+            data = np.load(cache_file)
+            maps = (data['map1'], data['map2'])
+        else:
+            maps = self._build_maps(size)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(cache_file, map1=maps[0], map2=maps[1])
+
+        self.maps[size] = maps
+        return maps
+
+
+    # Compute remap tables in the CV_16SC2 fixed point format cv2.remap reads fastest
+    def _build_maps(self, size):
+        K = self.camera_matrix(size)
+        fx, fy, cx, cy, dist = self.intrinsics(size)
+        if self.model == 'pinhole':
+            return cv2.initUndistortRectifyMap(K, dist, None, K, size, cv2.CV_16SC2)
+
+        # ATAN: distort the normalized coordinates of every rectified pixel
+        u, v = np.meshgrid(np.arange(size[0], dtype=np.float32), np.arange(size[1], dtype=np.float32))
+        x = (u - cx) / fx
+        y = (v - cy) / fy
+        factor = self._atan_distort_factor(np.hypot(x, y), dist[0])
+        map_x = np.float32(cx + fx * factor * x)
+        map_y = np.float32(cy + fy * factor * y)
+        return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+    # Ratio of distorted to undistorted radius for the ATAN model
+    @staticmethod
+    def _atan_distort_factor(r, s: float):
+        if s == 0:
+            return np.ones_like(r)
+        tans = 2.0 * np.tan(s / 2.0)
+        safe = np.where(r > 1e-3, r, 1.0)
+        return np.where(r > 1e-3, np.arctan(safe * tans) / (s * safe), 1.0)
+
+
+    # Ratio of undistorted to distorted radius for the ATAN model
+    @staticmethod
+    def _atan_undistort_factor(r, s: float):
+        if s == 0:
+            return np.ones_like(r)
+        tans = 2.0 * np.tan(s / 2.0)
+        safe = np.where(r > 1e-3, r, 1.0)
+        return np.where(r > 1e-3, np.tan(safe * s) / (tans * safe), 1.0)
+
+
+    # Rectify a whole image
+    def undistort(self, image):
+        map1, map2 = self.get_maps((image.shape[1], image.shape[0]))
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+
+    # Rectify an (N, 2) array of pixel coordinates taken from an image of the given size
+    def undistort_points(self, points, size):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return points
+        fx, fy, cx, cy, dist = self.intrinsics(size)
+        xd = (points[:, 0] - cx) / fx
+        yd = (points[:, 1] - cy) / fy
+        if self.model == 'pinhole':
+            # Fixed point iteration on the radial-tangential model (as cv2.undistortPoints does)
+            k1, k2, p1, p2 = dist
+            x, y = xd.copy(), yd.copy()
+            for i in range(self.POINT_ITERATIONS):
+                r2 = x * x + y * y
+                radial = 1.0 + k1 * r2 + k2 * r2 * r2
+                x = (xd - (2.0 * p1 * x * y + p2 * (r2 + 2.0 * x * x))) / radial
+                y = (yd - (p1 * (r2 + 2.0 * y * y) + 2.0 * p2 * x * y)) / radial
+        else:
+            # ATAN has a closed form inverse
+            factor = self._atan_undistort_factor(np.hypot(xd, yd), dist[0])
+            x, y = factor * xd, factor * yd
+        return np.stack((cx + fx * x, cy + fy * y), axis=1)
+
+
+    # Distorted pixel coordinates of an (N, 2) array of rectified ones (inverse of undistort_points)
+    def distort_points(self, points, size):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return points
+        fx, fy, cx, cy, dist = self.intrinsics(size)
+        x = (points[:, 0] - cx) / fx
+        y = (points[:, 1] - cy) / fy
+        if self.model == 'pinhole':
+            k1, k2, p1, p2 = dist
+            r2 = x * x + y * y
+            radial = 1.0 + k1 * r2 + k2 * r2 * r2
+            xd = x * radial + 2.0 * p1 * x * y + p2 * (r2 + 2.0 * x * x)
+            yd = y * radial + p1 * (r2 + 2.0 * y * y) + 2.0 * p2 * x * y
+        else:
+            factor = self._atan_distort_factor(np.hypot(x, y), dist[0])
+            xd, yd = factor * x, factor * y
+        return np.stack((cx + fx * xd, cy + fy * yd), axis=1)
+
+
+    # Frame callback for DroneVideoStream.subscribe: attaches the rectified image
+    def on_frame(self, frame):
+        if not self.sparse:
+            frame.rectified = self.undistort(frame.image)
+
+
+    # Rectify frames from a video stream as they arrive
+    def attach(self, video_stream):
+        video_stream.subscribe(self.on_frame)
@@ -0,0 +1,400 @@
+###################################################
+#                  Depth Filter                   #
+#                                                 #
+#  Description: Python version of rpg_svo's depth #
+#               filter. Every seed keeps a        #
+#               Gaussian x Beta estimate of its   #
+#               inverse depth. All seeds live in  #
+#               numpy arrays and are updated      #
+#               together: one batched epipolar    #
+#               search, one triangulation and one #
+#               Bayesian update per frame. Seeds  #
+#               that converge are handed out as   #
+#               new map points.                   #
+###################################################
+
+# Required Imports
+import collections
+import threading
+import cv2
+import numpy as np
+
+class DepthFilter:
+    """  CLASS CONSTANTS  """
+    # Side length of the patches compared along the epipolar line
+    PATCH_SIZE = 8
+
+    # Samples along each epipolar segment (coarse pass) and around the best one (fine pass)
+    COARSE_SAMPLES = 32
+    FINE_SAMPLES = 8
+
+    # Minimum zero-mean NCC for a patch match
+    MIN_NCC = 0.8
+
+    # Assumed pixel noise of a match
+    PX_NOISE = 1.0
+
+    # A seed converges once its std is below z_range / CONVERGENCE_RATIO (as in rpg_svo)
+    CONVERGENCE_RATIO = 200.0
+
+    # Seeds are dropped once this many newer keyframes have been added
+    MAX_SEED_KEYFRAMES = 3
+
+    # Plain frames waiting in the queue before the oldest is dropped
+    MAX_QUEUED_FRAMES = 2
+
+    # Rows per cv2.remap call (remap only takes maps smaller than SHRT_MAX)
+    REMAP_ROWS = 32000
+
+    # Initial seed storage
+    CAPACITY = 1024
+
+
+    def __init__(self, camera_matrix, on_converged=None):
+        self.K = np.asarray(camera_matrix, dtype=np.float64)
+        self.K_inv = np.linalg.inv(self.K)
+        self.focal = 0.5 * (self.K[0, 0] + self.K[1, 1])
+        self.px_error_angle = 2.0 * np.arctan(self.PX_NOISE / (2.0 * self.focal))
+
+        # Called with (world points (n, 3), keyframe ids (n,)) when seeds converge
+        self.on_converged = on_converged
+        self.converged = []
+
+        # Patch sample offsets relative to a patch center
+        half = self.PATCH_SIZE / 2.0 - 0.5
+        oy, ox = np.mgrid[0:self.PATCH_SIZE, 0:self.PATCH_SIZE] - half
+        self.patch_offsets = np.stack((ox.ravel(), oy.ravel()), axis=1).astype(np.float32)
+
+        # Keyframe poses (world to camera) by keyframe id
+        self.keyframes = {}
+        self.kf_count = 0
+
+        # Seed storage (structure of arrays), only the first self.n entries are live
+        self.n = 0
+        self._allocate(self.CAPACITY)
+
+        # Job queue feeding the worker thread
+        self.jobs = collections.deque()
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.running = False
+        self.worker_thread = None
+
+
+    # (Re)allocate seed arrays, keeping the live seeds
+    def _allocate(self, capacity: int):
+        old = getattr(self, 'seed_kf', None)
+        arrays = {
+            'seed_kf': np.zeros(capacity, int),              # reference keyframe id
+            'seed_px': np.zeros((capacity, 2)),              # pixel in the reference keyframe
+            'seed_f': np.zeros((capacity, 3)),               # unit bearing in the reference keyframe
+            'seed_patch': np.zeros((capacity, self.PATCH_SIZE ** 2), np.float32),
+            'seed_a': np.zeros(capacity),                    # Beta inlier parameter
+            'seed_b': np.zeros(capacity),                    # Beta outlier parameter
+            'seed_mu': np.zeros(capacity),                   # mean inverse depth
+            'seed_sigma2': np.zeros(capacity),               # inverse depth variance
+            'seed_z_range': np.zeros(capacity),              # max inverse depth
+        }
+        for name, array in arrays.items():
+            if old is not None:
+                array[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+
+    # Start the worker thread
+    def start(self):
+        self.running = True
+        self.worker_thread = threading.Thread(target=self._worker_thread)
+        self.worker_thread.daemon = True
+        self.worker_thread.start()
+
+
+    # Stop the worker thread
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+
+
+    # Queue a keyframe: new seeds are created at points (N, 2) (pending frames are dropped)
+    def add_keyframe(self, image, R, t, points, depth_mean: float, depth_min: float):
+        with self.condition:
+            self.jobs = collections.deque(job for job in self.jobs if job[0] == 'keyframe')
+            self.jobs.append(('keyframe', image, R, t, points, depth_mean, depth_min))
+            self.condition.notify()
+
+
+    # Queue a frame used to update the seeds
+    def add_frame(self, image, R, t):
+        with self.condition:
+            frames = [i for i, job in enumerate(self.jobs) if job[0] == 'frame']
+            if len(frames) >= self.MAX_QUEUED_FRAMES:
+                del self.jobs[frames[0]]
+            self.jobs.append(('frame', image, R, t))
+            self.condition.notify()
+
+
+    # Process queued keyframes and frames
+    def _worker_thread(self):
+        while self.running:
+            with self.condition:
+                self.condition.wait_for(lambda: self.jobs or not self.running)
+                if not self.running:
+                    break
+                job = self.jobs.popleft()
+            if job[0] == 'keyframe':
+                self.initialize_seeds(*job[1:])
+            else:
+                self.update_seeds(*job[1:])
+
+
+    # Bilinear patches around (N, 2) centers as an (N, PATCH_SIZE**2) float array
+    def _patches(self, gray, centers):
+        centers = np.asarray(centers, np.float32).reshape(-1, 2)
+        out = np.empty((len(centers), self.PATCH_SIZE ** 2), np.float32)
+        for start in range(0, len(centers), self.REMAP_ROWS):
+            chunk = centers[start:start + self.REMAP_ROWS]
+            map_x = chunk[:, 0:1] + self.patch_offsets[:, 0]
+            map_y = chunk[:, 1:2] + self.patch_offsets[:, 1]
+            out[start:start + len(chunk)] = cv2.remap(gray, map_x, map_y, cv2.INTER_LINEAR,
+                                                      borderMode=cv2.BORDER_REPLICATE)
+        return out
+
+
+    # Float grayscale version of an image
+    @staticmethod
+    def _gray(image):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return np.float32(image)
+
+
+    # Create seeds for the features of a new keyframe
+    def initialize_seeds(self, image, R, t, points, depth_mean: float, depth_min: float):
+        gray = self._gray(image)
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        with self.lock:
+            kf_id = self.kf_count
+            self.kf_count += 1
+            self.keyframes[kf_id] = (np.asarray(R, np.float64), np.asarray(t, np.float64).ravel())
+
+            # Forget seeds (and keyframes) that have had their chance to converge
+            self._remove(self.seed_kf[:self.n] <= kf_id - self.MAX_SEED_KEYFRAMES)
+            live = set(self.seed_kf[:self.n].tolist())
+            for old in [k for k in self.keyframes if k != kf_id and k not in live]:
+                del self.keyframes[old]
+
+            count = len(points)
+            if count == 0:
+                return
+            if self.n + count > self.capacity:
+                self._allocate(max(2 * self.capacity, self.n + count))
+
+            f = np.hstack((points, np.ones((count, 1)))) @ self.K_inv.T
+            s = slice(self.n, self.n + count)
+            self.seed_kf[s] = kf_id
+            self.seed_px[s] = points
+            self.seed_f[s] = f / np.linalg.norm(f, axis=1, keepdims=True)
+            self.seed_patch[s] = self._patches(gray, points)
+            self.seed_a[s] = 10.0
+            self.seed_b[s] = 10.0
+            self.seed_mu[s] = 1.0 / depth_mean
+            self.seed_z_range[s] = 1.0 / depth_min
+            self.seed_sigma2[s] = self.seed_z_range[s] ** 2 / 36.0
+            self.n += count
+
+
+    # Drop the seeds selected by a boolean mask over the live seeds
+    def _remove(self, mask):
+        if not np.any(mask):
+            return
+        keep = np.nonzero(~mask)[0]
+        for name in ('seed_kf', 'seed_px', 'seed_f', 'seed_patch', 'seed_a', 'seed_b',
+                     'seed_mu', 'seed_sigma2', 'seed_z_range'):
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        self.n = len(keep)
+
+
+    # Project (N, 3) camera points to pixels, returns pixels and a valid (in front) mask
+    def _project(self, points):
+        z = points[:, 2]
+        valid = z > 1e-6
+        uvw = points @ self.K.T
+        return uvw[:, :2] / np.where(valid, z, 1.0)[:, None], valid
+
+
+    # Zero-mean NCC between each seed's patch (N, P) and its candidates (N, M, P)
+    @staticmethod
+    def _ncc(ref, cand):
+        ref = ref - ref.mean(axis=1, keepdims=True)
+        cand = cand - cand.mean(axis=2, keepdims=True)
+        num = np.einsum('np,nmp->nm', ref, cand)
+        den = np.sqrt(np.sum(ref * ref, axis=1))[:, None] * np.sqrt(np.sum(cand * cand, axis=2))
+        return num / np.maximum(den, 1e-6)
+
+
+    # Update every seed with one new frame
+    def update_seeds(self, image, R, t):
+        gray = self._gray(image)
+        R = np.asarray(R, np.float64)
+        t = np.asarray(t, np.float64).ravel()
+        height, width = gray.shape
+
+        with self.lock:
+            n = self.n
+            if n == 0:
+                return 0
+
+            # Relative pose from each seed's keyframe to the current frame
+            kf_ids = np.array(sorted(self.keyframes))
+            kf_R = np.array([self.keyframes[k][0] for k in kf_ids])
+            kf_t = np.array([self.keyframes[k][1] for k in kf_ids])
+            index = np.searchsorted(kf_ids, self.seed_kf[:n])
+            R_rel = np.einsum('ij,nkj->nik', R, kf_R[index])
+            t_rel = t - np.einsum('nij,nj->ni', R_rel, kf_t[index])
+
+            f = self.seed_f[:n]
+            mu = self.seed_mu[:n]
+            sigma = np.sqrt(self.seed_sigma2[:n])
+            z_min = 1.0 / (mu + sigma)
+            z_max = 1.0 / np.maximum(mu - sigma, 1e-6)
+
+            # Epipolar segment between the depth bounds
+            rf = np.einsum('nij,nj->ni', R_rel, f)
+            px_min, ok_min = self._project(rf * z_min[:, None] + t_rel)
+            px_max, ok_max = self._project(rf * z_max[:, None] + t_rel)
+            searchable = ok_min & ok_max
+
+            # Coarse pass: evenly spaced samples along the segment
+            steps = np.linspace(0.0, 1.0, self.COARSE_SAMPLES)
+            samples = px_min[:, None, :] + steps[None, :, None] * (px_max - px_min)[:, None, :]
+            best, score = self._search(gray, samples, width, height)
+
+            # Fine pass: samples within one coarse step of the best match
+            step = (px_max - px_min) / (self.COARSE_SAMPLES - 1)
+            center = np.take_along_axis(samples, best[:, None, None], axis=1)[:, 0]
+            fine = np.linspace(-1.0, 1.0, self.FINE_SAMPLES)
+            samples = center[:, None, :] + fine[None, :, None] * step[:, None, :]
+            best, score = self._search(gray, samples, width, height)
+            match = np.take_along_axis(samples, best[:, None, None], axis=1)[:, 0]
+
+            matched = searchable & (score > self.MIN_NCC)
+
+            # Seeds without a match count as an outlier measurement
+            self.seed_b[:n][searchable & ~matched] += 1.0
+
+            if np.any(matched):
+                self._update(np.nonzero(matched)[0], R_rel, t_rel, rf, match)
+
+            return int(np.count_nonzero(matched))
+
+
+    # Best NCC sample for each seed out of (N, M, 2) candidate centers
+    def _search(self, gray, samples, width: int, height: int):
+        n, m = samples.shape[:2]
+        cand = self._patches(gray, samples.reshape(-1, 2)).reshape(n, m, -1)
+        score = self._ncc(self.seed_patch[:n], cand)
+
+        # Samples whose patch leaves the image can't match
+        margin = self.PATCH_SIZE / 2.0
+        inside = ((samples[..., 0] >= margin) & (samples[..., 0] < width - margin) &
+                  (samples[..., 1] >= margin) & (samples[..., 1] < height - margin))
+        score = np.where(inside, score, -1.0)
+        best = np.argmax(score, axis=1)
+        return best, score[np.arange(n), best]
+
+
+    # Triangulate the matched seeds and apply the Gaussian x Beta update
+    def _update(self, idx, R_rel, t_rel, rf, match):
+        f = self.seed_f[idx]
+        t = t_rel[idx]
+        rf = rf[idx]
+
+        # Depth along the reference bearing (least squares on both rays, as in rpg_svo)
+        f_cur = np.hstack((match[idx], np.ones((len(idx), 1)))) @ self.K_inv.T
+        f_cur /= np.linalg.norm(f_cur, axis=1, keepdims=True)
+        a11 = np.sum(rf * rf, axis=1)
+        a12 = np.sum(rf * f_cur, axis=1)
+        a22 = np.sum(f_cur * f_cur, axis=1)
+        b1 = -np.sum(rf * t, axis=1)
+        b2 = -np.sum(f_cur * t, axis=1)
+        det = a11 * a22 - a12 * a12
+        good = np.abs(det) > 1e-9
+        z = np.abs((a22 * b1 - a12 * b2) / np.where(good, det, 1.0))
+        good &= z > 1e-6
+
+        # Depth uncertainty from one pixel of error on the current ray (rpg_svo computeTau)
+        t_ref = -np.einsum('nji,nj->ni', R_rel[idx], t)
+        t_norm = np.linalg.norm(t_ref, axis=1)
+        a = f * z[:, None] - t_ref
+        a_norm = np.linalg.norm(a, axis=1)
+        alpha = np.arccos(np.clip(np.sum(f * t_ref, axis=1) / np.maximum(t_norm, 1e-12), -1.0, 1.0))
+        beta = np.arccos(np.clip(np.sum(a * -t_ref, axis=1) / np.maximum(t_norm * a_norm, 1e-12), -1.0, 1.0))
+        beta_plus = beta + self.px_error_angle
+        gamma_plus = np.pi - alpha - beta_plus
+        z_plus = t_norm * np.sin(beta_plus) / np.maximum(np.sin(gamma_plus), 1e-12)
+        tau = z_plus - z
+        tau_inverse = 0.5 * (1.0 / np.maximum(z - tau, 1e-7) - 1.0 / (z + tau))
+        good &= tau_inverse > 0
+
+        idx, z, tau_inverse = idx[good], z[good], tau_inverse[good]
+        x = 1.0 / z
+        tau2 = tau_inverse ** 2
+
+        a = self.seed_a[idx]
+        b = self.seed_b[idx]
+        mu = self.seed_mu[idx]
+        sigma2 = self.seed_sigma2[idx]
+        z_range = self.seed_z_range[idx]
+
+        # Gaussian x Beta update (Vogiatzis and Hernandez, as in rpg_svo)
+        norm_scale = np.sqrt(sigma2 + tau2)
+        likelihood = np.exp(-0.5 * ((x - mu) / norm_scale) ** 2) / (norm_scale * np.sqrt(2.0 * np.pi))
+        s2 = 1.0 / (1.0 / sigma2 + 1.0 / tau2)
+        m = s2 * (mu / sigma2 + x / tau2)
+        c1 = a / (a + b) * likelihood
+        c2 = b / (a + b) / z_range
+        norm = c1 + c2
+        c1 /= norm
+        c2 /= norm
+        f_ = c1 * (a + 1.0) / (a + b + 1.0) + c2 * a / (a + b + 1.0)
+        e_ = (c1 * (a + 1.0) * (a + 2.0) / ((a + b + 1.0) * (a + b + 2.0))
+              + c2 * a * (a + 1.0) / ((a + b + 1.0) * (a + b + 2.0)))
+        mu_new = c1 * m + c2 * mu
+        self.seed_sigma2[idx] = c1 * (s2 + m * m) + c2 * (sigma2 + mu * mu) - mu_new * mu_new
+        self.seed_mu[idx] = mu_new
+        self.seed_a[idx] = (e_ - f_) / (f_ - e_ / f_)
+        self.seed_b[idx] = self.seed_a[idx] * (1.0 - f_) / f_
+
+        # Promote seeds whose inverse depth is certain enough
+        n = self.n
+        done = np.sqrt(self.seed_sigma2[:n]) < self.seed_z_range[:n] / self.CONVERGENCE_RATIO
+        if np.any(done):
+            self._promote(done)
+
+
+    # Turn converged seeds into world points and remove them
+    def _promote(self, done):
+        kf = self.seed_kf[:self.n][done]
+        local = self.seed_f[:self.n][done] / self.seed_mu[:self.n][done][:, None]
+        points = np.zeros_like(local)
+        for kf_id in np.unique(kf):
+            R, t = self.keyframes[kf_id]
+            sel = kf == kf_id
+            points[sel] = (local[sel] - t) @ R
+        self._remove(done)
+        if self.on_converged is not None:
+            self.on_converged(points, kf)
+        else:
+            self.converged.append((points, kf))
+
+
+    # Return and clear the points that converged since the last call
+    def pop_converged(self):
+        with self.lock:
+            converged, self.converged = self.converged, []
+        if not converged:
+            return np.zeros((0, 3)), np.zeros(0, int)
+        return np.concatenate([c[0] for c in converged]), np.concatenate([c[1] for c in converged])
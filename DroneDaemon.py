@@ -0,0 +1,573 @@
+###################################################
+#                  Drone Daemon                   #
+#                                                 #
+#  Description: Owns the one connection to the    #
+#               drone (command port, state stream #
+#               and video) and shares it with any #
+#               number of local clients over a    #
+#               Unix domain socket. Commands are  #
+#               run one at a time in priority     #
+#               order, rc control goes to the     #
+#               highest priority client that is   #
+#               actively flying, and state /      #
+#               frames are pushed to subscribers  #
+#               without letting a slow client     #
+#               hold anyone else up.              #
+###################################################
+
+# Required Imports
+import heapq
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+import DroneFlightController
+import DroneVideoStream
+import KeepaliveScheduler
+
+# Message framing: header length, payload length, JSON header, binary payload
+FRAMING = struct.Struct('!II')
+
+
+# Send one framed message
+def send_message(sock, header: dict, payload: bytes=b''):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(FRAMING.pack(len(data), len(payload)) + data + payload)
+
+
+# Receive exactly count bytes, None if the peer closed the connection
+def _recv_exact(sock, count: int):
+    data = bytearray()
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+# Receive one framed message as (header, payload), or (None, None) on disconnect
+# A header that isn't valid JSON raises ValueError after the whole message was read, so the stream stays in step
+def recv_message(sock):
+    sizes = _recv_exact(sock, FRAMING.size)
+    if sizes is None:
+        return None, None
+    header_size, payload_size = FRAMING.unpack(sizes)
+    header = _recv_exact(sock, header_size)
+    payload = _recv_exact(sock, payload_size) if payload_size else b''
+    if header is None or payload is None:
+        return None, None
+    return json.loads(header.decode('utf-8')), payload
+
+
+class DaemonClient:
+
+    def __init__(self, daemon, connection, client_id: int, max_states: int):
+        self.daemon = daemon
+        self.connection = connection
+        self.client_id = client_id
+        self.name = 'client ' + str(client_id)
+        self.priority = 0
+        self.subscriptions = set()
+
+        # Outgoing messages: replies are never dropped, state keeps the newest few, frames only the newest
+        self.replies = deque()
+        self.states = deque(maxlen=max_states)
+        self.frame = None
+        self.dropped_frames = 0
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.reader_thread = threading.Thread(target=self._reader_thread)
+        self.reader_thread.daemon = True
+        self.writer_thread = threading.Thread(target=self._writer_thread)
+        self.writer_thread.daemon = True
+
+
+    # Start serving the client
+    def start(self):
+        self.reader_thread.start()
+        self.writer_thread.start()
+
+
+    # Read requests until the client disconnects
+    def _reader_thread(self):
+        try:
+            while self.running:
+                # A malformed request gets an error reply, it doesn't end the connection
+                try:
+                    header, payload = recv_message(self.connection)
+                except ValueError as exc:
+                    self.reply({'type': 'response', 'id': None, 'response': 'error: request header is not valid JSON ({})'.format(exc)})
+                    continue
+                if header is None:
+                    break
+                if not isinstance(header, dict):
+                    self.reply({'type': 'response', 'id': None, 'response': 'error: request header is not an object'})
+                    continue
+                try:
+                    self.daemon.handle(self, header)
+                except (KeyError, TypeError, ValueError, AttributeError) as exc:
+                    self.reply({'type': 'response', 'id': header.get('id'),
+                                'response': 'error: bad {} request ({}: {})'.format(header.get('type'), type(exc).__name__, exc)})
+        except OSError as exc:
+            print('Daemon client error: {}'.format(exc))
+        finally:
+            self.close()
+
+
+    # Send queued messages, newest frame last so replies and state never wait behind video
+    def _writer_thread(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.replies or self.states or self.frame or not self.running)
+                if not self.running:
+                    return
+                if self.replies:
+                    message = self.replies.popleft()
+                elif self.states:
+                    message = self.states.popleft()
+                else:
+                    message, self.frame = self.frame, None
+            try:
+                send_message(self.connection, *message)
+            except OSError:
+                self.close()
+                return
+
+
+    # Queue a reply (command response)
+    def reply(self, header: dict):
+        with self.condition:
+            self.replies.append((header, b''))
+            self.condition.notify()
+
+
+    # Queue a state sample, the oldest is dropped if the client falls behind
+    def push_state(self, header: dict):
+        with self.condition:
+            self.states.append((header, b''))
+            self.condition.notify()
+
+
+    # Offer a frame, replacing one the client hasn't taken yet
+    def push_frame(self, header: dict, payload: bytes):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped_frames += 1
+            self.frame = (header, payload)
+            self.condition.notify()
+
+
+    # Disconnect the client
+    def close(self):
+        if not self.running:
+            return
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        try:
+            self.connection.close()
+        except OSError:
+            pass
+        self.daemon.remove_client(self)
+
+
+class DroneDaemon:
+    """  CLASS CONSTANTS  """
+    # Unix socket clients connect to
+    SOCKET_PATH = '/tmp/autodrone.sock'
+
+    # Permissions of the socket file, only the user running the daemon may connect and fly the drone
+    SOCKET_MODE = 0o600
+
+    # Commands that skip the queue and go out at once, whoever sends them
+    URGENT_COMMANDS = ('emergency', 'land')
+
+    # An rc stream from a client holds the sticks against lower priority clients for this long (seconds)
+    RC_HOLD = 0.5
+
+    # State samples queued per client before the oldest is dropped
+    MAX_STATES = 16
+
+
+    def __init__(self, drone=None, socket_path: str=SOCKET_PATH, keepalive: bool=True):
+        # The one real connection to the drone
+        self.drone = drone if drone is not None else DroneFlightController.DroneFlightController(show_log=False)
+        self.socket_path = socket_path
+
+        # Keeps the drone from landing while no client is sending anything
+        self.keepalive = KeepaliveScheduler.KeepaliveScheduler(self.drone) if keepalive else None
+
+        # Connected clients
+        self.clients = {}
+        self.client_ids = itertools.count(1)
+        self.clients_lock = threading.Lock()
+
+        # Command queue ordered by (-priority, arrival)
+        self.queue = []
+        self.arrivals = itertools.count()
+        self.queue_condition = threading.Condition()
+
+        # Serializes attaching to / detaching from the video stream
+        self.frames_lock = threading.Lock()
+
+        # Current rc holder: (priority, client id, time of its last rc)
+        self.rc_holder = None
+        self.rc_lock = threading.Lock()
+
+        # Counters
+        self.stats = {'commands': 0, 'urgent': 0, 'interrupted': 0, 'rc_sent': 0, 'rc_overridden': 0, 'timeouts': 0}
+
+        # Initialize server and dispatch threads
+        self.running = False
+        self.server = None
+        self.accept_thread = None
+        self.dispatch_thread = None
+
+
+    # Start listening for clients
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        os.chmod(self.socket_path, self.SOCKET_MODE)
+        self.server.listen()
+        self.running = True
+
+        if self.drone.state_stream is not None:
+            self.drone.state_stream.subscribe(self.on_state)
+
+        self.accept_thread = threading.Thread(target=self._accept_thread)
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+        self.dispatch_thread = threading.Thread(target=self._dispatch_thread)
+        self.dispatch_thread.daemon = True
+        self.dispatch_thread.start()
+        if self.keepalive is not None:
+            self.keepalive.start()
+
+
+    # Stop serving, disconnect every client
+    def stop(self):
+        self.running = False
+        if self.keepalive is not None:
+            self.keepalive.stop()
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+        if self.server is not None:
+            self.server.close()
+        with self.clients_lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            client.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+    # Accept client connections
+    def _accept_thread(self):
+        while self.running:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                break
+            client = DaemonClient(self, connection, next(self.client_ids), self.MAX_STATES)
+            with self.clients_lock:
+                self.clients[client.client_id] = client
+            client.start()
+
+
+    # Forget a disconnected client
+    def remove_client(self, client):
+        with self.clients_lock:
+            self.clients.pop(client.client_id, None)
+        self._release_frames()
+
+
+    # Handle one request from a client (on the client's reader thread)
+    def handle(self, client, header: dict):
+        kind = header.get('type')
+        if kind == 'hello':
+            client.name = str(header.get('name', client.name))
+            client.priority = int(header.get('priority', 0))
+        elif kind == 'rc':
+            self._rc(client, header['command'])
+        elif kind == 'command':
+            self._enqueue(client, header)
+        elif kind == 'subscribe':
+            self._subscribe(client, header['stream'])
+        elif kind == 'unsubscribe':
+            self._unsubscribe(client, header['stream'])
+        elif kind == 'stats':
+            stats = dict(self.stats)
+            if self.keepalive is not None:
+                stats['keepalive'] = dict(self.keepalive.stats)
+            client.reply({'type': 'stats', 'id': header.get('id'), 'stats': stats})
+
+
+    # Queue a command, urgent ones are sent immediately
+    def _enqueue(self, client, header: dict):
+        command = header['command']
+        if command.split(' ')[0] == 'rc':
+            # The drone never answers rc, queued it would hold the dispatch thread for the whole command time out
+            self._rc(client, command)
+            client.reply({'type': 'response', 'id': header.get('id'), 'response': 'sent'})
+            return
+        if command.split(' ')[0] in self.URGENT_COMMANDS:
+            # Goes out now even if another command is waiting for its response, that command is then interrupted
+            # (the drone's reply can't be told apart) and the urgent one is reported as sent
+            response = self.drone.send_urgent(command)
+            self.stats['urgent'] += 1
+            if response is None:
+                response = 'sent'
+            else:
+                response = response.decode('utf-8', 'ignore').strip() if isinstance(response, bytes) else str(response)
+            client.reply({'type': 'response', 'id': header.get('id'), 'response': response})
+            return
+        with self.queue_condition:
+            heapq.heappush(self.queue, (-client.priority, next(self.arrivals), client, header.get('id'), command))
+            self.queue_condition.notify()
+
+
+    # Run queued commands one at a time, the drone only handles one outstanding request
+    def _dispatch_thread(self):
+        while self.running:
+            with self.queue_condition:
+                self.queue_condition.wait_for(lambda: self.queue or not self.running)
+                if not self.running:
+                    return
+                priority, arrival, client, request_id, command = heapq.heappop(self.queue)
+            if not client.running:
+                continue
+            response = self.drone.send_command(command)
+            self.stats['commands'] += 1
+            if self.drone.was_interrupted():
+                # An urgent command went out while this one waited, whatever came back may be its reply
+                self.stats['interrupted'] += 1
+                client.reply({'type': 'response', 'id': request_id, 'response': 'interrupted', 'interrupted': True})
+                continue
+            if response is None:
+                self.stats['timeouts'] += 1
+            else:
+                response = response.decode('utf-8', 'ignore').strip() if isinstance(response, bytes) else str(response)
+            client.reply({'type': 'response', 'id': request_id, 'response': response})
+
+
+    # Forward an rc command unless a higher priority client is holding the sticks
+    def _rc(self, client, command: str):
+        now = time.monotonic()
+        with self.rc_lock:
+            holder = self.rc_holder
+            if (holder is not None and holder[1] != client.client_id and holder[0] > client.priority
+                    and now - holder[2] < self.RC_HOLD):
+                self.stats['rc_overridden'] += 1
+                return
+            self.rc_holder = (client.priority, client.client_id, now)
+        self.drone.send_command(command, wait=False)
+        self.stats['rc_sent'] += 1
+
+
+    # Add a client to a stream
+    def _subscribe(self, client, stream: str):
+        client.subscriptions.add(stream)
+        if stream == 'frames':
+            with self.frames_lock:
+                if self.drone.video_stream is None:
+                    self.drone.streamon(display=False)
+                if self.on_frame not in self.drone.video_stream.subscribers:
+                    self.drone.video_stream.subscribe(self.on_frame)
+
+
+    # Remove a client from a stream, dropping a frame it hasn't taken yet
+    def _unsubscribe(self, client, stream: str):
+        client.subscriptions.discard(stream)
+        if stream == 'frames':
+            with client.condition:
+                client.frame = None
+            self._release_frames()
+
+
+    # Detach from the video stream once no client is subscribed to frames
+    def _release_frames(self):
+        with self.frames_lock:
+            if not self._subscribers('frames') and self.drone.video_stream is not None:
+                self.drone.video_stream.unsubscribe(self.on_frame)
+
+
+    # Clients subscribed to a stream
+    def _subscribers(self, stream: str):
+        with self.clients_lock:
+            return [c for c in self.clients.values() if stream in c.subscriptions]
+
+
+    # State stream callback: push the sample to subscribers
+    def on_state(self, stamp: float, row):
+        clients = self._subscribers('state')
+        if clients:
+            header = {'type': 'state', 'stamp': stamp, 'state': self.drone.state_stream.to_dict(row)}
+            for client in clients:
+                client.push_state(header)
+
+
+    # Video stream callback: serialize the frame once and share it with every subscriber
+    def on_frame(self, frame):
+        clients = self._subscribers('frames')
+        if not clients:
+            return
+        image = np.ascontiguousarray(frame.image)
+        header = {'type': 'frame', 'seq': frame.seq, 'grab_time': frame.grab_time, 'convert_time': frame.convert_time,
+                  'shape': image.shape, 'dtype': str(image.dtype)}
+        payload = image.tobytes()
+        for client in clients:
+            client.push_frame(header, payload)
+
+
+class DroneClient:
+    """  CLASS CONSTANTS  """
+    # Seconds to wait for a command response (the drone's own timeout plus queueing)
+    RESPONSE_TIMEOUT = 30.0
+
+
+    def __init__(self, name: str='client', priority: int=0, socket_path: str=DroneDaemon.SOCKET_PATH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.send_lock = threading.Lock()
+
+        # Pending requests: id -> [event, response]
+        self.request_ids = itertools.count(1)
+        self.pending = {}
+
+        # Latest pushed state and subscribers
+        self.state = None
+        self.state_stamp = None
+        self.state_callbacks = []
+        self.frame_callbacks = []
+
+        self.running = True
+        self.receive_thread = threading.Thread(target=self._receive_thread)
+        self.receive_thread.daemon = True
+        self.receive_thread.start()
+        self._send({'type': 'hello', 'name': name, 'priority': priority})
+
+
+    def _send(self, header: dict):
+        with self.send_lock:
+            send_message(self.socket, header)
+
+
+    # Dispatch messages pushed by the daemon
+    def _receive_thread(self):
+        while self.running:
+            try:
+                header, payload = recv_message(self.socket)
+            except OSError:
+                break
+            if header is None:
+                break
+            kind = header['type']
+            if kind in ('response', 'stats'):
+                waiter = self.pending.pop(header.get('id'), None)
+                if waiter is not None:
+                    waiter[1] = header.get('response', header.get('stats'))
+                    waiter[0].set()
+            elif kind == 'state':
+                self.state = header['state']
+                self.state_stamp = header['stamp']
+                for callback in list(self.state_callbacks):
+                    callback(header['stamp'], header['state'])
+            elif kind == 'frame':
+                image = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+                frame = DroneVideoStream.DroneFrame(header['seq'], image, header['grab_time'], header['convert_time'])
+                for callback in list(self.frame_callbacks):
+                    callback(frame)
+        self.running = False
+
+
+    # Send a request and wait for its reply
+    def _request(self, header: dict, timeout: float=RESPONSE_TIMEOUT):
+        request_id = next(self.request_ids)
+        waiter = [threading.Event(), None]
+        self.pending[request_id] = waiter
+        header['id'] = request_id
+        self._send(header)
+        if not waiter[0].wait(timeout):
+            self.pending.pop(request_id, None)
+            return None
+        return waiter[1]
+
+
+    # Run a command on the drone through the daemon, returns the response (None on time out)
+    def send_command(self, command: str, query: bool=False, wait: bool=True):
+        if not wait:
+            self._send({'type': 'command', 'command': command})
+            return None
+        return self._request({'type': 'command', 'command': command})
+
+
+    # Send RC control, subject to priority arbitration in the daemon
+    def rc_control(self, a: int, b: int, c: int, d: int):
+        self._send({'type': 'rc', 'command': 'rc ' + str(a) + ' ' + str(b) + ' ' + str(c) + ' ' + str(d)})
+
+
+    # Initiate auto-takeoff
+    def takeoff(self):
+        return self.send_command('takeoff')
+
+    # Initiate auto-land (sent ahead of any queued commands)
+    def land(self):
+        return self.send_command('land')
+
+    # Stop all motors immediately (sent ahead of any queued commands)
+    def emergency(self):
+        return self.send_command('emergency')
+
+
+    # Receive every state sample as callback(stamp, state dict)
+    def subscribe_state(self, callback=None):
+        if callback is not None:
+            self.state_callbacks.append(callback)
+        self._send({'type': 'subscribe', 'stream': 'state'})
+
+
+    # Receive frames as callback(DroneFrame); frames are dropped rather than queued if this client is slow
+    def subscribe_frames(self, callback):
+        self.frame_callbacks.append(callback)
+        self._send({'type': 'subscribe', 'stream': 'frames'})
+
+
+    # Stop receiving frames
+    def unsubscribe_frames(self, callback=None):
+        if callback in self.frame_callbacks:
+            self.frame_callbacks.remove(callback)
+        self._send({'type': 'unsubscribe', 'stream': 'frames'})
+
+
+    # Daemon counters
+    def daemon_stats(self):
+        return self._request({'type': 'stats'})
+
+
+    # Disconnect from the daemon
+    def close(self):
+        self.running = False
+        self.socket.close()
+
+
+# Run the daemon until interrupted
+if __name__ == "__main__":
+    daemon = DroneDaemon()
+    daemon.start()
+    print('Drone daemon listening on ' + daemon.socket_path)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        daemon.stop()
+        daemon.drone.close()
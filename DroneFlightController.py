@@ -21,6 +21,12 @@ import threading
 import time
 import cv2
 import CommandResponseLogger
+import DroneStateStream
+import DroneVideoStream
+import FrameTelemetryAligner
+import MjpegServer
+import PreviewStream
+import QueryCache
 
 class DroneFlightController:
     """  CLASS CONSTANTS  """
@@ -39,20 +45,25 @@ class DroneFlightController:
     # Seconds until time out
     MAX_TIME_OUT = 15.0
 
+    # Commands sent at once even while another command is waiting for its response
+    URGENT_COMMANDS = ('emergency', 'land')
+
     
-    def __init__(self, record_log: bool=True, show_log: bool=True):
+    # tello_ip / tello_port / local_port can point the controller at a simulator or proxy instead of the drone
+    def __init__(self, record_log: bool=True, show_log: bool=True, use_state_stream: bool=True,
+                 tello_ip: str=TELLO_IP, tello_port: int=TELLO_PORT, local_port: int=LOCAL_PORT):
 
         
         # Open local UDP port on 8889 for Drone communication
         self.local_ip = self.LOCAL_IP
-        self.local_port = self.LOCAL_PORT
+        self.local_port = local_port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind((self.local_ip, self.local_port))
         
         # Set Drone ip and port info
-        self.tello_ip = self.TELLO_IP
-        self.tello_port = self.TELLO_PORT
+        self.tello_ip = tello_ip
+        self.tello_port = tello_port
         self.tello_address = (self.tello_ip, self.tello_port)
         
         # Set up potential query/response logging
@@ -62,26 +73,109 @@ class DroneFlightController:
 
         # Intialize response thread
         self.last_known_command = "None"
+        self.last_command_time = None
+        # (command, monotonic time it left the socket) of the latest datagram, set together in one assignment
+        self.last_sent = (None, None)
         self.response = None
         self.received_response_to_cur_cmd = False
         self.last_known_response = None
+        self.response_event = threading.Event()
+        self.command_lock = threading.RLock()
+        # Id of the command waiting for its response (None when idle) and of the one an urgent command interrupted,
+        # both changed under stale_condition. Whether the calling thread's last command was interrupted is kept
+        # per thread (see was_interrupted)
+        self.command_id = 0
+        self.waiting_id = None
+        self.interrupted_id = None
+        self.command_result = threading.local()
+        # Replies still owed to commands that gave up on them, dropped if they arrive before stale_until
+        self.stale_replies = 0
+        self.stale_until = 0.0
+        self.stale_condition = threading.Condition()
         self.receive_thread = threading.Thread(target=self._receive_thread)
         self.receive_thread.daemon = True
         self.receive_thread.start()
 
+        # Optional LatencyTracer, records a span around every sendto
+        self.tracer = None
+
+        # Read queries are cached per field and concurrent identical queries share one request
+        self.queries = QueryCache.QueryCache(self)
+
         # Runtime options 
         self.stream_state = False
         self.last_frame = None
+        self.last_frame_info = None
+        self.video_stream = None
+        self.preview = None
+        self.preview_server = None
+
+        # Listen for the drone's state packets (sent once in command mode)
+        self.state_stream = None
+        self.aligner = None
+        if (use_state_stream):
+            self.state_stream = DroneStateStream.DroneStateStream()
+            self.aligner = FrameTelemetryAligner.FrameTelemetryAligner(self.state_stream)
         
         # Setting Tello to command mode
         self.command()
 
 
-    # Send commands to drone
-    def send_command(self, command: str, query: bool =False):
-        # Re-initialize received_response variable
-        self.received_response_to_cur_cmd = False
-        
+    # Send commands to drone (wait=False returns right after sending, for commands the drone never answers)
+    # Returns the raw response, or None if the command timed out or wasn't waited on
+    def send_command(self, command: str, query: bool =False, wait: bool =True, timeout: float =MAX_TIME_OUT):
+        # Commands the drone answers hold the command lock until their response arrives,
+        # so two threads never have a request outstanding at once
+        if not wait:
+            return self._send(command)
+        with self.command_lock:
+            # A late reply to an abandoned command must not answer this one
+            self._wait_for_stale()
+
+            # Re-initialize received_response variable
+            self.received_response_to_cur_cmd = False
+            self.response_event.clear()
+            with self.stale_condition:
+                self.command_id += 1
+                self.waiting_id = self.command_id
+
+            # Update last known command
+            self.last_known_command = command
+            try:
+                self._send(command)
+                return self._wait_for_response(timeout)
+            finally:
+                with self.stale_condition:
+                    self.waiting_id = None
+
+
+    # Whether the last command this thread sent with send_command was interrupted by an urgent command
+    def was_interrupted(self):
+        return getattr(self.command_result, 'interrupted', False)
+
+
+    # Drop the reply to the command that just timed out if it arrives within hold seconds
+    def mark_stale(self, hold: float):
+        with self.stale_condition:
+            self.stale_replies += 1
+            self.stale_until = max(self.stale_until, time.monotonic() + hold)
+
+
+    # Whether a reply is still owed to an abandoned command
+    def _stale_pending(self):
+        return self.stale_replies > 0 and time.monotonic() < self.stale_until
+
+
+    # Block until no abandoned command's reply can still arrive
+    def _wait_for_stale(self):
+        with self.stale_condition:
+            while self._stale_pending():
+                self.stale_condition.wait(self.stale_until - time.monotonic())
+            self.stale_replies = 0
+
+
+    # Log and send a command
+    def _send(self, command: str):
         # Log command if necessary
         if (self.recording_log):
             self.logger.log_command(command)
@@ -90,21 +184,63 @@ class DroneFlightController:
             print("\nSending command: " + command + " \n")
             
         # Send command to Drone
+        start = time.monotonic()
         self.socket.sendto(command.encode('utf-8'), self.tello_address)
+        self.last_command_time = time.monotonic()
+        self.last_sent = (command, self.last_command_time)
+        if self.tracer is not None:
+            self.tracer.sent(start, self.last_command_time)
 
-        # Update last known command
-        self.last_known_command = command
-        
+
+    # Send an urgent command (emergency, land) without waiting behind a command that is waiting for its response
+    # Returns the response, or None if it had to interrupt another command (the reply can't be told apart then)
+    def send_urgent(self, command: str):
+        while True:
+            if self.command_lock.acquire(blocking=False):
+                try:
+                    # A late reply to an abandoned command could be taken for this one's, so send without waiting on it
+                    with self.stale_condition:
+                        if self._stale_pending():
+                            self.stale_replies += 1
+                            self._send(command)
+                            return None
+                    return self.send_command(command)
+                finally:
+                    self.command_lock.release()
+            # The command in flight gives up on its response, which could now be the reply to this one. Tagged with
+            # its id under the state lock, so a holder that has just finished never passes the flag to the next command
+            with self.stale_condition:
+                if self.waiting_id is not None:
+                    self.interrupted_id = self.waiting_id
+                    self._send(command)
+                    return None
+                # The holder is waiting out a stale reply, this command's reply is owed on top of it
+                if self._stale_pending():
+                    self.stale_replies += 1
+                    self._send(command)
+                    return None
+            # The lock holder is about to send or has just finished, try again
+            time.sleep(0.001)
+
+
+    # Wait for the response to the current command
+    def _wait_for_response(self, timeout: float):
         # Checking whether the command has timed out or not (based on value in 'MAX_TIME_OUT')
-        start = time.time()
-        while not self.received_response_to_cur_cmd:  # Runs while no repsonse has been received in log
-             now = time.time()
-             difference = now - start
-             if difference > self.MAX_TIME_OUT:
-                 self.logger.log_time_out(True)
-                 if (self.printing_log):
-                    print('\nConnection timed out! \n')
-                 break
+        answered = self.response_event.wait(timeout)
+        with self.stale_condition:
+            self.command_result.interrupted = self.interrupted_id == self.waiting_id
+        if not answered:
+            if (self.recording_log):
+                self.logger.log_time_out(True)
+            if (self.printing_log):
+                print('\nConnection timed out! \n')
+            return None
+
+        # An urgent command was sent meanwhile, the response may be its reply instead of ours
+        if self.command_result.interrupted:
+            if (self.printing_log):
+                print('\nCommand interrupted by an urgent command! \n')
+            return None
              
         # Response logged if necessary by receive thread
         # Display response confirmation if necessary
@@ -112,6 +248,7 @@ class DroneFlightController:
             #print("\nReceived response: " + self.logger.get_response() + " \n")
             processed_response = self.process_response()
             print("\nReceived response: " + processed_response + " \n")
+        return self.last_known_response
 
 
     # Constantly check for drone responses
@@ -127,10 +264,17 @@ class DroneFlightController:
                 if(self.response is None):
                     self.received_response_to_cur_cmd = False
                 else:
+                    # A late reply to an abandoned command is dropped instead of answering the current one
+                    with self.stale_condition:
+                        if self._stale_pending():
+                            self.stale_replies -= 1
+                            self.stale_condition.notify_all()
+                            continue
                     # Set lastknown response
                     self.last_known_response = str(self.response)
-                    # Set received response flag to true
+                    # Set received response flag to true and wake the waiting command
                     self.received_response_to_cur_cmd = True
+                    self.response_event.set()
                     # Log response if logging
                     if(self.recording_log):
                         processed_response = self.process_response()
@@ -140,19 +284,26 @@ class DroneFlightController:
                 print('Socket error: {}'.format(exc))
 
 
-    # Capture drone video
+    # Display drone video
     def _video_thread(self):
-        # Creating stream capture object
-        cap = cv2.VideoCapture('udp://'+self.tello_ip+':11111')  
         # Runs while 'stream_state' is True
+        seq = 0
         while self.stream_state:
-            ret, self.last_frame = cap.read()
-            cv2.imshow('DJI Tello', self.last_frame)
+            # Wait for a newer preview (frames of a static scene are never published, so nothing is redrawn)
+            preview = self.preview.wait_for_frame(seq, 1.0)
+            if preview is None:
+                continue
+            frame = preview.source
+            frame.pickup_time = time.monotonic()
+            seq = preview.seq
+            self.last_frame_info = frame
+            self.last_frame = frame.image
+            cv2.imshow('DJI Tello', preview.image)
             # Video Stream is closed if escape key is pressed
             k = cv2.waitKey(1) & 0xFF
+            frame.display_time = time.monotonic()
             if k == 27:
                 break
-        cap.release()
         cv2.destroyAllWindows()
     
 
@@ -180,6 +331,14 @@ class DroneFlightController:
     
     # Close the socket
     def close(self):
+        if self.preview_server is not None:
+            self.preview_server.stop()
+        if self.preview is not None:
+            self.preview.stop()
+        if self.video_stream is not None:
+            self.video_stream.stop()
+        if self.state_stream is not None:
+            self.state_stream.close()
         self.socket.close()
 
 
@@ -192,26 +351,51 @@ class DroneFlightController:
     def takeoff(self):
         self.send_command('takeoff')
 
-    # Initiate auto-land
+    # Initiate auto-land (sent at once even while another command is waiting for its response)
     def land(self):
-        self.send_command('land')
+        self.send_urgent('land')
 
-    # Begin streaming video
-    def streamon(self):
+    # Begin streaming video (display=False only decodes and publishes frames, without a window)
+    # The window shows the shared reduced preview (preview_size, optionally grayscale) rather than full frames
+    def streamon(self, display: bool=True, preview_size: tuple=PreviewStream.PreviewStream.SIZE, grayscale: bool=False):
         self.send_command('streamon')
         self.stream_state = True
-        self.video_thread = threading.Thread(target=self._video_thread)
-        self.video_thread.daemon = True
-        self.video_thread.start()
+        self.video_stream = DroneVideoStream.DroneVideoStream(self.tello_ip, self.aligner)
+        self.video_stream.start()
+        if display:
+            self.preview = PreviewStream.PreviewStream(self.video_stream, preview_size, grayscale)
+            self.preview.start()
+            self.video_thread = threading.Thread(target=self._video_thread)
+            self.video_thread.daemon = True
+            self.video_thread.start()
+
+    # Serve the preview over HTTP (http://<host>:port/), call after streamon. Only this machine can connect unless
+    # another host ('' for every interface) is given
+    # Starts the preview without a window if streamon was called with display=False
+    def serve_preview(self, port: int=MjpegServer.MjpegServer.PORT, host: str=MjpegServer.MjpegServer.HOST):
+        if self.preview is None:
+            self.preview = PreviewStream.PreviewStream(self.video_stream)
+            self.preview.start()
+        self.preview_server = MjpegServer.MjpegServer(self.preview, host, port)
+        self.preview_server.start()
+        return self.preview_server
 
     # End streaming video
     def streamoff(self):
         self.stream_state = False
+        if self.preview_server is not None:
+            self.preview_server.stop()
+            self.preview_server = None
+        if self.preview is not None:
+            self.preview.stop()
+            self.preview = None
+        if self.video_stream is not None:
+            self.video_stream.stop()
         self.send_command('streamoff')
 
-    # Stop all motors immediately
+    # Stop all motors immediately (sent at once even while another command is waiting for its response)
     def emergency(self):
-        self.send_command('emergency')
+        self.send_urgent('emergency')
 
 
     """ DRONE MOVEMENT COMMANDS """
@@ -260,10 +444,11 @@ class DroneFlightController:
     # Set drone speed to speed cm/s (10-100)
     def set_speed(self, speed: int):
         self.send_command("speed " + str(speed))
+        self.queries.invalidate('speed?')
 
     # Send RC control via four channels. a: left/right (-100~100)  b: forward/backward (-100~100)  c: up/down (-100~100)  d: yaw (-100~100)
     def rc_control(self, a: int, b: int, c: int, d: int):
-        self.send_command("rc " + str(a) + " " + str(b) + " " + str(c) + " " + str(d))
+        self.send_command("rc " + str(a) + " " + str(b) + " " + str(c) + " " + str(d), wait=False)
 
     # Set Wifi SSID and password
     def set_wifi(self, ssid: str, password: str):
@@ -277,53 +462,43 @@ class DroneFlightController:
     """ READ COMMANDS """
     # Get current speed (cm/s)
     def get_speed(self):
-        self.send_command('speed?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('speed?'))
 
     # Get current battery percentage (0-100 %)
     def get_battery(self):
-        self.send_command('battery?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('battery?'))
 
     # Get current fly time (seconds) 
     def get_time(self):
-        self.send_command('time?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('time?'))
 
     # Get height (cm) 
     def get_height(self):
-        self.send_command('height?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('height?'))
     
     # Get temperature (℃) 
     def get_temp(self):
-        self.send_command('temp?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('temp?'))
 
     # Get IMU attitude data (pitch, roll, yaw)
     def get_attitude(self):
-        self.send_command('attitude?', True)
-        return self.attitude_response()
+        return self.attitude_response(self.queries.query('attitude?'))
 
     # Get barometer value (m)
     def get_baro(self):
-        self.send_command('baro?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('baro?'))
 
     # Get IMU angular acceleration data (0.001g)
     def get_acceleration(self):
-        self.send_command('acceleration?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('acceleration?'))
     
     # Get distance value from TOF（cm）
     def get_tof(self):
-        self.send_command('tof?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('tof?'))
 
     # Get Wi-Fi SNR
     def get_wifi(self):
-        self.send_command('wifi?', True)
-        return str(self.last_known_response)
+        return str(self.queries.query('wifi?'))
     
 
     """ PROCESS DRONE RESPONSES """
@@ -355,9 +530,9 @@ class DroneFlightController:
     def float_response(self, data: str):
         return float(self.numeric_response(data))
     
-    # Process an attitude rsponse
-    def attitude_response(self):
-        raw_att = self.last_known_response.split(';')
+    # Process an attitude rsponse (the last known response unless data is given)
+    def attitude_response(self, data: str=None):
+        raw_att = (data or self.last_known_response).split(';')
         att_data = (self.int_response(raw_att[0]), self.int_response(raw_att[1]), self.int_response(raw_att[2]))
         return att_data
     
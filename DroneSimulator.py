@@ -0,0 +1,287 @@
+###################################################
+#                 Drone Simulator                 #
+#                                                 #
+#  Description: Local stand-in for the Tello's    #
+#               command interface so control code #
+#               can be benchmarked without        #
+#               hardware. Answers SDK commands    #
+#               and '?' queries over UDP, flies a #
+#               simple kinematic model from rc    #
+#               and move commands, pushes the     #
+#               state string to port 8890, and    #
+#               stamps every rc datagram it gets. #
+###################################################
+
+# Required Imports
+import math
+import socket
+import threading
+import time
+import numpy as np
+
+class DroneSimulator:
+    """  CLASS CONSTANTS  """
+    # Address the simulator listens on (the real drone uses 192.168.10.1:8889)
+    IP = '127.0.0.1'
+    COMMAND_PORT = 9889
+
+    # Port state packets are sent to on the client's host
+    STATE_PORT = 8890
+
+    # State packets per second and physics steps per second
+    STATE_RATE = 10.0
+    PHYSICS_RATE = 50.0
+
+    # Seconds before a command is answered
+    RESPONSE_DELAY = 0.005
+
+    # Speed (cm/s) and yaw rate (deg/s) at full stick (rc 100), and how quickly the drone reaches them (seconds)
+    MAX_SPEED = 100.0
+    MAX_YAW_RATE = 100.0
+    RESPONSE_TIME = 0.3
+
+    # Height after takeoff (cm)
+    TAKEOFF_HEIGHT = 80.0
+
+    # rc datagrams kept for statistics
+    HISTORY = 65536
+
+
+    def __init__(self, ip: str=IP, port: int=COMMAND_PORT, state_port: int=STATE_PORT,
+                 response_delay: float=RESPONSE_DELAY):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((ip, port))
+        self.address = (ip, port)
+        self.state_port = state_port
+        self.response_delay = response_delay
+
+        # Flight state: position (x forward, y right, z up cm), yaw (deg clockwise), world velocity (cm/s)
+        self.position = np.zeros(3)
+        self.yaw = 0.0
+        self.velocity = np.zeros(3)
+        self.yaw_rate = 0.0
+        self.flying = False
+        self.rc = (0, 0, 0, 0)
+        self.battery = 100.0
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+
+        # Last client address (responses and state go back to it)
+        self.client = None
+
+        # rc arrival times (monotonic) and values
+        self.rc_times = np.zeros(self.HISTORY)
+        self.rc_values = np.zeros((self.HISTORY, 4), int)
+        self.rc_count = 0
+        self.stats = {'commands': 0, 'queries': 0, 'rc': 0, 'unknown': 0}
+
+        # Initialize command and physics threads
+        self.running = False
+        self.command_thread = None
+        self.physics_thread = None
+
+
+    # Start serving
+    def start(self):
+        self.running = True
+        self.command_thread = threading.Thread(target=self._command_thread)
+        self.command_thread.daemon = True
+        self.command_thread.start()
+        self.physics_thread = threading.Thread(target=self._physics_thread)
+        self.physics_thread.daemon = True
+        self.physics_thread.start()
+
+
+    # Stop serving and close the socket
+    def stop(self):
+        self.running = False
+        self.socket.close()
+
+
+    # Receive commands
+    def _command_thread(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(1024)
+            except OSError:
+                break
+            stamp = time.monotonic()
+            self.client = address
+            command = data.decode('utf-8', 'ignore').strip()
+            response = self.handle(command, stamp)
+            if response is not None:
+                self._respond(response, address)
+
+
+    # Send a response after the configured delay without holding up the next datagram
+    def _respond(self, response: str, address):
+        if self.response_delay > 0:
+            timer = threading.Timer(self.response_delay, self._send, (response, address))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._send(response, address)
+
+
+    def _send(self, response: str, address):
+        try:
+            self.socket.sendto(response.encode('utf-8'), address)
+        except OSError:
+            pass
+
+
+    # Apply one command, returns the response text (None for rc, which the drone never answers)
+    def handle(self, command: str, stamp: float):
+        parts = command.split()
+        if not parts:
+            return None
+        name, args = parts[0], parts[1:]
+
+        with self.lock:
+            if name == 'rc' and len(args) == 4:
+                self.rc = tuple(max(-100, min(100, int(v))) for v in args)
+                index = self.rc_count % self.HISTORY
+                self.rc_times[index] = stamp
+                self.rc_values[index] = self.rc
+                self.rc_count += 1
+                self.stats['rc'] += 1
+                return None
+            if name.endswith('?'):
+                self.stats['queries'] += 1
+                return self._query(name)
+
+            self.stats['commands'] += 1
+            if name == 'takeoff':
+                self.flying = True
+                self.position[2] = self.TAKEOFF_HEIGHT
+            elif name in ('land', 'emergency'):
+                self.flying = False
+                self.position[2] = 0.0
+                self.velocity[:] = 0.0
+                self.rc = (0, 0, 0, 0)
+            elif name in ('forward', 'back', 'left', 'right', 'up', 'down') and args:
+                self._move(name, float(args[0]))
+            elif name in ('cw', 'ccw') and args:
+                self.yaw = self._wrap(self.yaw + (float(args[0]) if name == 'cw' else -float(args[0])))
+            elif name not in ('command', 'streamon', 'streamoff', 'speed', 'wifi', 'bitrate', 'go', 'flip'):
+                self.stats['unknown'] += 1
+                return 'unknown command: ' + name
+        return 'ok'
+
+
+    # Move commands complete instantly in the simulator
+    def _move(self, direction: str, dist: float):
+        forward = {'forward': dist, 'back': -dist}.get(direction, 0.0)
+        right = {'right': dist, 'left': -dist}.get(direction, 0.0)
+        heading = math.radians(self.yaw)
+        self.position[0] += math.cos(heading) * forward - math.sin(heading) * right
+        self.position[1] += math.sin(heading) * forward + math.cos(heading) * right
+        self.position[2] += {'up': dist, 'down': -dist}.get(direction, 0.0)
+
+
+    # Answer a read query like the Tello does
+    def _query(self, name: str):
+        speed = float(np.linalg.norm(self.velocity))
+        answers = {'battery?': '%d' % self.battery, 'height?': '%ddm' % (self.position[2] / 10),
+                   'time?': '%ds' % (time.monotonic() - self.start_time), 'speed?': '%.1f' % speed,
+                   'temp?': '60~62C', 'attitude?': 'pitch:0;roll:0;yaw:%d;' % self.yaw, 'baro?': '%.2f' % (self.position[2] / 100),
+                   'tof?': '%dmm' % (self.position[2] * 10 + 100), 'wifi?': '90',
+                   'acceleration?': 'agx:0.00;agy:0.00;agz:-1000.00;'}
+        return answers.get(name, 'unknown command: ' + name)
+
+
+    # Integrate the kinematic model and push state packets
+    def _physics_thread(self):
+        dt = 1.0 / self.PHYSICS_RATE
+        state_every = max(1, int(round(self.PHYSICS_RATE / self.STATE_RATE)))
+        step = 0
+        deadline = time.perf_counter()
+        while self.running:
+            deadline += dt
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+            with self.lock:
+                self._step(dt)
+                state = self.state_string()
+            step += 1
+            if step % state_every == 0 and self.client is not None:
+                self._send(state, (self.client[0], self.state_port))
+
+
+    # One physics step: velocity relaxes towards the rc setpoint
+    def _step(self, dt: float):
+        self.battery = max(0.0, self.battery - dt * (0.1 if self.flying else 0.01))
+        if not self.flying:
+            return
+        lr, fb, ud, yv = self.rc
+        heading = math.radians(self.yaw)
+        forward, right = fb * self.MAX_SPEED / 100.0, lr * self.MAX_SPEED / 100.0
+        target = np.array([math.cos(heading) * forward - math.sin(heading) * right,
+                           math.sin(heading) * forward + math.cos(heading) * right,
+                           ud * self.MAX_SPEED / 100.0])
+        blend = min(1.0, dt / self.RESPONSE_TIME)
+        self.velocity += blend * (target - self.velocity)
+        self.yaw_rate += blend * (yv * self.MAX_YAW_RATE / 100.0 - self.yaw_rate)
+        self.position += self.velocity * dt
+        self.position[2] = max(self.position[2], 0.0)
+        self.yaw = self._wrap(self.yaw + self.yaw_rate * dt)
+
+
+    # Tello state string (velocities in dm/s in the body frame)
+    def state_string(self):
+        heading = math.radians(self.yaw)
+        vf = math.cos(heading) * self.velocity[0] + math.sin(heading) * self.velocity[1]
+        vr = -math.sin(heading) * self.velocity[0] + math.cos(heading) * self.velocity[1]
+        return ('pitch:0;roll:0;yaw:%d;vgx:%d;vgy:%d;vgz:%d;templ:60;temph:62;tof:%d;h:%d;bat:%d;baro:%.2f;'
+                'time:%d;agx:0.00;agy:0.00;agz:-1000.00;\r\n' % (
+                    round(self.yaw), round(vf / 10), round(vr / 10), round(-self.velocity[2] / 10),
+                    self.position[2] + 10, self.position[2], self.battery, self.position[2] / 100,
+                    time.monotonic() - self.start_time))
+
+
+    # Wrap an angle to +-180 degrees
+    def _wrap(self, angle: float):
+        return (angle + 180.0) % 360.0 - 180.0
+
+
+    # rc datagrams received as (arrival times, values)
+    def rc_log(self):
+        count = min(self.rc_count, self.HISTORY)
+        return self.rc_times[:count].copy(), self.rc_values[:count].copy()
+
+
+# Replay a gamepad recording against the simulator without a window and report the control path latency
+#   python DroneSimulator.py GamepadRecording.xbr [speed]
+if __name__ == "__main__":
+    import sys
+    import DroneFlightController
+    import rc_sender
+    import xbox_one_controller
+
+    recording = sys.argv[1] if len(sys.argv) > 1 else 'GamepadRecording.xbr'
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    simulator = DroneSimulator()
+    simulator.start()
+    drone = DroneFlightController.DroneFlightController(record_log=False, show_log=False,
+                                                        tello_ip=DroneSimulator.IP, tello_port=DroneSimulator.COMMAND_PORT)
+    replay = xbox_one_controller.GamepadReplay(recording, speed)
+    controller = xbox_one_controller.XboxController(event_source=replay)
+    sender = rc_sender.RCSender(controller, drone.rc_control)
+
+    drone.takeoff()
+    started = time.monotonic()
+    sender.start()
+    replay.done.wait()
+    sender.stop()
+    elapsed = time.monotonic() - started
+    drone.land()
+
+    stats = sender.latency_stats() or {}
+    print('Replayed %d batches in %.2f s (speed x%g)' % (len(replay.batches), elapsed, speed))
+    print('rc sent: %d  rc received: %d' % (sender.sends, simulator.stats['rc']))
+    for key, value in stats.items():
+        print('  %s: %s' % (key, value))
+    print('Final simulated position (cm): %s  yaw: %.1f' % (np.round(simulator.position, 1), simulator.yaw))
+    sender.save_histogram()
+    simulator.stop()
+    drone.close()
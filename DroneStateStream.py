@@ -0,0 +1,192 @@
+###################################################
+#               Drone State Stream                #
+#                                                 #
+#  Description: Listens for the state string the  #
+#               Tello pushes to UDP port 8890     #
+#               once it is in command mode. Each  #
+#               sample is stamped with the host   #
+#               monotonic receive time and kept   #
+#               in a fixed size ring buffer so    #
+#               it can be interpolated to the     #
+#               time of any video frame.          #
+###################################################
+
+# Required Imports
+import socket
+import threading
+import time
+import numpy as np
+
+class DroneStateStream:
+    """  CLASS CONSTANTS  """
+    # Local IP address
+    LOCAL_IP = ''
+
+    # Local port the Tello sends its state to
+    LOCAL_PORT = 8890
+
+    # State fields kept for every sample (column order of the buffer)
+    FIELDS = ('pitch', 'roll', 'yaw', 'vgx', 'vgy', 'vgz', 'templ', 'temph',
+              'tof', 'h', 'bat', 'baro', 'time', 'agx', 'agy', 'agz')
+
+    # Fields that are angles in degrees and wrap around at +-180
+    ANGLE_FIELDS = ('pitch', 'roll', 'yaw')
+
+    # Number of samples kept in the ring buffer
+    HISTORY = 1024
+
+
+    def __init__(self, local_ip: str=LOCAL_IP, local_port: int=LOCAL_PORT, history: int=HISTORY):
+
+        # Open local UDP port on 8890 for the state stream
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((local_ip, local_port))
+
+        # Preallocated ring buffer of receive times and field values
+        self.history = history
+        self.stamps = np.zeros(history)
+        self.values = np.zeros((history, len(self.FIELDS)))
+        self.count = 0
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+        # Column lookups used when parsing and interpolating
+        self.columns = {name: i for i, name in enumerate(self.FIELDS)}
+        self.angle_columns = [self.columns[name] for name in self.ANGLE_FIELDS]
+
+        # Initialize receive thread
+        self.running = True
+        self.receive_thread = threading.Thread(target=self._receive_thread)
+        self.receive_thread.daemon = True
+        self.receive_thread.start()
+
+
+    # Constantly read state packets from the drone
+    def _receive_thread(self):
+        while self.running:
+            try:
+                data, ip = self.socket.recvfrom(1024)
+                stamp = time.monotonic()
+                self.push(stamp, self.parse_state(data))
+            # Socket is closed when the stream is stopped
+            except OSError as exc:
+                if self.running:
+                    print('State socket error: {}'.format(exc))
+            # Skip malformed packets
+            except ValueError:
+                continue
+
+
+    # Turn a raw state packet into a row of field values
+    def parse_state(self, data: bytes):
+        row = np.zeros(len(self.FIELDS))
+        for item in data.decode('ascii', 'ignore').strip().split(';'):
+            key, sep, value = item.partition(':')
+            if sep and key in self.columns:
+                row[self.columns[key]] = float(value)
+        return row
+
+
+    # Add a sample to the ring buffer
+    def push(self, stamp: float, row):
+        with self.lock:
+            index = self.count % self.history
+            self.stamps[index] = stamp
+            self.values[index] = row
+            self.count += 1
+        for callback in list(self.subscribers):
+            callback(stamp, row)
+
+
+    # Register a function to be called with (stamp, row) for every sample (on the receive thread)
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+
+    # Remove a previously registered sample callback
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+
+    # Return copies of the buffered stamps and values, oldest first
+    def samples(self):
+        with self.lock:
+            if self.count <= self.history:
+                return self.stamps[:self.count].copy(), self.values[:self.count].copy()
+            start = self.count % self.history
+            stamps = np.concatenate((self.stamps[start:], self.stamps[:start]))
+            values = np.concatenate((self.values[start:], self.values[:start]))
+            return stamps, values
+
+
+    # Return the most recent sample as (stamp, dict) or None
+    def latest(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            index = (self.count - 1) % self.history
+            return self.stamps[index], self.to_dict(self.values[index])
+
+
+    # Interpolate the buffered samples to the given times
+    # Returns (values, ages) where ages is the distance to the nearest real sample
+    # Times outside the buffered range hold the first/last sample
+    def interpolate(self, times):
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        stamps, values = self.samples()
+        if len(stamps) == 0:
+            return None, None
+
+        # Find the pair of samples bracketing each time
+        upper = np.clip(np.searchsorted(stamps, times), 1, max(len(stamps) - 1, 1))
+        lower = upper - 1
+        if len(stamps) == 1:
+            upper = lower
+        span = stamps[upper] - stamps[lower]
+        weight = np.where(span > 0, (times - stamps[lower]) / np.where(span > 0, span, 1.0), 0.0)
+        weight = np.clip(weight, 0.0, 1.0)[:, None]
+
+        # Linear blend, taking the short way around for angles
+        delta = values[upper] - values[lower]
+        angles = self.angle_columns
+        delta[:, angles] = (delta[:, angles] + 180.0) % 360.0 - 180.0
+        result = values[lower] + weight * delta
+        result[:, angles] = (result[:, angles] + 180.0) % 360.0 - 180.0
+
+        ages = np.minimum(np.abs(times - stamps[lower]), np.abs(times - stamps[upper]))
+        return result, ages
+
+
+    # Interpolate the state to a single time as a dict of fields
+    def sample_at(self, stamp: float):
+        result, ages = self.interpolate(stamp)
+        if result is None:
+            return None
+        return self.to_dict(result[0])
+
+
+    # Save the buffered samples to a csv file (stamp followed by the fields)
+    def save_samples(self, filename: str='StateLog.csv'):
+        stamps, values = self.samples()
+        np.savetxt(filename, np.column_stack((stamps, values)), delimiter=',', fmt='%.6f',
+                   header=','.join(('stamp',) + self.FIELDS), comments='')
+
+
+    # Load samples saved with save_samples, returns (stamps, values)
+    @staticmethod
+    def load_samples(filename: str):
+        data = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+        return data[:, 0], data[:, 1:]
+
+
+    # Convert a row of values to a dict of fields
+    def to_dict(self, row):
+        return {name: float(row[i]) for i, name in enumerate(self.FIELDS)}
+
+
+    # Stop listening and close the socket
+    def close(self):
+        self.running = False
+        self.socket.close()
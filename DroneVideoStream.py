@@ -0,0 +1,136 @@
+###################################################
+#               Drone Video Stream                #
+#                                                 #
+#  Description: Reads the Tello's H.264 video     #
+#               stream on its own thread and      #
+#               publishes every decoded frame     #
+#               with a sequence number and the    #
+#               host monotonic times grab()       #
+#               (packet read and decode) and      #
+#               retrieve() (BGR conversion)       #
+#               returned. Consumers either wait   #
+#               on the latest frame or subscribe  #
+#               to be called with each new frame. #
+###################################################
+
+# Required Imports
+import threading
+import time
+import cv2
+
+class DroneFrame:
+
+    def __init__(self, seq: int, image, grab_time: float, convert_time: float):
+        # Sequence number of the frame since the stream started
+        self.seq = seq
+        # Decoded BGR image
+        self.image = image
+        # Host monotonic time grab() returned. With the FFmpeg backend grab() reads and decodes the packets, so this
+        # is after decode; OpenCV gives no time for the packets alone
+        self.grab_time = grab_time
+        # Host monotonic time retrieve() finished converting the decoded picture to BGR
+        self.convert_time = convert_time
+        # Host monotonic times a display consumer picked up / finished showing the frame
+        self.pickup_time = None
+        self.display_time = None
+        # Rectified image (filled by CameraUndistorter unless it runs in sparse mode)
+        self.rectified = None
+        # Interpolated drone state at grab_time (filled by FrameTelemetryAligner)
+        self.state = None
+        # Seconds between grab_time and the nearest real state sample
+        self.state_age = None
+
+
+class DroneVideoStream:
+    """  CLASS CONSTANTS  """
+    # Tello video port
+    VIDEO_PORT = 11111
+
+
+    def __init__(self, tello_ip: str, aligner=None):
+
+        # Stream address of the drone
+        self.address = 'udp://' + tello_ip + ':' + str(self.VIDEO_PORT)
+
+        # Optional FrameTelemetryAligner attached to each frame
+        self.aligner = aligner
+
+        # Latest frame and the condition consumers wait on
+        self.frame = None
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.subscribers = []
+
+        # Initialize capture thread
+        self.running = False
+        self.capture_thread = None
+
+
+    # Start capturing frames
+    def start(self):
+        self.running = True
+        self.capture_thread = threading.Thread(target=self._capture_thread)
+        self.capture_thread.daemon = True
+        self.capture_thread.start()
+
+
+    # Stop capturing frames
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+
+
+    # Read and publish frames while the stream is running
+    def _capture_thread(self):
+        cap = cv2.VideoCapture(self.address)
+        while self.running:
+            # grab() reads and decodes the frame's packets, retrieve() only converts the picture to BGR
+            if not cap.grab():
+                continue
+            grab_time = time.monotonic()
+            ret, image = cap.retrieve()
+            if not ret:
+                continue
+            convert_time = time.monotonic()
+            self.publish(image, grab_time, convert_time)
+        cap.release()
+
+
+    # Stamp a converted image, align it with the state stream and hand it to consumers
+    def publish(self, image, grab_time: float, convert_time: float):
+        frame = DroneFrame(self.seq + 1, image, grab_time, convert_time)
+        if self.aligner is not None:
+            self.aligner.align(frame)
+        with self.condition:
+            self.seq = frame.seq
+            self.frame = frame
+            self.condition.notify_all()
+        for callback in list(self.subscribers):
+            callback(frame)
+        return frame
+
+
+    # Register a function to be called with every new frame (on the capture thread)
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+
+    # Remove a previously registered frame callback
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+
+    # Return the newest frame
+    def latest(self):
+        return self.frame
+
+
+    # Block until a frame newer than last_seq is available (or timeout) and return it
+    def wait_for_frame(self, last_seq: int=0, timeout: float=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_seq or not self.running, timeout)
+            if self.seq > last_seq:
+                return self.frame
+            return None
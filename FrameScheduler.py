@@ -0,0 +1,152 @@
+###################################################
+#                 Frame Scheduler                 #
+#                                                 #
+#  Description: Sits between the video stream and #
+#               a frame consumer such as the      #
+#               visual odometry. Measures how     #
+#               long each frame takes to process  #
+#               and decimates or drops frames to  #
+#               stay within a CPU and latency     #
+#               budget, but never skips frames    #
+#               the consumer asks for (keyframes, #
+#               initialization) or frames during  #
+#               and just after fast motion.       #
+###################################################
+
+# Required Imports
+import math
+import threading
+import time
+
+class FrameScheduler:
+    """  CLASS CONSTANTS  """
+    # Fraction of one CPU the consumer may use
+    CPU_BUDGET = 0.5
+
+    # Frames older than this (seconds since grabbed) are dropped unless forced
+    LATENCY_BUDGET = 0.15
+
+    # Largest decimation factor (process one frame out of this many)
+    MAX_DECIMATION = 6
+
+    # Yaw rate (deg/s) and horizontal speed (state stream units) treated as fast motion
+    FAST_YAW_RATE = 30.0
+    FAST_SPEED = 5.0
+
+    # Frames kept after fast motion has stopped
+    FAST_HOLD_FRAMES = 10
+
+    # Smoothing factor for the processing time / frame interval averages
+    SMOOTHING = 0.1
+
+
+    def __init__(self, video_stream, consumer, cpu_budget: float=CPU_BUDGET, latency_budget: float=LATENCY_BUDGET):
+        self.video_stream = video_stream
+
+        # Consumer must have process_frame(frame); needs_frames() is optional
+        self.consumer = consumer
+        self.cpu_budget = cpu_budget
+        self.latency_budget = latency_budget
+
+        # Running estimates
+        self.process_time = None
+        self.frame_interval = 1.0 / 30.0
+        self.decimation = 1
+        self.hold = 0
+        self.last_seen = None
+
+        # Counters
+        self.stats = {'seen': 0, 'processed': 0, 'forced': 0, 'skipped_busy': 0,
+                      'skipped_decimation': 0, 'skipped_stale': 0}
+
+        # Initialize scheduler thread
+        self.running = False
+        self.scheduler_thread = None
+
+
+    # Start feeding the consumer
+    def start(self):
+        self.running = True
+        self.scheduler_thread = threading.Thread(target=self._scheduler_thread)
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
+
+
+    # Stop feeding the consumer
+    def stop(self):
+        self.running = False
+
+
+    # Take the newest frame each time, frames that arrived while busy are counted as skipped
+    def _scheduler_thread(self):
+        seq = 0
+        while self.running:
+            frame = self.video_stream.wait_for_frame(seq, 1.0)
+            if frame is None:
+                continue
+            if seq > 0 and frame.seq > seq + 1:
+                self.stats['skipped_busy'] += frame.seq - seq - 1
+            seq = frame.seq
+            self.offer(frame)
+
+
+    # Decide whether a frame is processed, returns True if it was
+    def offer(self, frame):
+        self.stats['seen'] += 1
+        forced = self._fast_motion(frame) or self._consumer_needs_frames()
+        self.last_seen = frame
+
+        if not forced:
+            if time.monotonic() - frame.grab_time > self.latency_budget:
+                self.stats['skipped_stale'] += 1
+                return False
+            if self.stats['seen'] % self.decimation != 0:
+                self.stats['skipped_decimation'] += 1
+                return False
+        else:
+            self.stats['forced'] += 1
+
+        start = time.perf_counter()
+        self.consumer.process_frame(frame)
+        self._update_budget(time.perf_counter() - start)
+        self.stats['processed'] += 1
+        return True
+
+
+    # Ask the consumer whether it needs every frame right now
+    def _consumer_needs_frames(self):
+        needs_frames = getattr(self.consumer, 'needs_frames', None)
+        return needs_frames is not None and needs_frames()
+
+
+    # Use the aligned state as a gyro / velocity hint for fast motion
+    def _fast_motion(self, frame):
+        previous = self.last_seen
+        fast = False
+        if previous is not None:
+            dt = frame.grab_time - previous.grab_time
+            if dt > 0 and frame.seq > previous.seq:
+                # Camera frame interval, not counting frames skipped while busy
+                interval = dt / (frame.seq - previous.seq)
+                self.frame_interval += self.SMOOTHING * (interval - self.frame_interval)
+            if frame.state is not None and previous.state is not None and dt > 0:
+                yaw_step = (frame.state['yaw'] - previous.state['yaw'] + 180.0) % 360.0 - 180.0
+                speed = (frame.state['vgx'] ** 2 + frame.state['vgy'] ** 2) ** 0.5
+                fast = abs(yaw_step) / dt > self.FAST_YAW_RATE or speed > self.FAST_SPEED
+
+        if fast:
+            self.hold = self.FAST_HOLD_FRAMES
+        elif self.hold > 0:
+            self.hold -= 1
+            fast = True
+        return fast
+
+
+    # Pick the decimation factor that keeps the average load under the CPU budget
+    def _update_budget(self, elapsed: float):
+        if self.process_time is None:
+            self.process_time = elapsed
+        else:
+            self.process_time += self.SMOOTHING * (elapsed - self.process_time)
+        load = self.process_time / (self.cpu_budget * self.frame_interval)
+        self.decimation = max(1, min(self.MAX_DECIMATION, math.ceil(load)))
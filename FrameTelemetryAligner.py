@@ -0,0 +1,53 @@
+###################################################
+#             Frame Telemetry Aligner             #
+#                                                 #
+#  Description: Attaches the drone state to each  #
+#               video frame. The state stream is  #
+#               interpolated to the frame's grab  #
+#               time so visual odometry and the   #
+#               controllers get attitude,         #
+#               velocity, height and TOF readings #
+#               that match the image.             #
+###################################################
+
+class FrameTelemetryAligner:
+    """  CLASS CONSTANTS  """
+    # State fields attached to each frame
+    FIELDS = ('pitch', 'roll', 'yaw', 'vgx', 'vgy', 'vgz', 'h', 'tof', 'agx', 'agy', 'agz')
+
+    # Frame time offset (seconds) applied before looking up the state
+    TIME_OFFSET = 0.0
+
+
+    def __init__(self, state_stream, fields=FIELDS, time_offset: float=TIME_OFFSET):
+        self.state_stream = state_stream
+        self.fields = fields
+        self.time_offset = time_offset
+
+
+    # Fill in the state of a single frame, returns the frame
+    def align(self, frame):
+        result, ages = self.state_stream.interpolate(frame.grab_time + self.time_offset)
+        if result is not None:
+            frame.state = self._select(result[0])
+            frame.state_age = float(ages[0])
+        return frame
+
+
+    # Fill in the state of several frames with one interpolation
+    def align_all(self, frames):
+        if len(frames) == 0:
+            return frames
+        times = [frame.grab_time + self.time_offset for frame in frames]
+        result, ages = self.state_stream.interpolate(times)
+        if result is not None:
+            for i, frame in enumerate(frames):
+                frame.state = self._select(result[i])
+                frame.state_age = float(ages[i])
+        return frames
+
+
+    # Keep only the requested fields of an interpolated row
+    def _select(self, row):
+        columns = self.state_stream.columns
+        return {name: float(row[columns[name]]) for name in self.fields}
@@ -11,18 +11,34 @@ Description:
 
 import time
 import cv2
-import threading
-from djitellopy import tello
+import numpy as np
+from collections import deque
 from tkinter import *
 from PIL import Image, ImageTk
-from xbox_one_controller import XboxController
+from control_core import DroneControlCore
 
 
 class GameControllerGUI:
-    def __init__(self):
+    # Size (width, height) the video is displayed at
+    DISPLAY_SIZE = (720, 480)
+
+    # Most video redraws per second
+    DISPLAY_FPS = 30.0
+
+    # Telemetry HUD: redraws per second, size (width, height), top left corner on the video and text line spacing
+    HUD_RATE = 4.0
+    HUD_SIZE = (230, 84)
+    HUD_ORIGIN = (10, 10)
+    HUD_LINE = 24
+
+    def __init__(self, core=None):
 
         ### **** NEW **** ###
-        self.xbox_controller = XboxController()  # Initialize the xbox controller object
+        # The control core flies the drone (connection, joystick RC, takeoff/land, telemetry) on its own threads,
+        # this window only displays its video and telemetry
+        self.core = core if core is not None else DroneControlCore(preview_size=self.DISPLAY_SIZE)
+        self.drone = self.core.drone
+        self.xbox_controller = self.core.xbox_controller
         ### ************* ###
 
         # Prepare our GUI window
@@ -30,81 +46,70 @@ class GameControllerGUI:
         self.root.title("Tello Drone Control GUI with Xbox Game Controller")  # Add a title to the window
         self.root.minsize(800, 600)  # Set the minimum gui size
 
-        # Initialize the video stream capture label
+        # Initialize the video stream capture label with the one PhotoImage every frame is pasted into
         self.cap_lbl = Label(self.root)
-
-        # Prepare our drone object
-        self.drone = tello.Tello()  # Initialize the drone
-        self.drone.connect()  # Connect to the drone
-        self.drone.streamon()  # Turn on the drones video stream
+        self.photo = ImageTk.PhotoImage('RGB', self.DISPLAY_SIZE)
+        self.cap_lbl.configure(image=self.photo)
+
+        # Preallocated buffer previews are copied into, and change tracking for the rendered frame
+        w, h = self.DISPLAY_SIZE
+        self.display_buffer = np.empty((h, w, 3), np.uint8)
+        self.last_image = None
+        self.frame_seq = 0
+        self.rendered_seq = 0
+        self.render_times = deque(maxlen=600)  # seconds spent rendering each of the latest frames
+        self.skipped_renders = 0
 
         # Initialize variables involving drone functionalities
-        self.frame = self.drone.get_frame_read()  # variable to get the video frames from the drone
-
-        ### **** NEW **** ###
-        # this is to store the joystick rc values as they are updated in realtime.
-        self.rc_controls = [0, 0, 0, 0]  # the initial movement velocity values for lr, fb, ud, and yaw motions
-        ### ************* ###
+        self.preview = self.core.preview  # shared display-size preview of the drones video
 
-    def takeoff_land(self):
-        """Set the command for the takeoff/land button depending on the drones flying state"""
-        if self.drone.is_flying:
-            threading.Thread(target=lambda: self.drone.land()).start()
-        else:
-            threading.Thread(target=lambda: self.drone.takeoff()).start()
+        # HUD patch the telemetry text is drawn into, and the mask of its text pixels, redrawn at HUD_RATE
+        hud_w, hud_h = self.HUD_SIZE
+        self.hud_patch = np.zeros((hud_h, hud_w, 3), np.uint8)
+        self.hud_mask = np.zeros((hud_h, hud_w, 1), bool)
+        self.hud_time = 0.0
 
     ### **** NEW METHOD **** ###
-    def update_joystick(self):
-        """Method to update joystick values."""
-        try:
-            # Read current joystick values using the XboxController class
-            joystick_values = self.xbox_controller.read()
-
-            # Extract individual joystick values for easier reference
-            left_joystick_x = joystick_values[0]
-            left_joystick_y = joystick_values[1]
-            right_joystick_x = joystick_values[2]
-            right_joystick_y = joystick_values[3]
-            start_button = joystick_values[14]
-
-            # Check if the start button is pressed
-            if start_button:
-                self.takeoff_land()  # Call the takeoff/land method if the start button is pressed
-                time.sleep(0.15)  # sleep long enough to register button as not pressed so no false send of land command.
-
-            # Map joystick values to specific RC control channels
-            self.rc_controls[0] = right_joystick_x  # lr RC value
-            self.rc_controls[1] = right_joystick_y  # fb RC value
-            self.rc_controls[2] = left_joystick_y  # ud RC value
-            self.rc_controls[3] = left_joystick_x  # yaw RC value
-
-            # If rc control values aren't zero then send them to the drone using the send_rc_control(lr, fb, ud, yv) command.
-            if self.rc_controls != [0, 0, 0, 0]:
-                self.drone.send_rc_control(self.rc_controls[0], self.rc_controls[1], self.rc_controls[2], self.rc_controls[3])
-
-            # and if not zero then send the equivalent command for the drone to hover in place
-            else:
-                self.drone.send_rc_control(0, 0, 0, 0)
-            # Call the update_joystick method again after a delay (50 milliseconds)
-            self.root.after(50, self.update_joystick)
-
-        # Handle exceptions that may occur during joystick update
-        except Exception as joystickUpdateException:
-            print(f"Exception occurred when updating joystick values.\nJoystickUpdateException: {joystickUpdateException}")
+    def update_hud(self, now):
+        """Redraw the telemetry HUD patch from the core's telemetry snapshot if it is older than 1 / HUD_RATE.
+           Returns whether it was redrawn."""
+        if now - self.hud_time < 1.0 / self.HUD_RATE:
+            return False
+        self.hud_time = now
+        telemetry = self.core.telemetry
+        battery, height, latency = telemetry['battery'], telemetry['height'], telemetry['latency_ms']
+        lines = [f"BAT {'--' if battery is None else battery}%   H {'--' if height is None else height} cm",
+                 "RC {:4d} {:4d} {:4d} {:4d}".format(*telemetry['rc']),
+                 f"LAT {'--' if latency is None else format(latency, '.1f')} ms"]
+
+        self.hud_patch.fill(0)
+        for i, line in enumerate(lines):
+            cv2.putText(self.hud_patch, line, (6, self.HUD_LINE * (i + 1) - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
+                        (255, 255, 255), 1, cv2.LINE_AA)
+        self.hud_mask = self.hud_patch.any(axis=2, keepdims=True)
+        return True
+
+    def overlay_hud(self, image):
+        """Blend the HUD patch into the image in place: darken the area behind it and copy the text pixels over."""
+        x, y = self.HUD_ORIGIN
+        hud_w, hud_h = self.HUD_SIZE
+        roi = image[y:y + hud_h, x:x + hud_w]
+        roi >>= 1
+        np.copyto(roi, self.hud_patch, where=self.hud_mask)
     ### ************* ###
 
     def run_app(self):
         """Method to run the application."""
         try:
-            # Pack the video stream label to the GUI window
-            self.cap_lbl.pack(anchor="center")
+            # Pack the video stream label to the GUI window (once, the label itself never moves)
+            self.cap_lbl.pack(anchor="center", pady=15)
 
             # Call the video_stream method to start displaying video
             self.video_stream()
 
             ### **** NEW **** ###
-            # Call the update_joystick method to start the joystick control
-            self.update_joystick()
+            # Start the joystick control, it keeps running at full rate however slowly the window updates
+            self.core.start()
             ### ************* ###
 
             # Start the tkinter main loop
@@ -116,47 +121,65 @@ class GameControllerGUI:
             self.cleanup()
 
     def video_stream(self):
-        """Method to display video stream."""
+        """Method to display video stream. Only new previews (the preview stream skips frames of a static scene)
+           or a refreshed HUD are rendered, and the redraw rate is capped at DISPLAY_FPS."""
         try:
-            # Define the height and width to resize the current frame to
-            h = 480
-            w = 720
-
-            # Read a frame from our drone
-            frame = self.frame.frame
-
-            frame = cv2.resize(frame, (w, h))
-
-            # Convert the current frame to the rgb colorspace
-            cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-
-            # Convert this to a Pillow Image object
-            img = Image.fromarray(cv2image)
-
-            # Convert this then to a Tkinter compatible PhotoImage object
-            imgtk = ImageTk.PhotoImage(image=img)
-
-            # Place the image label at the center of the window
-            self.cap_lbl.pack(anchor="center", pady=15)
-
-            # Set it to the photo image
-            self.cap_lbl.imgtk = imgtk
-
-            # Configure the photo image as the displayed image
-            self.cap_lbl.configure(image=imgtk)
+            start = time.perf_counter()
+
+            # Read the newest preview, already reduced to the display size by the control core
+            preview = self.preview.latest()
+            if preview is not self.last_image:
+                self.last_image = preview
+                self.frame_seq += 1
+
+            hud_changed = self.update_hud(start)
+            if preview is not None and (self.frame_seq != self.rendered_seq or hud_changed):
+                # Copy into the preallocated buffer and draw the telemetry HUD over it
+                resized = self.display_buffer
+                if preview.image.ndim == 2:
+                    cv2.cvtColor(preview.image, cv2.COLOR_GRAY2BGR, dst=resized)
+                else:
+                    np.copyto(resized, preview.image)
+                self.overlay_hud(resized)
+
+                # Wrap the buffer as a Pillow image; the 'BGR' raw mode does the color swap while copying
+                img = Image.frombuffer('RGB', self.DISPLAY_SIZE, resized, 'raw', 'BGR', 0, 1)
+
+                # Paste into the existing PhotoImage instead of building a new one
+                self.photo.paste(img)
+                self.rendered_seq = self.frame_seq
+                self.render_times.append(time.perf_counter() - start)
+            else:
+                self.skipped_renders += 1
 
-            # Update the video stream label with the current frame
-            # by recursively calling the method itself with a delay.
-            self.cap_lbl.after(5, self.video_stream)
+            # Update the video stream label again after the rest of the frame interval
+            delay = 1.0 / self.DISPLAY_FPS - (time.perf_counter() - start)
+            self.cap_lbl.after(max(1, int(delay * 1000)), self.video_stream)
         except Exception as videoStreamException:
             print(f"Exception occurred when updating the video stream.\nvideoStreamException: {videoStreamException}")
 
+    def render_stats(self):
+        """Return the number of rendered frames, skipped redraws and render time percentiles in milliseconds."""
+        if not self.render_times:
+            return None
+        times = np.array(self.render_times) * 1000.0
+        return {'rendered': self.rendered_seq, 'skipped': self.skipped_renders,
+                'render_p50': float(np.percentile(times, 50)), 'render_p99': float(np.percentile(times, 99))}
+
     def cleanup(self) -> None:
         """Method for cleaning up resources."""
         try:
+            # Report how much the video display cost
+            stats = self.render_stats()
+            if stats is not None:
+                print(f"Rendered {stats['rendered']} frames, skipped {stats['skipped']} unchanged redraws, "
+                      f"render time p50 {stats['render_p50']:.2f} ms / p99 {stats['render_p99']:.2f} ms")
+
             # Release any resources
             print("Cleaning up resources...")
-            self.drone.end()
+
+            # Stop the control core (it saves the input to datagram latency histograms) and close the drone
+            self.core.end()
             self.root.quit()  # Quit the Tkinter main loop
             exit()
         except Exception as e:
@@ -0,0 +1,174 @@
+###################################################
+#                Impairment Proxy                 #
+#                                                 #
+#  Description: UDP proxy that sits between the   #
+#               flight controller and the drone   #
+#               (or DroneSimulator) and makes the #
+#               link behave like noisy Wi-Fi:     #
+#               random loss, delay drawn from a   #
+#               latency distribution, duplicated  #
+#               and reordered datagrams, applied  #
+#               separately to each direction.     #
+#               Counts what it did to every       #
+#               datagram.                         #
+###################################################
+
+# Required Imports
+import heapq
+import itertools
+import socket
+import threading
+import time
+import numpy as np
+
+class ImpairmentProxy:
+    """  CLASS CONSTANTS  """
+    # Address the controller sends to (point DroneFlightController's tello_ip / tello_port here)
+    IP = '127.0.0.1'
+    PORT = 9890
+
+    # Extra delay (seconds) of a reordered datagram, so datagrams sent after it overtake it
+    REORDER_DELAY = 0.05
+
+    # Link profiles: loss / duplicate / reorder probabilities and the one-way latency distribution
+    #   latency is (kind, a, b) in seconds: ('constant', delay, 0), ('uniform', low, high),
+    #   ('normal', mean, std) or ('exponential', minimum, mean extra)
+    PROFILES = {
+        'clean': {'loss': 0.0, 'duplicate': 0.0, 'reorder': 0.0, 'latency': ('constant', 0.0, 0.0)},
+        'office': {'loss': 0.01, 'duplicate': 0.0, 'reorder': 0.0, 'latency': ('normal', 0.005, 0.002)},
+        'warehouse': {'loss': 0.05, 'duplicate': 0.01, 'reorder': 0.02, 'latency': ('exponential', 0.01, 0.03)},
+        'congested': {'loss': 0.15, 'duplicate': 0.03, 'reorder': 0.05, 'latency': ('normal', 0.08, 0.05)},
+    }
+
+
+    def __init__(self, target: tuple, ip: str=IP, port: int=PORT, profile: str='clean', seed: int=None):
+        # Controller side socket, and the socket the proxy talks to the drone from
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((ip, port))
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstream.bind((ip, 0))
+        self.address = (ip, port)
+        self.target = target
+
+        # Last controller address (responses are sent back to it)
+        self.client = None
+
+        # Random source, seeded for repeatable runs
+        self.random = np.random.default_rng(seed)
+        self.configure(**self.PROFILES[profile])
+
+        # Datagrams waiting for their delivery time: (due, order, socket, data, address, direction)
+        self.pending = []
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+
+        # Counters per direction ('up' controller -> drone, 'down' drone -> controller)
+        self.stats = {direction: {'received': 0, 'dropped': 0, 'duplicated': 0, 'reordered': 0, 'delivered': 0}
+                      for direction in ('up', 'down')}
+
+        # Initialize receive and delivery threads
+        self.running = False
+        self.threads = []
+
+
+    # Change the impairments (probabilities 0-1, latency as in PROFILES)
+    def configure(self, loss: float=0.0, duplicate: float=0.0, reorder: float=0.0, latency: tuple=('constant', 0.0, 0.0)):
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.latency = latency
+
+
+    # Start proxying
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self._receive_thread, args=(self.socket, 'up')),
+                        threading.Thread(target=self._receive_thread, args=(self.upstream, 'down')),
+                        threading.Thread(target=self._deliver_thread)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+
+    # Stop proxying and close the sockets
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        self.socket.close()
+        self.upstream.close()
+
+
+    # Zero the counters
+    def reset_stats(self):
+        for counts in self.stats.values():
+            for key in counts:
+                counts[key] = 0
+
+
+    # One-way delay for a datagram (seconds)
+    def sample_latency(self):
+        kind, a, b = self.latency
+        if kind == 'uniform':
+            return float(self.random.uniform(a, b))
+        if kind == 'normal':
+            return max(0.0, float(self.random.normal(a, b)))
+        if kind == 'exponential':
+            return a + float(self.random.exponential(b))
+        return a
+
+
+    # Receive datagrams from one side and schedule them for the other
+    def _receive_thread(self, sock, direction: str):
+        while self.running:
+            try:
+                data, address = sock.recvfrom(2048)
+            except OSError:
+                break
+            if direction == 'up':
+                self.client = address
+                self.impair(data, self.upstream, self.target, direction)
+            elif self.client is not None:
+                self.impair(data, self.socket, self.client, direction)
+
+
+    # Apply loss, duplication, reordering and delay to one datagram
+    def impair(self, data: bytes, sock, address, direction: str):
+        stats = self.stats[direction]
+        now = time.monotonic()
+        # Both receive threads draw from the one random source, so draw under the lock
+        with self.condition:
+            stats['received'] += 1
+            if self.random.random() < self.loss:
+                stats['dropped'] += 1
+                return
+            copies = 1
+            if self.random.random() < self.duplicate:
+                copies = 2
+                stats['duplicated'] += 1
+            for _ in range(copies):
+                delay = self.sample_latency()
+                if self.random.random() < self.reorder:
+                    delay += self.REORDER_DELAY
+                    stats['reordered'] += 1
+                heapq.heappush(self.pending, (now + delay, next(self.order), sock, data, address, direction))
+            self.condition.notify()
+
+
+    # Send datagrams when their delay has passed
+    def _deliver_thread(self):
+        while self.running:
+            with self.condition:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                wait = self.pending[0][0] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                due, order, sock, data, address, direction = heapq.heappop(self.pending)
+            try:
+                sock.sendto(data, address)
+                self.stats[direction]['delivered'] += 1
+            except OSError:
+                pass
@@ -0,0 +1,110 @@
+###################################################
+#               Keepalive Scheduler               #
+#                                                 #
+#  Description: The Tello lands on its own after  #
+#               15 seconds without a command.     #
+#               This sends a lightweight command  #
+#               only once the channel has been    #
+#               idle for a while, and only if it  #
+#               can take the command lock without #
+#               waiting, so it never delays or    #
+#               steals the response of a user     #
+#               command. A keepalive that isn't   #
+#               answered is retried right away    #
+#               and its late reply is discarded.  #
+#               Records how often it stepped in   #
+#               and what it cost.                 #
+###################################################
+
+# Required Imports
+import threading
+import time
+
+class KeepaliveScheduler:
+    """  CLASS CONSTANTS  """
+    # Seconds of silence before a keepalive is sent (the drone lands after 15)
+    IDLE_TIME = 8.0
+
+    # Command sent to keep the link alive (answered quickly, changes nothing)
+    KEEPALIVE_COMMAND = 'command'
+
+    # Seconds to wait for the keepalive's response before giving the channel back (the drone answers in milliseconds)
+    RESPONSE_TIMEOUT = 0.5
+
+    # Seconds after a missed response during which a late reply is still dropped instead of answering the next
+    # command (replies carry no id). Commands sent meanwhile wait for this to pass
+    STALE_TIME = 1.0
+
+    # Seconds to wait before trying again when the channel was busy
+    RETRY_TIME = 0.2
+
+
+    def __init__(self, drone, idle_time: float=IDLE_TIME, command: str=KEEPALIVE_COMMAND):
+        self.drone = drone
+        self.idle_time = idle_time
+        self.command = command
+
+        # Overhead counters: keepalives sent, attempts skipped because a command was in flight,
+        # keepalives without a response, and time spent holding the channel / running this thread
+        self.stats = {'sent': 0, 'busy': 0, 'timeouts': 0, 'channel_time': 0.0, 'max_channel_time': 0.0,
+                      'cpu_time': 0.0}
+
+        # Set while the last keepalive went unanswered, so it is retried without waiting for idle_time again
+        self.missed = False
+
+        # Initialize keepalive thread
+        self.running = False
+        self.wake = threading.Event()
+        self.keepalive_thread = None
+
+
+    # Start watching the channel
+    def start(self):
+        self.running = True
+        self.wake.clear()
+        self.keepalive_thread = threading.Thread(target=self._keepalive_thread)
+        self.keepalive_thread.daemon = True
+        self.keepalive_thread.start()
+
+
+    # Stop watching the channel
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+
+    # Sleep until the channel would have been idle for idle_time, then try to send
+    def _keepalive_thread(self):
+        cpu_start = time.thread_time()
+        while self.running:
+            last = self.drone.last_command_time
+            idle = 0.0 if last is None else time.monotonic() - last
+            if idle < self.idle_time and not self.missed:
+                self.wake.wait(self.idle_time - idle)
+                continue
+            if not self.send_keepalive():
+                self.wake.wait(self.RETRY_TIME)
+            self.stats['cpu_time'] = time.thread_time() - cpu_start
+
+
+    # Send one keepalive if no other command is outstanding, returns False if the channel was busy
+    def send_keepalive(self):
+        if not self.drone.command_lock.acquire(blocking=False):
+            self.stats['busy'] += 1
+            return False
+        try:
+            start = time.perf_counter()
+            response = self.drone.send_command(self.command, timeout=self.RESPONSE_TIMEOUT)
+            elapsed = time.perf_counter() - start
+            if response is None:
+                self.drone.mark_stale(self.STALE_TIME)
+        finally:
+            self.drone.command_lock.release()
+
+        self.stats['sent'] += 1
+        self.missed = response is None
+        if self.missed:
+            self.stats['timeouts'] += 1
+        self.stats['channel_time'] += elapsed
+        self.stats['max_channel_time'] = max(self.stats['max_channel_time'], elapsed)
+        return True
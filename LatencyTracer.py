@@ -0,0 +1,208 @@
+###################################################
+#                 Latency Tracer                  #
+#                                                 #
+#  Description: Span tracing for the whole        #
+#               pipeline, from a decoded frame's  #
+#               BGR conversion through the visual #
+#               odometry stages and the position  #
+#               controller to the sendto of the   #
+#               rc command it produced. Spans use #
+#               monotonic time, are tagged with   #
+#               the frame sequence number and go  #
+#               into preallocated per-thread      #
+#               buffers, so recording takes no    #
+#               lock. Prints p50/p99 per stage    #
+#               and exports Chrome trace JSON     #
+#               (chrome://tracing, Perfetto).     #
+###################################################
+
+# Required Imports
+import json
+import threading
+import time
+import numpy as np
+
+class SpanBuffer:
+
+    def __init__(self, capacity: int, thread_name: str, thread_index: int):
+        self.thread_name = thread_name
+        self.thread_index = thread_index
+        # Ring of spans: stage index, trace id (frame seq), start and end (monotonic seconds)
+        self.stage = np.zeros(capacity, np.int32)
+        self.trace = np.zeros(capacity, np.int64)
+        self.start = np.zeros(capacity)
+        self.end = np.zeros(capacity)
+        self.count = 0
+
+    # Append one span, overwriting the oldest once full
+    def append(self, stage: int, trace_id: int, start: float, end: float):
+        index = self.count % len(self.stage)
+        self.stage[index] = stage
+        self.trace[index] = trace_id
+        self.start[index] = start
+        self.end[index] = end
+        self.count += 1
+
+    # Copy of the valid part of the ring as (stage, trace, start, end, thread index)
+    def spans(self):
+        count = min(self.count, len(self.stage))
+        return (self.stage[:count].copy(), self.trace[:count].copy(), self.start[:count].copy(),
+                self.end[:count].copy(), np.full(count, self.thread_index))
+
+
+class LatencyTracer:
+    """  CLASS CONSTANTS  """
+    # Spans kept per thread
+    CAPACITY = 65536
+
+    # Trace id used for spans that belong to no frame
+    NO_TRACE = -1
+
+    # Name of the span from frame arrival to the sendto of the resulting command
+    TOTAL_STAGE = 'frame_to_sendto'
+
+
+    def __init__(self, capacity: int=CAPACITY):
+        self.capacity = capacity
+
+        # Stage names are interned to small integers
+        self.stages = {}
+        self.stage_names = []
+
+        # All per-thread buffers; the lock is only taken when a thread records its first span
+        self.buffers = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        # Links between threads: key -> (trace id, origin time), e.g. the frame the latest pose came from
+        self.links = {}
+        self.last_total = self.NO_TRACE
+
+
+    # Current monotonic time
+    def now(self):
+        return time.monotonic()
+
+
+    # Buffer of the calling thread
+    def _buffer(self):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            with self.lock:
+                buffer = SpanBuffer(self.capacity, threading.current_thread().name, len(self.buffers))
+                self.buffers.append(buffer)
+            self.local.buffer = buffer
+        return buffer
+
+
+    # Index of a stage name
+    def _stage(self, name: str):
+        stage = self.stages.get(name)
+        if stage is None:
+            with self.lock:
+                stage = self.stages.setdefault(name, len(self.stage_names))
+                if stage == len(self.stage_names):
+                    self.stage_names.append(name)
+        return stage
+
+
+    # Record a span with known start and end times
+    def record(self, name: str, trace_id: int, start: float, end: float):
+        self._buffer().append(self._stage(name), trace_id, start, end)
+
+
+    # Record a span that ends now and lasted duration seconds (for stages timed with perf_counter)
+    def record_duration(self, name: str, trace_id: int, duration: float):
+        end = self.now()
+        self.record(name, trace_id, end - duration, end)
+
+
+    # Trace id the calling thread is working on (used by code that doesn't see the frame)
+    def set_current(self, trace_id: int):
+        self.local.current = trace_id
+
+    def current(self):
+        return getattr(self.local, 'current', self.NO_TRACE)
+
+
+    # Hand a trace id to another thread, e.g. VO -> controller through the 'pose' key
+    def link(self, key: str, trace_id: int, origin: float):
+        self.links[key] = (trace_id, origin)
+
+    def linked(self, key: str):
+        return self.links.get(key, (self.NO_TRACE, None))
+
+
+    # DroneVideoStream subscriber: BGR conversion span of every frame (grab() to retrieve(), decode happens in grab())
+    def on_frame(self, frame):
+        self.record('convert', frame.seq, frame.grab_time, frame.convert_time)
+
+
+    # Record the frame -> sendto span for a command sent now by the calling thread
+    def sent(self, start: float, end: float):
+        trace_id = self.current()
+        self.record('sendto', trace_id, start, end)
+        trace, origin = self.linked('pose')
+        # Only the first command computed from a frame counts towards the total
+        if trace_id != self.NO_TRACE and trace == trace_id and origin is not None and trace_id != self.last_total:
+            self.last_total = trace_id
+            self.record(self.TOTAL_STAGE, trace_id, origin, end)
+
+
+    # All spans from every thread as (stage, trace, start, end, thread index) arrays
+    def spans(self):
+        with self.lock:
+            buffers = list(self.buffers)
+        parts = [buffer.spans() for buffer in buffers]
+        if not parts:
+            return tuple(np.zeros(0) for _ in range(5))
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(5))
+
+
+    # Per-stage count and p50 / p99 / max duration (milliseconds)
+    def stage_stats(self):
+        stage, trace, start, end, thread = self.spans()
+        durations = (end - start) * 1000.0
+        stats = {}
+        for index, name in enumerate(self.stage_names):
+            values = durations[stage == index]
+            if len(values) == 0:
+                continue
+            p50, p99 = np.percentile(values, (50, 99))
+            stats[name] = {'count': len(values), 'p50': float(p50), 'p99': float(p99), 'max': float(values.max())}
+        return stats
+
+
+    # Print the per-stage table, slowest p99 first
+    def print_stats(self):
+        stats = self.stage_stats()
+        print('{:<28}{:>8}{:>10}{:>10}{:>10}'.format('stage', 'count', 'p50 ms', 'p99 ms', 'max ms'))
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]['p99']):
+            print('{:<28}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}'.format(name, s['count'], s['p50'], s['p99'], s['max']))
+
+
+    # Write Chrome trace-event JSON (complete 'X' events, one track per thread)
+    def save_chrome_trace(self, filename: str='LatencyTrace.json'):
+        stage, trace, start, end, thread = self.spans()
+        origin = start.min() if len(start) else 0.0
+        events = []
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': buffer.thread_index,
+                           'args': {'name': buffer.thread_name}})
+        for i in np.argsort(start):
+            events.append({'name': self.stage_names[stage[i]], 'ph': 'X', 'pid': 1, 'tid': int(thread[i]),
+                           'ts': round((start[i] - origin) * 1e6, 1), 'dur': round((end[i] - start[i]) * 1e6, 1),
+                           'args': {'frame': int(trace[i])}})
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+    # Forget all recorded spans (buffers stay allocated)
+    def clear(self):
+        with self.lock:
+            for buffer in self.buffers:
+                buffer.count = 0
+            self.links = {}
+            self.last_total = self.NO_TRACE
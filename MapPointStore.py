@@ -0,0 +1,182 @@
+###################################################
+#                Map Point Store                  #
+#                                                 #
+#  Description: Map storage for the visual        #
+#               odometry, modeled on rpg_svo's    #
+#               Map and Reprojector. Point        #
+#               positions and descriptors sit in  #
+#               contiguous arrays, keyframes keep #
+#               lists of the points they see, and #
+#               reprojection picks the best point #
+#               per image grid cell from one      #
+#               vectorized projection. Far        #
+#               keyframes are culled so memory    #
+#               stays bounded on long flights.    #
+###################################################
+
+# Required Imports
+import threading
+import numpy as np
+
+class MapPointStore:
+    """  CLASS CONSTANTS  """
+    # Keyframes kept before the farthest one is culled
+    MAX_KEYFRAMES = 10
+
+    # Closest keyframes whose points are reprojected
+    CLOSE_KEYFRAMES = 5
+
+    # Image grid cell size (pixels) for candidate selection
+    GRID_SIZE = 30
+
+    # Descriptor length and type (8x8 intensity patches by default)
+    DESCRIPTOR_SIZE = 64
+    DESCRIPTOR_DTYPE = np.float32
+
+    # Initial point storage
+    CAPACITY = 4096
+
+
+    def __init__(self, descriptor_size: int=DESCRIPTOR_SIZE, descriptor_dtype=DESCRIPTOR_DTYPE,
+                 max_keyframes: int=MAX_KEYFRAMES):
+        self.descriptor_size = descriptor_size
+        self.descriptor_dtype = descriptor_dtype
+        self.max_keyframes = max_keyframes
+
+        # Point storage; slots of removed points are reused through the free list
+        self.capacity = 0
+        self.positions = np.zeros((0, 3))
+        self.descriptors = np.zeros((0, descriptor_size), descriptor_dtype)
+        self.n_obs = np.zeros(0, int)
+        self.alive = np.zeros(0, bool)
+        self.free = []
+        self._allocate(self.CAPACITY)
+
+        # Keyframes by id: (R, t, camera position, ids of the points it sees)
+        self.keyframes = {}
+        self.next_kf_id = 0
+        self.lock = threading.Lock()
+
+
+    # Grow the point arrays, keeping existing points
+    def _allocate(self, capacity: int):
+        old = self.capacity
+        self.positions = np.concatenate((self.positions, np.zeros((capacity - old, 3))))
+        self.descriptors = np.concatenate((self.descriptors,
+                                           np.zeros((capacity - old, self.descriptor_size), self.descriptor_dtype)))
+        self.n_obs = np.concatenate((self.n_obs, np.zeros(capacity - old, int)))
+        self.alive = np.concatenate((self.alive, np.zeros(capacity - old, bool)))
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+
+    # Number of live points
+    def size(self):
+        return self.capacity - len(self.free)
+
+
+    # Add a keyframe with its world to camera pose, returns its id
+    def add_keyframe(self, R, t):
+        R = np.asarray(R, np.float64)
+        t = np.asarray(t, np.float64).ravel()
+        with self.lock:
+            kf_id = self.next_kf_id
+            self.next_kf_id += 1
+            self.keyframes[kf_id] = (R, t, -R.T @ t, np.zeros(0, int))
+            return kf_id
+
+
+    # Add new world points seen by a keyframe, returns their ids
+    def add_points(self, kf_id: int, positions, descriptors=None):
+        positions = np.asarray(positions, np.float64).reshape(-1, 3)
+        count = len(positions)
+        with self.lock:
+            if count > len(self.free):
+                self._allocate(max(2 * self.capacity, self.size() + count))
+            ids = np.array(self.free[-count:][::-1], int) if count else np.zeros(0, int)
+            del self.free[len(self.free) - count:]
+            self.positions[ids] = positions
+            self.descriptors[ids] = 0 if descriptors is None else descriptors
+            self.n_obs[ids] = 0
+            self.alive[ids] = True
+            self._observe(kf_id, ids)
+            return ids
+
+
+    # Record that a keyframe sees existing points
+    def add_observations(self, kf_id: int, ids):
+        with self.lock:
+            ids = np.asarray(ids, int)
+            self._observe(kf_id, ids[self.alive[ids]])
+
+
+    def _observe(self, kf_id: int, ids):
+        R, t, center, seen = self.keyframes[kf_id]
+        new = np.setdiff1d(ids, seen)
+        self.n_obs[new] += 1
+        self.keyframes[kf_id] = (R, t, center, np.union1d(seen, new))
+
+
+    # Move points (e.g. after refinement)
+    def update_positions(self, ids, positions):
+        with self.lock:
+            self.positions[np.asarray(ids, int)] = positions
+
+
+    # Pick at most one map point per grid cell for a camera pose
+    # Returns (point ids, projected pixels (N, 2))
+    def select_candidates(self, R, t, camera_matrix, size, grid_size: int=GRID_SIZE, close_keyframes: int=CLOSE_KEYFRAMES):
+        R = np.asarray(R, np.float64)
+        t = np.asarray(t, np.float64).ravel()
+        with self.lock:
+            if not self.keyframes:
+                return np.zeros(0, int), np.zeros((0, 2))
+
+            # Only points of the closest keyframes are considered, so cost doesn't grow with the map
+            kf_ids = list(self.keyframes)
+            centers = np.array([self.keyframes[k][2] for k in kf_ids])
+            center = -R.T @ t
+            order = np.argsort(np.linalg.norm(centers - center, axis=1))[:close_keyframes]
+            ids = np.unique(np.concatenate([self.keyframes[kf_ids[i]][3] for i in order]))
+            ids = ids[self.alive[ids]]
+            if len(ids) == 0:
+                return ids, np.zeros((0, 2))
+
+            # One projection of all candidate points
+            cam = self.positions[ids] @ R.T + t
+            front = cam[:, 2] > 1e-6
+            uvw = cam @ np.asarray(camera_matrix, np.float64).T
+            px = uvw[:, :2] / np.where(front, cam[:, 2], 1.0)[:, None]
+            inside = front & (px[:, 0] >= 0) & (px[:, 0] < size[0]) & (px[:, 1] >= 0) & (px[:, 1] < size[1])
+            ids, px, depth = ids[inside], px[inside], cam[inside, 2]
+            if len(ids) == 0:
+                return ids, px
+
+            # Best point per cell: most observed, then closest
+            cols = int(np.ceil(size[0] / grid_size))
+            cell = (px[:, 1] // grid_size).astype(int) * cols + (px[:, 0] // grid_size).astype(int)
+            order = np.lexsort((depth, -self.n_obs[ids], cell))
+            first = np.unique(cell[order], return_index=True)[1]
+            pick = order[first]
+            return ids[pick], px[pick]
+
+
+    # Remove the keyframes farthest from the camera beyond max_keyframes, freeing unseen points
+    def cull_keyframes(self, R, t):
+        center = -np.asarray(R, np.float64).T @ np.asarray(t, np.float64).ravel()
+        with self.lock:
+            removed = []
+            while len(self.keyframes) > self.max_keyframes:
+                far = max(self.keyframes, key=lambda k: np.linalg.norm(self.keyframes[k][2] - center))
+                self._remove_keyframe(far)
+                removed.append(far)
+            return removed
+
+
+    # Remove one keyframe (call with the lock held)
+    def _remove_keyframe(self, kf_id: int):
+        R, t, center, seen = self.keyframes.pop(kf_id)
+        self.n_obs[seen] -= 1
+        orphans = seen[self.n_obs[seen] <= 0]
+        self.alive[orphans] = False
+        self.free.extend(orphans.tolist())
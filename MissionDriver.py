@@ -0,0 +1,156 @@
+###################################################
+#                 Mission Driver                  #
+#                                                 #
+#  Description: Runs a scripted mission through   #
+#               the flight controller, resending  #
+#               commands that time out, and       #
+#               reports completion time, time     #
+#               outs, retransmissions, responses  #
+#               that didn't match their command   #
+#               and how many rc datagrams made it #
+#               to the drone. Run as a script it  #
+#               flies the mission against the     #
+#               DroneSimulator through an         #
+#               ImpairmentProxy for each link     #
+#               profile.                          #
+###################################################
+
+# Required Imports
+import time
+import numpy as np
+
+class MissionDriver:
+    """  CLASS CONSTANTS  """
+    # Default mission: SDK commands, and ('rc', seconds, (lr, fb, ud, yaw)) steps streamed at RC_RATE
+    MISSION = ['command', 'takeoff', 'battery?', 'forward 100', 'cw 90', 'forward 100', 'height?',
+               ('rc', 2.0, (0, 50, 0, 0)), ('rc', 1.0, (0, 0, 0, 0)), 'ccw 90', 'back 100', 'land']
+
+    # Seconds to wait for a response before resending
+    RESPONSE_TIMEOUT = 1.0
+
+    # Times a command is resent before the mission gives up on it
+    MAX_RETRIES = 3
+
+    # rc datagrams per second during rc steps
+    RC_RATE = 20.0
+
+
+    # drone is a DroneFlightController, simulator an optional DroneSimulator to count rc datagrams that arrived
+    def __init__(self, drone, simulator=None, response_timeout: float=RESPONSE_TIMEOUT, max_retries: int=MAX_RETRIES):
+        self.drone = drone
+        self.simulator = simulator
+        self.response_timeout = response_timeout
+        self.max_retries = max_retries
+
+
+    # Fly the mission and return its report
+    def run(self, mission: list=None):
+        mission = self.MISSION if mission is None else mission
+        report = {'commands': 0, 'completed': 0, 'failed': 0, 'timeouts': 0, 'retransmissions': 0,
+                  'mismatched': 0, 'rc_sent': 0, 'rc_received': 0}
+        response_times = []
+        rc_before = self.simulator.stats['rc'] if self.simulator is not None else 0
+
+        start = time.monotonic()
+        for step in mission:
+            if isinstance(step, tuple):
+                report['rc_sent'] += self._stream_rc(*step[1:])
+                continue
+            report['commands'] += 1
+            response, elapsed = self._send(step, report)
+            if response is None:
+                report['failed'] += 1
+                continue
+            report['completed'] += 1
+            response_times.append(elapsed)
+            if not self._matches(step, response):
+                report['mismatched'] += 1
+        report['completion_time'] = time.monotonic() - start
+
+        if response_times:
+            times = np.array(response_times) * 1000.0
+            report['response_p50_ms'] = float(np.percentile(times, 50))
+            report['response_p99_ms'] = float(np.percentile(times, 99))
+        if self.simulator is not None:
+            report['rc_received'] = self.simulator.stats['rc'] - rc_before
+        return report
+
+
+    # Send one command, resending it after each time out, returns (response, seconds until it came) or (None, None)
+    def _send(self, command: str, report: dict):
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                report['retransmissions'] += 1
+            start = time.monotonic()
+            response = self.drone.send_command(command, command.endswith('?'), timeout=self.response_timeout)
+            if response is not None:
+                return response, time.monotonic() - start
+            report['timeouts'] += 1
+        return None, None
+
+
+    # Stream rc values for a number of seconds, returns the datagrams sent
+    def _stream_rc(self, seconds: float, values: tuple):
+        period = 1.0 / self.RC_RATE
+        count = int(seconds * self.RC_RATE)
+        deadline = time.monotonic()
+        for _ in range(count):
+            self.drone.rc_control(*values)
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
+        return count
+
+
+    # Whether a response belongs to its command (a late or duplicated response can answer the next command instead)
+    def _matches(self, command: str, response: str):
+        text = response[2:-1] if response.startswith("b'") else response
+        if command.endswith('?'):
+            return text not in ('ok', 'error')
+        return text in ('ok', 'error')
+
+
+# Fly the mission against the simulator through the impairment proxy for each link profile and compare
+#   python MissionDriver.py [profile ...] (profiles from ImpairmentProxy.PROFILES, all by default)
+if __name__ == "__main__":
+    import sys
+    import DroneFlightController
+    import DroneSimulator
+    import ImpairmentProxy
+
+    profiles = sys.argv[1:] or list(ImpairmentProxy.ImpairmentProxy.PROFILES)
+
+    simulator = DroneSimulator.DroneSimulator(response_delay=0.005)
+    simulator.start()
+    proxy = ImpairmentProxy.ImpairmentProxy((DroneSimulator.DroneSimulator.IP, DroneSimulator.DroneSimulator.COMMAND_PORT),
+                                            seed=1)
+    proxy.start()
+    drone = DroneFlightController.DroneFlightController(record_log=False, show_log=False, use_state_stream=False,
+                                                        tello_ip=ImpairmentProxy.ImpairmentProxy.IP,
+                                                        tello_port=ImpairmentProxy.ImpairmentProxy.PORT)
+    driver = MissionDriver(drone, simulator)
+
+    for profile in profiles:
+        proxy.configure(**ImpairmentProxy.ImpairmentProxy.PROFILES[profile])
+        proxy.reset_stats()
+        with simulator.lock:
+            simulator.position[:] = 0.0
+            simulator.yaw = 0.0
+        report = driver.run()
+
+        print('\n%s: %s' % (profile, ImpairmentProxy.ImpairmentProxy.PROFILES[profile]))
+        print('  completed %d/%d commands in %.2f s' % (report['completed'], report['commands'], report['completion_time']))
+        print('  timeouts %d  retransmissions %d  failed %d  mismatched responses %d'
+              % (report['timeouts'], report['retransmissions'], report['failed'], report['mismatched']))
+        if 'response_p50_ms' in report:
+            print('  response time p50 %.1f ms  p99 %.1f ms' % (report['response_p50_ms'], report['response_p99_ms']))
+        print('  rc delivered %d/%d' % (report['rc_received'], report['rc_sent']))
+        print('  proxy up %s' % proxy.stats['up'])
+        print('  proxy down %s' % proxy.stats['down'])
+        print('  final position (cm) %s  yaw %.1f' % (np.round(simulator.position, 1), simulator.yaw))
+
+        # Let stragglers from this run arrive before the next one starts
+        time.sleep(0.5)
+
+    proxy.stop()
+    simulator.stop()
+    drone.close()
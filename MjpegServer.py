@@ -0,0 +1,193 @@
+###################################################
+#                  MJPEG Server                   #
+#                                                 #
+#  Description: Optional HTTP server that lets    #
+#               any number of remote observers    #
+#               watch the preview stream in a     #
+#               browser. Each preview frame is    #
+#               JPEG encoded once on one thread   #
+#               and the same bytes go to every    #
+#               client. Clients always get the    #
+#               newest frame, and a client whose  #
+#               socket stops draining is dropped  #
+#               instead of having frames queued.  #
+###################################################
+
+# Required Imports
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+class MjpegServer:
+    """  CLASS CONSTANTS  """
+    # Address and port the server listens on, local only unless another host ('' for every interface) is given
+    HOST = '127.0.0.1'
+    PORT = 8080
+
+    # JPEG quality (0-100)
+    QUALITY = 80
+
+    # Seconds a client may take to accept one frame before it is dropped
+    SEND_TIMEOUT = 1.0
+
+    # Socket send buffer per client (bytes), kept small so a stalled client fills it and times out quickly
+    SEND_BUFFER = 65536
+
+    # Most clients served at once
+    MAX_CLIENTS = 16
+
+    # Multipart boundary between frames
+    BOUNDARY = 'autodroneframe'
+
+    # Page served at '/'
+    PAGE = b'<html><head><title>AutoDrone</title></head><body><img src="/stream.mjpg"></body></html>'
+
+
+    # preview is a PreviewStream (or anything with wait_for_frame(last_seq, timeout) returning frames with 'seq' and 'image')
+    def __init__(self, preview, host: str=HOST, port: int=PORT, quality: int=QUALITY):
+        self.preview = preview
+        self.address = (host, port)
+        self.quality = quality
+
+        # Latest encoded frame and the condition client threads wait on
+        self.jpeg = None
+        self.seq = 0
+        self.condition = threading.Condition()
+
+        # Counters: frames encoded, time spent encoding, clients connected now / in total / dropped, frames and bytes sent
+        self.clients = 0
+        self.stats = {'encoded': 0, 'encode_time': 0.0, 'connections': 0, 'dropped': 0, 'refused': 0,
+                      'frames_sent': 0, 'bytes_sent': 0}
+        self.lock = threading.Lock()
+
+        # Initialize encoder and server threads
+        self.running = False
+        self.server = None
+        self.encoder_thread = None
+        self.server_thread = None
+
+
+    # Start encoding and serving
+    def start(self):
+        self.running = True
+        self.server = ThreadingHTTPServer(self.address, self._handler_class())
+        self.server.daemon_threads = True
+        self.encoder_thread = threading.Thread(target=self._encoder_thread)
+        self.encoder_thread.daemon = True
+        self.encoder_thread.start()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+
+    # Stop serving and disconnect every client
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+    # Encode every new preview frame once
+    def _encoder_thread(self):
+        seq = 0
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while self.running:
+            frame = self.preview.wait_for_frame(seq, 1.0)
+            if frame is None:
+                continue
+            seq = frame.seq
+            start = time.perf_counter()
+            ok, data = cv2.imencode('.jpg', frame.image, params)
+            if not ok:
+                continue
+            self.stats['encode_time'] += time.perf_counter() - start
+            self.stats['encoded'] += 1
+            with self.condition:
+                self.jpeg = data.tobytes()
+                self.seq += 1
+                self.condition.notify_all()
+
+
+    # Block until an encoded frame newer than last_seq is available (or timeout), returns (seq, jpeg) or None
+    def wait_for_jpeg(self, last_seq: int=0, timeout: float=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_seq or not self.running, timeout)
+            if self.seq > last_seq:
+                return self.seq, self.jpeg
+            return None
+
+
+    # Send the newest frames to one client until it disconnects or can't keep up
+    def _stream_to(self, handler):
+        with self.lock:
+            if self.clients >= self.MAX_CLIENTS:
+                self.stats['refused'] += 1
+                handler.send_error(503, 'Too many viewers')
+                return
+            self.clients += 1
+            self.stats['connections'] += 1
+        try:
+            handler.send_response(200)
+            handler.send_header('Cache-Control', 'no-cache, private')
+            handler.send_header('Pragma', 'no-cache')
+            handler.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=' + self.BOUNDARY)
+            handler.end_headers()
+
+            # A send that blocks longer than SEND_TIMEOUT means the client isn't draining its socket
+            handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER)
+            handler.connection.settimeout(self.SEND_TIMEOUT)
+            seq = 0
+            while self.running:
+                latest = self.wait_for_jpeg(seq, 1.0)
+                if latest is None:
+                    continue
+                seq, jpeg = latest
+                part = ('--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+                        % (self.BOUNDARY, len(jpeg))).encode('ascii')
+                handler.wfile.write(part + jpeg + b'\r\n')
+                self.stats['frames_sent'] += 1
+                self.stats['bytes_sent'] += len(part) + len(jpeg) + 2
+        except socket.timeout:
+            self.stats['dropped'] += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.lock:
+                self.clients -= 1
+
+
+    # Request handler bound to this server
+    def _handler_class(self):
+        server = self
+
+        class MjpegHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == '/stream.mjpg':
+                    server._stream_to(self)
+                elif self.path == '/snapshot.jpg' and server.jpeg is not None:
+                    jpeg = server.jpeg
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(jpeg)))
+                    self.end_headers()
+                    self.wfile.write(jpeg)
+                elif self.path in ('/', '/index.html'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(server.PAGE)))
+                    self.end_headers()
+                    self.wfile.write(server.PAGE)
+                else:
+                    self.send_error(404)
+
+            # Keep request logging off the console
+            def log_message(self, format, *args):
+                pass
+
+        return MjpegHandler
@@ -0,0 +1,217 @@
+###################################################
+#              Position Controller                #
+#                                                 #
+#  Description: Closed loop waypoint follower     #
+#               that flies the drone with rc      #
+#               commands instead of stop-and-go   #
+#               moves. Runs at a fixed rate on    #
+#               perf_counter deadlines, computes  #
+#               rc setpoints from pose estimates  #
+#               through per-axis PID controllers, #
+#               and records loop jitter and       #
+#               compute time for every tick.      #
+###################################################
+
+# Required Imports
+import math
+import threading
+import time
+import numpy as np
+
+class PIDController:
+
+    def __init__(self, kp: float, ki: float=0.0, kd: float=0.0, limit: float=100.0, integral_limit: float=50.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        # Output is clamped to +-limit (rc range), the integral term to +-integral_limit
+        self.limit = limit
+        self.integral_limit = integral_limit
+        self.reset()
+
+    # Clear the integral and derivative history
+    def reset(self):
+        self.integral = 0.0
+        self.prev_error = None
+
+    # Compute the output for an error over a time step
+    def update(self, error: float, dt: float):
+        if self.ki > 0:
+            self.integral += error * dt
+            bound = self.integral_limit / self.ki
+            self.integral = max(-bound, min(bound, self.integral))
+        derivative = 0.0
+        if self.prev_error is not None and dt > 0:
+            derivative = (error - self.prev_error) / dt
+        self.prev_error = error
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return max(-self.limit, min(self.limit, output))
+
+
+class PositionController:
+    """  CLASS CONSTANTS  """
+    # Control loop rate (Hz)
+    RATE = 20.0
+
+    # Sleep until this long (seconds) before a deadline, then spin
+    SPIN_TIME = 0.001
+
+    # PID gains (kp, ki, kd) for horizontal position (cm), height (cm) and yaw (deg)
+    GAINS = {'xy': (0.5, 0.05, 0.15), 'z': (0.8, 0.05, 0.1), 'yaw': (1.2, 0.0, 0.1)}
+
+    # Largest rc value sent on any channel
+    MAX_RC = 60
+
+    # A waypoint is reached within these tolerances (cm, deg)
+    POSITION_TOLERANCE = 15.0
+    YAW_TOLERANCE = 8.0
+
+    # Ticks of jitter / compute time kept for statistics
+    HISTORY = 4096
+
+
+    def __init__(self, drone, pose_source, rate: float=RATE, gains: dict=None, max_rc: int=MAX_RC, tracer=None):
+        self.drone = drone
+
+        # Optional LatencyTracer, ticks are tagged with the frame the latest pose came from
+        self.tracer = tracer
+
+        # Callable returning the current pose (x, y, z, yaw) in cm / degrees, or None if unknown
+        # (x forward and y right of the takeoff heading, z up, yaw clockwise like the Tello)
+        self.pose_source = pose_source
+        self.period = 1.0 / rate
+        self.max_rc = max_rc
+
+        gains = dict(self.GAINS, **(gains or {}))
+        self.pid = {axis: PIDController(*gains[key], limit=max_rc)
+                    for axis, key in (('x', 'xy'), ('y', 'xy'), ('z', 'z'), ('yaw', 'yaw'))}
+
+        # Waypoints (x, y, z, yaw) still to fly
+        self.waypoints = []
+        self.lock = threading.Lock()
+        self.last_rc = (0, 0, 0, 0)
+
+        # Loop timing history (seconds): lateness of each tick and time spent computing it
+        self.jitter = np.zeros(self.HISTORY)
+        self.compute = np.zeros(self.HISTORY)
+        self.ticks = 0
+        self.overruns = 0
+
+        # Initialize control thread
+        self.running = False
+        self.control_thread = None
+
+
+    # Replace the waypoint list
+    def set_waypoints(self, waypoints):
+        with self.lock:
+            self.waypoints = [tuple(w) for w in waypoints]
+            for pid in self.pid.values():
+                pid.reset()
+
+
+    # Whether all waypoints have been reached
+    def done(self):
+        with self.lock:
+            return not self.waypoints
+
+
+    # Start the control loop
+    def start(self):
+        self.running = True
+        self.control_thread = threading.Thread(target=self._control_thread)
+        self.control_thread.daemon = True
+        self.control_thread.start()
+
+
+    # Stop the control loop and leave the drone hovering
+    def stop(self):
+        self.running = False
+        if self.control_thread is not None:
+            self.control_thread.join()
+        self.drone.rc_control(0, 0, 0, 0)
+
+
+    # Fixed rate loop: deadlines advance by the period, so sleep error never accumulates
+    def _control_thread(self):
+        deadline = time.perf_counter()
+        while self.running:
+            deadline += self.period
+            remaining = deadline - time.perf_counter()
+            if remaining > self.SPIN_TIME:
+                time.sleep(remaining - self.SPIN_TIME)
+            while time.perf_counter() < deadline:
+                pass
+
+            start = time.perf_counter()
+            self.tick(self.period)
+            end = time.perf_counter()
+
+            index = self.ticks % self.HISTORY
+            self.jitter[index] = start - deadline
+            self.compute[index] = end - start
+            self.ticks += 1
+
+            # A tick that ran past the next deadline skips ahead instead of bursting to catch up
+            if end > deadline + self.period:
+                self.overruns += 1
+                deadline += math.floor((end - deadline) / self.period) * self.period
+
+
+    # One control step: read the pose, compute and send rc setpoints
+    def tick(self, dt: float):
+        if self.tracer is not None:
+            start = self.tracer.now()
+            trace_id, origin = self.tracer.linked('pose')
+            self.tracer.set_current(trace_id)
+        pose = self.pose_source()
+        with self.lock:
+            if pose is None or not self.waypoints:
+                rc = (0, 0, 0, 0)
+            else:
+                rc = self._compute(pose, dt)
+        if self.tracer is not None:
+            self.tracer.record('control', trace_id, start, self.tracer.now())
+        self.drone.rc_control(*rc)
+        self.last_rc = rc
+        return rc
+
+
+    # PID outputs for the current waypoint, advancing when it is reached (call with the lock held)
+    def _compute(self, pose, dt: float):
+        x, y, z, yaw = pose
+        tx, ty, tz, tyaw = self.waypoints[0]
+        ex, ey, ez = tx - x, ty - y, tz - z
+        eyaw = (tyaw - yaw + 180.0) % 360.0 - 180.0
+
+        if math.hypot(ex, ey, ez) < self.POSITION_TOLERANCE and abs(eyaw) < self.YAW_TOLERANCE:
+            self.waypoints.pop(0)
+            for pid in self.pid.values():
+                pid.reset()
+            if not self.waypoints:
+                return (0, 0, 0, 0)
+            return self._compute(pose, dt)
+
+        # World x/y errors are rotated into the body frame (forward / right)
+        heading = math.radians(yaw)
+        forward = math.cos(heading) * ex + math.sin(heading) * ey
+        right = -math.sin(heading) * ex + math.cos(heading) * ey
+
+        lr = self.pid['y'].update(right, dt)
+        fb = self.pid['x'].update(forward, dt)
+        ud = self.pid['z'].update(ez, dt)
+        yv = self.pid['yaw'].update(eyaw, dt)
+        return tuple(int(round(max(-self.max_rc, min(self.max_rc, v)))) for v in (lr, fb, ud, yv))
+
+
+    # Loop jitter and compute time percentiles (milliseconds)
+    def timing_stats(self):
+        count = min(self.ticks, self.HISTORY)
+        if count == 0:
+            return None
+        jitter = self.jitter[:count] * 1000.0
+        compute = self.compute[:count] * 1000.0
+        return {'ticks': self.ticks, 'overruns': self.overruns,
+                'jitter_p50': float(np.percentile(jitter, 50)), 'jitter_p99': float(np.percentile(jitter, 99)),
+                'jitter_max': float(jitter.max()),
+                'compute_p50': float(np.percentile(compute, 50)), 'compute_p99': float(np.percentile(compute, 99))}
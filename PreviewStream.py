@@ -0,0 +1,169 @@
+###################################################
+#                 Preview Stream                  #
+#                                                 #
+#  Description: Reduced-resolution (optionally    #
+#               grayscale) copy of the video for  #
+#               display and monitoring, computed  #
+#               once per frame on its own thread  #
+#               and shared by every viewer. A     #
+#               small thumbnail of each frame is  #
+#               compared with the last published  #
+#               one and frames of a static scene  #
+#               are not republished, so viewers   #
+#               skip redraws that change nothing. #
+###################################################
+
+# Required Imports
+import threading
+import time
+import cv2
+
+class PreviewFrame:
+
+    def __init__(self, seq: int, image, source_seq: int, source=None):
+        # Sequence number of the preview frame
+        self.seq = seq
+        # Reduced BGR (or grayscale) image
+        self.image = image
+        # Sequence number of the source frame it was made from
+        self.source_seq = source_seq
+        # Source DroneFrame, when the source is a DroneVideoStream
+        self.source = source
+        # Host monotonic time the preview was published
+        self.stamp = time.monotonic()
+
+
+class PreviewStream:
+    """  CLASS CONSTANTS  """
+    # Preview size (width, height), the Tello sends 960x720
+    SIZE = (480, 360)
+
+    # Thumbnail size (width, height) used to detect motion
+    THUMB_SIZE = (32, 24)
+
+    # Mean absolute thumbnail difference (grey levels) below which a frame counts as unchanged
+    MOTION_THRESHOLD = 2.0
+
+    # Seconds after which an unchanged scene is republished anyway
+    REFRESH_TIME = 1.0
+
+    # Most frames per second read from a source that can only be polled
+    POLL_RATE = 30.0
+
+
+    # source is a DroneVideoStream or anything with a 'frame' attribute holding the latest image
+    # (e.g. djitellopy's frame reader)
+    def __init__(self, source, size: tuple=SIZE, grayscale: bool=False, motion_threshold: float=MOTION_THRESHOLD):
+        self.source = source
+        self.size = tuple(size)
+        self.grayscale = grayscale
+        self.motion_threshold = motion_threshold
+
+        # Latest preview and the condition viewers wait on
+        self.frame = None
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.subscribers = []
+
+        # Thumbnail of the last published frame
+        self.last_thumb = None
+        self.last_publish = 0.0
+
+        # Counters: source frames looked at, previews published, frames suppressed as unchanged
+        self.stats = {'frames': 0, 'published': 0, 'suppressed': 0}
+
+        # Initialize preview thread
+        self.running = False
+        self.preview_thread = None
+
+
+    # Start making previews
+    def start(self):
+        self.running = True
+        self.preview_thread = threading.Thread(target=self._preview_thread)
+        self.preview_thread.daemon = True
+        self.preview_thread.start()
+
+
+    # Stop making previews
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+
+
+    # Follow the source's newest frames
+    def _preview_thread(self):
+        source_seq = 0
+        last_image = None
+        while self.running:
+            if hasattr(self.source, 'wait_for_frame'):
+                frame = self.source.wait_for_frame(source_seq, 1.0)
+                if frame is None:
+                    continue
+                source_seq = frame.seq
+                self.process(frame.image, source_seq, frame)
+            else:
+                # Polled sources assign a new array for every decoded frame
+                image = self.source.frame
+                if image is not None and image is not last_image:
+                    last_image = image
+                    source_seq += 1
+                    self.process(image, source_seq)
+                time.sleep(1.0 / self.POLL_RATE)
+
+
+    # Publish a preview of the image unless the scene hasn't changed since the last one
+    # Returns the new PreviewFrame, or None if it was suppressed
+    def process(self, image, source_seq: int, source=None):
+        self.stats['frames'] += 1
+        thumb = cv2.resize(image, self.THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        now = time.monotonic()
+        if (self.last_thumb is not None and now - self.last_publish < self.REFRESH_TIME
+                and cv2.absdiff(thumb, self.last_thumb).mean() < self.motion_threshold):
+            self.stats['suppressed'] += 1
+            return None
+        self.last_thumb = thumb
+        self.last_publish = now
+
+        # Convert to grayscale before resizing so the resize only touches one channel
+        if self.grayscale and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        preview = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+
+        with self.condition:
+            frame = PreviewFrame(self.seq + 1, preview, source_seq, source)
+            self.seq = frame.seq
+            self.frame = frame
+            self.condition.notify_all()
+        self.stats['published'] += 1
+        for callback in list(self.subscribers):
+            callback(frame)
+        return frame
+
+
+    # Register a function to be called with every published preview (on the preview thread)
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+
+    # Remove a previously registered preview callback
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+
+    # Return the newest preview
+    def latest(self):
+        return self.frame
+
+
+    # Block until a preview newer than last_seq is available (or timeout) and return it
+    def wait_for_frame(self, last_seq: int=0, timeout: float=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_seq or not self.running, timeout)
+            if self.seq > last_seq:
+                return self.frame
+            return None
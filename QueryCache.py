@@ -0,0 +1,91 @@
+###################################################
+#                   Query Cache                   #
+#                                                 #
+#  Description: Read-query layer for the drone's  #
+#               '?' commands. Each response is    #
+#               kept for a per-field time to live #
+#               and threads asking for the same   #
+#               field while a query is already in #
+#               flight wait for that one request  #
+#               and share its response instead of #
+#               sending their own. Keeps hit,     #
+#               miss and coalesced counters.      #
+###################################################
+
+# Required Imports
+import threading
+import time
+
+class QueryCache:
+    """  CLASS CONSTANTS  """
+    # Seconds each query's response stays valid
+    TTL = {'battery?': 10.0, 'time?': 1.0, 'temp?': 5.0, 'wifi?': 2.0, 'speed?': 1.0, 'height?': 0.3,
+           'baro?': 0.3, 'tof?': 0.2, 'attitude?': 0.1, 'acceleration?': 0.1}
+
+    # Time to live of queries not listed above
+    DEFAULT_TTL = 0.5
+
+
+    def __init__(self, drone, ttl: dict=None):
+        self.drone = drone
+        self.ttl = dict(self.TTL, **(ttl or {}))
+
+        # Cached responses: command -> (monotonic time received, response)
+        self.cache = {}
+
+        # Queries in flight: command -> [event, response]
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        # Counters
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'failures': 0}
+
+
+    # Response to a query, from the cache, a query already in flight, or a new request
+    # Returns None if the drone didn't answer and nothing was cached
+    def query(self, command: str, max_age: float=None):
+        if max_age is None:
+            max_age = self.ttl.get(command, self.DEFAULT_TTL)
+        with self.lock:
+            cached = self.cache.get(command)
+            if cached is not None and time.monotonic() - cached[0] <= max_age:
+                self.stats['hits'] += 1
+                return cached[1]
+            waiter = self.in_flight.get(command)
+            owner = waiter is None
+            if owner:
+                waiter = [threading.Event(), None]
+                self.in_flight[command] = waiter
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not owner:
+            waiter[0].wait()
+            return waiter[1]
+
+        response = None
+        try:
+            response = self.drone.send_command(command, True)
+        finally:
+            with self.lock:
+                if response is not None:
+                    self.cache[command] = (time.monotonic(), response)
+                else:
+                    # Fall back to the last known value rather than nothing
+                    self.stats['failures'] += 1
+                    if cached is not None:
+                        response = cached[1]
+                waiter[1] = response
+                del self.in_flight[command]
+            waiter[0].set()
+        return response
+
+
+    # Drop cached responses (all, or one query), e.g. after a command that changes them
+    def invalidate(self, command: str=None):
+        with self.lock:
+            if command is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(command, None)
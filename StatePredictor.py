@@ -0,0 +1,117 @@
+###################################################
+#                 State Predictor                 #
+#                                                 #
+#  Description: Compensates for latency in the    #
+#               control loop. Pose samples (from  #
+#               VO or dead reckoning) are dated   #
+#               back by the measured camera /     #
+#               state latency and pushed forward  #
+#               with a constant velocity model to #
+#               the moment the next command will  #
+#               take effect. Velocities come from #
+#               the state stream when available.  #
+###################################################
+
+# Required Imports
+import math
+import threading
+import time
+import numpy as np
+
+class StatePredictor:
+    """  CLASS CONSTANTS  """
+    # Default latencies (seconds): image capture to host receive, state packet to host
+    # receive, and command send to the drone acting on it
+    LATENCY = {'camera': 0.10, 'state': 0.03, 'command': 0.05}
+
+    # State stream velocity units to cm/s (the Tello reports dm/s)
+    VELOCITY_SCALE = 10.0
+
+    # The Tello reports velocities in its body frame (forward, right, down)
+    VELOCITY_IN_BODY_FRAME = True
+
+    # Smoothing of finite-difference velocities when no state stream is used
+    VELOCITY_SMOOTHING = 0.3
+
+    # Never extrapolate further than this (seconds)
+    MAX_HORIZON = 0.5
+
+
+    def __init__(self, state_stream=None, latency: dict=None):
+        self.state_stream = state_stream
+        self.latency = dict(self.LATENCY, **(latency or {}))
+
+        # Latest pose (x, y, z, yaw) and the monotonic time it was measured
+        self.pose = None
+        self.pose_time = None
+
+        # Finite-difference velocity (vx, vy, vz cm/s, yaw rate deg/s)
+        self.pose_velocity = np.zeros(4)
+        self.lock = threading.Lock()
+
+
+    # Update a latency stage (e.g. from VideoLatencyProbe or LatencyTracer measurements)
+    def set_latency(self, stage: str, seconds: float):
+        self.latency[stage] = seconds
+
+
+    # Record a pose measured from data received at recv_time (source 'camera' or 'state')
+    def update_pose(self, recv_time: float, pose, source: str='camera'):
+        measured = recv_time - self.latency.get(source, 0.0)
+        pose = np.array(pose, dtype=float)
+        with self.lock:
+            if self.pose is not None and measured > self.pose_time:
+                dt = measured - self.pose_time
+                step = pose - self.pose
+                step[3] = (step[3] + 180.0) % 360.0 - 180.0
+                self.pose_velocity += self.VELOCITY_SMOOTHING * (step / dt - self.pose_velocity)
+            if self.pose_time is None or measured > self.pose_time:
+                self.pose = pose
+                self.pose_time = measured
+
+
+    # Current velocity estimate (vx, vy, vz cm/s in the world frame, yaw rate deg/s)
+    def velocity(self):
+        velocity = self.pose_velocity.copy()
+        if self.state_stream is None:
+            return velocity
+
+        stamps, values = self.state_stream.samples()
+        if len(stamps) < 2:
+            return velocity
+        columns = self.state_stream.columns
+        last = values[-1]
+        v = np.array([last[columns['vgx']], last[columns['vgy']], last[columns['vgz']]]) * self.VELOCITY_SCALE
+        if self.VELOCITY_IN_BODY_FRAME:
+            heading = math.radians(last[columns['yaw']])
+            v = np.array([math.cos(heading) * v[0] - math.sin(heading) * v[1],
+                          math.sin(heading) * v[0] + math.cos(heading) * v[1],
+                          -v[2]])
+        velocity[:3] = v
+
+        # Yaw rate from the last two state samples
+        dt = stamps[-1] - stamps[-2]
+        if dt > 0:
+            step = (last[columns['yaw']] - values[-2][columns['yaw']] + 180.0) % 360.0 - 180.0
+            velocity[3] = step / dt
+        return velocity
+
+
+    # Pose (x, y, z, yaw) expected when a command sent at send_time takes effect (default: now)
+    def predict(self, send_time: float=None):
+        with self.lock:
+            if self.pose is None:
+                return None
+            pose = self.pose.copy()
+            pose_time = self.pose_time
+        if send_time is None:
+            send_time = time.monotonic()
+        horizon = min(max(send_time + self.latency['command'] - pose_time, 0.0), self.MAX_HORIZON)
+        pose += self.velocity() * horizon
+        pose[3] = (pose[3] + 180.0) % 360.0 - 180.0
+        return tuple(float(v) for v in pose)
+
+
+    # Pose source for PositionController
+    def pose_source(self):
+        return self.predict()
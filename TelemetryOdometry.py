@@ -0,0 +1,177 @@
+###################################################
+#               Telemetry Odometry                #
+#                                                 #
+#  Description: Dead reckoning from the Tello     #
+#               state stream. Body velocities are #
+#               rotated by yaw and integrated     #
+#               with the trapezoid rule over      #
+#               whole blocks of samples at once,  #
+#               height comes straight from 'h'.   #
+#               Serves as a fallback pose source  #
+#               when vision tracking fails and    #
+#               exports traj_estimate.txt in the  #
+#               same format as VisualOdometry so  #
+#               both can go through the rpg_svo   #
+#               analysis scripts.                 #
+###################################################
+
+# Required Imports
+import threading
+import numpy as np
+import DroneStateStream
+
+class TelemetryOdometry:
+    """  CLASS CONSTANTS  """
+    # State stream velocity units to cm/s (the Tello reports dm/s)
+    VELOCITY_SCALE = 10.0
+
+    # Trajectory file units per cm (TUM files are in meters)
+    EXPORT_SCALE = 0.01
+
+    # Gaps between state samples longer than this (seconds) are not integrated over
+    MAX_GAP = 0.5
+
+
+    def __init__(self, state_stream=None, predictor=None):
+        self.state_stream = state_stream
+
+        # Optional StatePredictor fed with every new pose (source 'state')
+        self.predictor = predictor
+
+        # Integration state for live updates
+        self.last_stamp = None
+        self.last_velocity = None
+        self.position = np.zeros(2)
+
+        # Integrated trajectory blocks: (stamps, poses (N, 4), attitude (N, 3))
+        self.blocks = []
+        self.lock = threading.Lock()
+
+
+    # Column index of a state field
+    def _column(self, name: str):
+        if self.state_stream is not None:
+            return self.state_stream.columns[name]
+        return DroneStateStream.DroneStateStream.FIELDS.index(name)
+
+
+    # World frame velocities (x forward, y right of the takeoff heading, cm/s) for each sample
+    def world_velocity(self, values):
+        heading = np.radians(values[:, self._column('yaw')])
+        forward = values[:, self._column('vgx')] * self.VELOCITY_SCALE
+        right = values[:, self._column('vgy')] * self.VELOCITY_SCALE
+        cos, sin = np.cos(heading), np.sin(heading)
+        return np.column_stack((cos * forward - sin * right, sin * forward + cos * right))
+
+
+    # Integrate a block of samples (stamps (N,), values (N, fields)) into poses (x, y, z, yaw)
+    # starting from start_position, with start_velocity at start_stamp if given
+    def integrate(self, stamps, values, start_position=(0.0, 0.0), start_stamp: float=None, start_velocity=None):
+        stamps = np.asarray(stamps, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(stamps), -1)
+        velocity = self.world_velocity(values)
+
+        # Prepend the previous sample so the first step of a live block is integrated too
+        if start_stamp is not None:
+            times = np.concatenate(([start_stamp], stamps))
+            velocity = np.vstack((start_velocity, velocity))
+        else:
+            times = np.concatenate((stamps[:1], stamps))
+            velocity = np.vstack((velocity[:1], velocity))
+
+        dt = np.diff(times)
+        dt = np.where((dt > 0) & (dt < self.MAX_GAP), dt, 0.0)
+        steps = 0.5 * (velocity[1:] + velocity[:-1]) * dt[:, None]
+        xy = np.asarray(start_position, dtype=float) + np.cumsum(steps, axis=0)
+
+        poses = np.column_stack((xy, values[:, self._column('h')], values[:, self._column('yaw')]))
+        return poses
+
+
+    # Integrate everything recorded so far (e.g. loaded with DroneStateStream.load_samples)
+    def integrate_all(self, stamps, values):
+        poses = self.integrate(stamps, values)
+        attitude = self._attitude(values)
+        with self.lock:
+            self.blocks = [(np.asarray(stamps, dtype=float), poses, attitude)]
+            self.last_stamp = float(stamps[-1]) if len(stamps) else None
+            self.last_velocity = self.world_velocity(values[-1:])[0] if len(stamps) else None
+            self.position = poses[-1, :2].copy() if len(stamps) else np.zeros(2)
+        return poses
+
+
+    # Integrate the state samples received since the last update, returns the newest pose or None
+    def update(self):
+        stamps, values = self.state_stream.samples()
+        with self.lock:
+            if self.last_stamp is not None:
+                new = stamps > self.last_stamp
+                stamps, values = stamps[new], values[new]
+            if len(stamps) == 0:
+                return None
+            poses = self.integrate(stamps, values, self.position, self.last_stamp, self.last_velocity)
+            self.blocks.append((stamps, poses, self._attitude(values)))
+            self.last_stamp = float(stamps[-1])
+            self.last_velocity = self.world_velocity(values[-1:])[0]
+            self.position = poses[-1, :2].copy()
+
+        pose = tuple(float(v) for v in poses[-1])
+        if self.predictor is not None:
+            self.predictor.update_pose(self.last_stamp, pose, source='state')
+        return pose
+
+
+    # Pose source for PositionController: the dead-reckoned pose (x, y, z, yaw) or None
+    def pose_source(self):
+        pose = self.update()
+        if pose is not None:
+            return pose
+        with self.lock:
+            if not self.blocks:
+                return None
+            return tuple(float(v) for v in self.blocks[-1][1][-1])
+
+
+    # Forget the integrated trajectory and restart from the origin
+    def reset(self):
+        with self.lock:
+            self.blocks = []
+            self.last_stamp = None
+            self.last_velocity = None
+            self.position = np.zeros(2)
+
+
+    # Pitch, roll, yaw columns (degrees)
+    def _attitude(self, values):
+        return values[:, [self._column('pitch'), self._column('roll'), self._column('yaw')]]
+
+
+    # Whole trajectory as (stamps, poses, attitude)
+    def trajectory(self):
+        with self.lock:
+            if not self.blocks:
+                return np.zeros(0), np.zeros((0, 4)), np.zeros((0, 3))
+            return (np.concatenate([b[0] for b in self.blocks]),
+                    np.concatenate([b[1] for b in self.blocks]),
+                    np.concatenate([b[2] for b in self.blocks]))
+
+
+    # Write the trajectory as 'stamp tx ty tz qx qy qz qw' lines, like VisualOdometry
+    # Exported in a right handed frame: x forward, y left, z up (meters)
+    def save_trajectory(self, filename: str='traj_estimate.txt'):
+        stamps, poses, attitude = self.trajectory()
+        position = np.column_stack((poses[:, 0], -poses[:, 1], poses[:, 2])) * self.EXPORT_SCALE
+        quaternion = euler_to_quaternion(np.radians(attitude[:, 1]), np.radians(-attitude[:, 0]),
+                                         np.radians(-attitude[:, 2]))
+        np.savetxt(filename, np.column_stack((stamps, position, quaternion)), fmt='%.6f')
+
+
+# Quaternions (N, 4) as (qx, qy, qz, qw) from roll / pitch / yaw arrays (radians, applied z-y-x)
+def euler_to_quaternion(roll, pitch, yaw):
+    cr, sr = np.cos(roll / 2.0), np.sin(roll / 2.0)
+    cp, sp = np.cos(pitch / 2.0), np.sin(pitch / 2.0)
+    cy, sy = np.cos(yaw / 2.0), np.sin(yaw / 2.0)
+    return np.column_stack((sr * cp * cy - cr * sp * sy,
+                            cr * sp * cy + sr * cp * sy,
+                            cr * cp * sy - sr * sp * cy,
+                            cr * cp * cy + sr * sp * sy))
@@ -0,0 +1,31 @@
+###################################################
+#                 Text Histogram                  #
+#                                                 #
+#  Description: Plain text latency histograms     #
+#               for the measurement logs. Kept    #
+#               free of OpenCV so the manual      #
+#               control path can write its input  #
+#               latency log without loading the   #
+#               video modules.                    #
+###################################################
+
+# Required Imports
+import numpy as np
+
+# Default bin width (milliseconds) and longest bar (characters)
+BIN_WIDTH = 20
+BAR_WIDTH = 50
+
+
+# Text histogram of a list of latencies (seconds) with bins bin_width milliseconds wide
+def text_histogram(values, bin_width: float=BIN_WIDTH, bar_width: int=BAR_WIDTH):
+    values_ms = np.array(values) * 1000.0
+    lines = ["  n: %d  p50: %.1f ms  p90: %.1f ms  max: %.1f ms\n" % (
+        len(values_ms), np.percentile(values_ms, 50), np.percentile(values_ms, 90), values_ms.max())]
+    bottom = min(0, np.floor(values_ms.min() / bin_width) * bin_width)
+    top = max(bottom + bin_width, np.ceil(values_ms.max() / bin_width) * bin_width)
+    counts, edges = np.histogram(values_ms, bins=np.arange(bottom, top + bin_width, bin_width))
+    scale = bar_width / max(counts.max(), 1)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        lines.append("  %5g - %5g ms | %s %d\n" % (low, high, '#' * int(round(count * scale)), count))
+    return "".join(lines)
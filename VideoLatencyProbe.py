@@ -0,0 +1,238 @@
+###################################################
+#               Video Latency Probe               #
+#                                                 #
+#  Description: Measurement mode that estimates   #
+#               end-to-end video latency. Yaw     #
+#               steps are commanded while the     #
+#               image motion of every received    #
+#               frame is tracked; the first frame #
+#               that moves marks the onset. Each  #
+#               trial is split into command to    #
+#               frame (actuation, capture,        #
+#               encode, network and decode, up to #
+#               grab()), BGR conversion, queueing #
+#               and display stages and written    #
+#               out as histograms.                #
+###################################################
+
+# Required Imports
+import collections
+import threading
+import time
+import cv2
+import numpy as np
+from TextHistogram import text_histogram
+
+class VideoLatencyProbe:
+    """  CLASS CONSTANTS  """
+    # Size frames are shrunk to before measuring motion
+    MOTION_SIZE = (160, 120)
+
+    # Minimum image shift (pixels at MOTION_SIZE) counted as motion
+    MIN_SHIFT = 1.0
+
+    # Standard deviations above the resting noise counted as motion
+    NOISE_SIGMA = 4.0
+
+    # Seconds to hover before each trial (also measures resting noise)
+    SETTLE_TIME = 2.0
+
+    # Seconds to wait for motion after a command before giving up
+    ONSET_TIMEOUT = 3.0
+
+    # Seconds to wait for a cw/ccw command to leave the socket before the trial fails
+    SEND_TIMEOUT = 2.0
+
+    # Frames held while waiting for the display consumer
+    MAX_PENDING = 30
+
+    # Displayed frames whose stage times are remembered for onset lookups
+    MAX_STAGE_TIMES = 600
+
+    # Stage names, in pipeline order. OpenCV decodes inside grab(), so command_to_frame runs from the command
+    # to the decoded frame (actuation, capture, encode, network and decode) and convert is retrieve()'s BGR conversion
+    STAGES = ('command_to_frame', 'convert', 'queueing', 'display', 'total')
+
+    # Histogram bin width (ms)
+    BIN_WIDTH = 20
+
+    # Characters in the longest histogram bar
+    BAR_WIDTH = 50
+
+
+    def __init__(self, drone, video_stream=None):
+        self.drone = drone
+        self.video_stream = video_stream if video_stream is not None else drone.video_stream
+
+        # Per-frame motion records (grab_time, shift, seq), kept for the current trial
+        self.motion = []
+        self.prev_small = None
+        self.lock = threading.Lock()
+
+        # Frames waiting for the display consumer to show them
+        self.pending = collections.deque()
+        self.stage_times = collections.OrderedDict()
+
+        # Stage latencies of every frame (seconds) and of every trial
+        self.frame_stages = {stage: [] for stage in ('convert', 'queueing', 'display')}
+        self.trials = []
+
+
+    # Frame callback from the video stream (runs on the capture thread)
+    def on_frame(self, frame):
+        # Shift between this frame and the last one, from phase correlation of small gray images
+        small = cv2.resize(cv2.cvtColor(frame.image, cv2.COLOR_BGR2GRAY), self.MOTION_SIZE)
+        small = np.float32(small)
+        shift = 0.0
+        if self.prev_small is not None:
+            (dx, dy), response = cv2.phaseCorrelate(self.prev_small, small)
+            shift = float(np.hypot(dx, dy))
+        self.prev_small = small
+
+        with self.lock:
+            self.motion.append((frame.grab_time, shift, frame.seq))
+            self.pending.append(frame)
+            self._collect_displayed()
+
+
+    # Record stage times of frames the display consumer has finished with
+    def _collect_displayed(self):
+        shown = self.drone.last_frame_info
+        while self.pending:
+            frame = self.pending[0]
+            if frame.display_time is not None:
+                stages = (frame.grab_time, frame.convert_time, frame.pickup_time, frame.display_time)
+                self.stage_times[frame.seq] = stages
+                self.frame_stages['convert'].append(stages[1] - stages[0])
+                self.frame_stages['queueing'].append(stages[2] - stages[1])
+                self.frame_stages['display'].append(stages[3] - stages[2])
+            elif frame.pickup_time is None and shown is not None and shown.seq > frame.seq:
+                # The display consumer skipped this frame for a newer one
+                self.stage_times[frame.seq] = None
+            elif len(self.pending) <= self.MAX_PENDING:
+                break
+            self.pending.popleft()
+        while len(self.stage_times) > self.MAX_STAGE_TIMES:
+            self.stage_times.popitem(last=False)
+
+
+    # Send one yaw step and return the monotonic time the command left the socket, or None if it never went out
+    def _command_step(self, mode: str, direction: int, yaw_speed: int, step_time: float, degrees: int):
+        if mode == 'cw':
+            # cw/ccw block until the turn finishes, so send them from another thread
+            turn = self.drone.cw if direction > 0 else self.drone.ccw
+            thread = threading.Thread(target=turn, args=(degrees,))
+            thread.daemon = True
+            start = time.monotonic()
+            thread.start()
+            # last_known_command is set before the datagram goes out, so wait on the (command, time) pair set after it
+            command = ('cw ' if direction > 0 else 'ccw ') + str(degrees)
+            deadline = start + self.SEND_TIMEOUT
+            while time.monotonic() < deadline:
+                last_command, sent = self.drone.last_sent
+                if last_command == command and sent >= start:
+                    return sent
+                time.sleep(0.001)
+            return None
+        self.drone.rc_control(0, 0, 0, direction * yaw_speed)
+        sent = self.drone.last_command_time
+        time.sleep(step_time)
+        self.drone.rc_control(0, 0, 0, 0)
+        return sent
+
+
+    # Run a number of yaw-step trials (mode is 'rc' or 'cw'), drone must be flying and streaming
+    def run(self, trials: int=10, mode: str='rc', yaw_speed: int=50, step_time: float=0.5, degrees: int=30):
+        self.video_stream.subscribe(self.on_frame)
+        try:
+            for trial in range(trials):
+                # Hover and measure the resting image noise
+                with self.lock:
+                    self.motion = []
+                time.sleep(self.SETTLE_TIME)
+                with self.lock:
+                    resting = np.array([shift for grab_time, shift, seq in self.motion])
+                threshold = self.MIN_SHIFT
+                if len(resting) > 1:
+                    threshold = max(threshold, resting.mean() + self.NOISE_SIGMA * resting.std())
+
+                # Alternate directions so the drone ends up where it started
+                direction = 1 if trial % 2 == 0 else -1
+                sent = self._command_step(mode, direction, yaw_speed, step_time, degrees)
+                self.trials.append(None if sent is None else self._find_onset(sent, threshold))
+        finally:
+            self.video_stream.unsubscribe(self.on_frame)
+        return self.trials
+
+
+    # Wait for the first frame after the command whose motion exceeds the threshold
+    def _find_onset(self, sent: float, threshold: float):
+        deadline = time.monotonic() + self.ONSET_TIMEOUT
+        onset = None
+        while onset is None and time.monotonic() < deadline:
+            with self.lock:
+                for grab_time, shift, seq in self.motion:
+                    if grab_time > sent and shift > threshold:
+                        onset = seq
+                        break
+            time.sleep(0.01)
+        if onset is None:
+            return None
+
+        # Give the display consumer a moment to finish with the onset frame
+        while onset not in self.stage_times and time.monotonic() < deadline + 1.0:
+            time.sleep(0.005)
+        stages = self.stage_times.get(onset)
+        if stages is None:
+            return None
+
+        grab_time, convert_time, pickup_time, display_time = stages
+        return {'command_to_frame': grab_time - sent,
+                'convert': convert_time - grab_time,
+                'queueing': pickup_time - convert_time,
+                'display': display_time - pickup_time,
+                'total': display_time - sent}
+
+
+    # Text histogram of a list of latencies (seconds)
+    def _histogram(self, values):
+        return text_histogram(values, self.BIN_WIDTH, self.BAR_WIDTH)
+
+
+    # Save the trial and per-frame histograms to a local file for analysis
+    def save_histogram(self, filename: str='VideoLatencyLog.txt'):
+        detected = [trial for trial in self.trials if trial is not None]
+        with open(filename, 'w') as file:
+            file.write("Trials: " + str(len(self.trials)) + "  Motion Detected: " + str(len(detected)) + "\n\n")
+            for stage in self.STAGES:
+                file.write("Stage (command to display): " + stage + "\n")
+                if detected:
+                    file.write(self._histogram([trial[stage] for trial in detected]))
+                else:
+                    file.write("  No data\n")
+                file.write("\n")
+            for stage, values in self.frame_stages.items():
+                file.write("Stage (all frames): " + stage + "\n")
+                if values:
+                    file.write(self._histogram(values))
+                else:
+                    file.write("  No data\n")
+                file.write("\n")
+
+
+if __name__ == "__main__":
+    import DroneFlightController
+
+    # Connect, start the video and hover while the trials run
+    drone = DroneFlightController.DroneFlightController(show_log=False)
+    drone.streamon()
+    drone.takeoff()
+    drone.wait(3)
+
+    probe = VideoLatencyProbe(drone)
+    probe.run(trials=10, mode='rc')
+
+    drone.land()
+    probe.save_histogram()
+    drone.streamoff()
+    drone.close()
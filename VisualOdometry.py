@@ -0,0 +1,558 @@
+###################################################
+#                Visual Odometry                  #
+#                                                 #
+#  Description: Lightweight monocular visual      #
+#               odometry frontend that runs on    #
+#               the drone's frames. Follows the   #
+#               stages of rpg_svo: pyramid        #
+#               creation, grid bucketed FAST      #
+#               features, KLT tracking, essential #
+#               matrix initialization and PnP     #
+#               pose tracking. Map points are     #
+#               kept in a MapPointStore and       #
+#               picked back up by reprojection    #
+#               from the close keyframes. Stage   #
+#               timings are written to a          #
+#               trace.csv that the svo_analysis   #
+#               scripts can read.                 #
+###################################################
+
+# Required Imports
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import MapPointStore
+
+class VisualOdometry:
+    """  CLASS CONSTANTS  """
+    # Pyramid levels and window used for KLT tracking
+    PYRAMID_LEVELS = 3
+    KLT_WINDOW = (21, 21)
+    KLT_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+
+    # FAST corner threshold and grid cell size (pixels) for bucketing
+    FAST_THRESHOLD = 20
+    GRID_SIZE = 32
+
+    # Median disparity (pixels) between first frame and current needed to initialize
+    INIT_DISPARITY = 40.0
+
+    # Minimum features to initialize / track a pose
+    MIN_INIT_FEATURES = 50
+    MIN_POSE_FEATURES = 15
+
+    # Take a new keyframe when fewer map points than this are tracked
+    MIN_TRACKED = 80
+
+    # Fewer tracked map points than this count as a dropout, the frame scheduler then passes every frame
+    MIN_DROPOUT_TRACKED = 2 * MIN_POSE_FEATURES
+
+    # Tracked frames between keyframes at least, so new candidates get time to be promoted
+    KEYFRAME_INTERVAL = 5
+
+    # Ray angle (degrees) a candidate needs before it is triangulated
+    MIN_PARALLAX = 2.0
+
+    # Reprojection error (pixels) for RANSAC and triangulation checks
+    MAX_REPROJ_ERROR = 2.0
+
+    # Median scene depth after initialization (the map has no absolute scale)
+    MAP_SCALE = 1.0
+
+    # Timer and log columns of the rpg_svo trace file
+    TIMERS = ('pyramid_creation', 'sparse_img_align', 'reproject', 'reproject_kfs', 'reproject_candidates',
+              'feature_align', 'pose_optimizer', 'point_optimizer', 'local_ba', 'tot_time')
+    LOGS = ('timestamp', 'img_align_n_tracked', 'repr_n_mps', 'repr_n_new_references', 'sfba_thresh',
+            'sfba_error_init', 'sfba_error_final', 'sfba_n_edges_final', 'loba_n_erredges_init',
+            'loba_n_erredges_fin', 'loba_err_init', 'loba_err_fin', 'n_candidates', 'dropout')
+
+
+    def __init__(self, camera_matrix=None, undistorter=None, trace_dir: str=None, depth_filter=None, tracer=None):
+        # Either a fixed camera matrix or a CameraUndistorter (sparse mode is enough)
+        self.camera_matrix = camera_matrix
+        self.undistorter = undistorter
+
+        # Optional DepthFilter fed with rectified keyframes and tracked frames, its converged seeds join the map
+        self.depth_filter = depth_filter
+        self.size = None
+
+        self.detector = cv2.FastFeatureDetector_create(self.FAST_THRESHOLD, True)
+
+        # Optional trace file
+        self.trace_dir = trace_dir
+        self.trace_file = None
+
+        # Optional LatencyTracer, stage spans are tagged with the frame sequence number
+        self.tracer = tracer
+        self.trace_id = -1
+
+        # Stage timings (seconds) and log values of the last frame
+        self.timings = {}
+        self.logs = {}
+
+        self.reset()
+
+        # Initialize worker thread
+        self.running = False
+        self.worker_thread = None
+        self.lock = threading.Lock()
+
+
+    # Drop the map and start initializing again
+    def reset(self):
+        self.stage = 'first'
+        self.prev_pyramid = None
+
+        # Every map point, by keyframe, and the store id of the newest keyframe
+        self.map = MapPointStore.MapPointStore()
+        self.map_kf = None
+
+        # Tracked map points: current pixel positions, 3D world positions and map point ids
+        self.track_px = np.zeros((0, 2), np.float32)
+        self.track_xyz = np.zeros((0, 3))
+        self.track_ids = np.zeros(0, int)
+
+        # Candidates: current pixels, rectified pixels at their keyframe, and keyframe index
+        self.cand_px = np.zeros((0, 2), np.float32)
+        self.cand_origin = np.zeros((0, 2))
+        self.cand_kf = np.zeros(0, int)
+
+        # Keyframe poses (R, t) as world to camera transforms, and tracked frames since the last one
+        self.keyframes = []
+        self.since_keyframe = 0
+
+        # Current pose (world to camera)
+        self.R = np.eye(3)
+        self.t = np.zeros(3)
+
+        self.trajectory = []
+
+
+    # Start processing the newest frames of a DroneVideoStream on a worker thread
+    def start(self, video_stream):
+        self.running = True
+        self.worker_thread = threading.Thread(target=self._worker_thread, args=(video_stream,))
+        self.worker_thread.daemon = True
+        self.worker_thread.start()
+
+
+    # Stop the worker thread
+    def stop(self):
+        self.running = False
+
+
+    # Always process the newest frame, frames that arrive while busy are skipped
+    def _worker_thread(self, video_stream):
+        seq = 0
+        while self.running:
+            frame = video_stream.wait_for_frame(seq, 1.0)
+            if frame is None:
+                continue
+            seq = frame.seq
+            self.process_frame(frame)
+
+
+    # Process a DroneFrame (FrameScheduler consumer interface)
+    def process_frame(self, frame):
+        if self.tracer is None:
+            return self.process(frame.image, frame.grab_time)
+        self.trace_id = frame.seq
+        self.tracer.record('queue', frame.seq, frame.convert_time, self.tracer.now())
+        pose = self.process(frame.image, frame.grab_time)
+        if pose is not None:
+            self.tracer.link('pose', frame.seq, frame.grab_time)
+        return pose
+
+
+    # Whether every frame is needed right now: initializing, just took a keyframe or close to losing tracking
+    def needs_frames(self):
+        return (self.stage != 'tracking' or self.logs.get('dropout', 0) == 1
+                or len(self.track_px) < self.MIN_DROPOUT_TRACKED)
+
+
+    # Time a pipeline stage
+    def _start(self, name: str):
+        self.timings[name] = time.perf_counter()
+
+    def _stop(self, name: str):
+        self.timings[name] = time.perf_counter() - self.timings[name]
+        if self.tracer is not None:
+            self.tracer.record_duration('vo.' + name, self.trace_id, self.timings[name])
+
+
+    # Run one frame through the pipeline, returns the (R, t) world to camera pose or None
+    def process(self, image, stamp: float):
+        with self.lock:
+            self.timings = {name: 0.0 for name in self.TIMERS}
+            self.logs = {name: 0 for name in self.LOGS}
+            self.logs['timestamp'] = stamp
+            self.logs['repr_n_mps'] = -1
+            self._start('tot_time')
+
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if self.size is None:
+                self.size = (gray.shape[1], gray.shape[0])
+                if self.camera_matrix is None:
+                    self.camera_matrix = self.undistorter.camera_matrix(self.size)
+
+            # Image pyramid, reused as the previous pyramid on the next frame
+            self._start('pyramid_creation')
+            pyramid = [gray]
+            for level in range(self.PYRAMID_LEVELS):
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+            self._stop('pyramid_creation')
+
+            pose = None
+            if self.stage == 'first':
+                self._add_keyframe(gray)
+                self.stage = 'init'
+            else:
+                self._track(pyramid)
+                if self.stage == 'init':
+                    pose = self._initialize(gray)
+                else:
+                    pose = self._track_pose(gray)
+
+            self.prev_pyramid = pyramid
+            self._stop('tot_time')
+            self.logs['n_candidates'] = len(self.cand_px)
+
+            if pose is not None:
+                self.trajectory.append((stamp, self.R.copy(), self.t.copy()))
+            self._write_trace()
+            return pose
+
+
+    # KLT track all map points and candidates from the previous frame in one pass
+    def _track(self, pyramid):
+        self._start('sparse_img_align')
+        n_track = len(self.track_px)
+        points = np.concatenate((self.track_px, self.cand_px)).astype(np.float32)
+        if len(points) > 0:
+            # Coarse to fine over our own pyramid, so it isn't rebuilt inside calcOpticalFlowPyrLK
+            moved = points / 2 ** self.PYRAMID_LEVELS
+            for level in range(self.PYRAMID_LEVELS, -1, -1):
+                start = (points / 2 ** level).reshape(-1, 1, 2)
+                moved, status, err = cv2.calcOpticalFlowPyrLK(self.prev_pyramid[level], pyramid[level], start,
+                                                              moved.reshape(-1, 1, 2).astype(np.float32),
+                                                              winSize=self.KLT_WINDOW, maxLevel=0,
+                                                              criteria=self.KLT_CRITERIA,
+                                                              flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+                moved = moved.reshape(-1, 2)
+                if level > 0:
+                    moved = moved * 2
+            ok = (status.ravel() == 1) & np.all(moved >= 0, axis=1) & (moved[:, 0] < self.size[0]) & (moved[:, 1] < self.size[1])
+            self.track_xyz = self.track_xyz[ok[:n_track]]
+            self.track_ids = self.track_ids[ok[:n_track]]
+            self.track_px = moved[:n_track][ok[:n_track]]
+            self.cand_origin = self.cand_origin[ok[n_track:]]
+            self.cand_kf = self.cand_kf[ok[n_track:]]
+            self.cand_px = moved[n_track:][ok[n_track:]]
+        self._stop('sparse_img_align')
+        self.logs['img_align_n_tracked'] = len(self.track_px)
+
+
+    # Rectified pixel coordinates of distorted ones
+    def _rectify(self, points):
+        if self.undistorter is None:
+            return np.asarray(points, np.float64).reshape(-1, 2)
+        return self.undistorter.undistort_points(points, self.size)
+
+
+    # Distorted pixel coordinates of rectified ones
+    def _distort(self, points):
+        if self.undistorter is None:
+            return np.asarray(points, np.float64).reshape(-1, 2)
+        return self.undistorter.distort_points(points, self.size)
+
+
+    # Rectified image for the depth filter, which models the pinhole camera_matrix
+    def _rectify_image(self, gray):
+        if self.undistorter is None:
+            return gray
+        return self.undistorter.undistort(gray)
+
+
+    # Grid cell index of each pixel
+    def _cells(self, points):
+        cols = int(np.ceil(self.size[0] / self.GRID_SIZE))
+        return (points[:, 1] // self.GRID_SIZE).astype(int) * cols + (points[:, 0] // self.GRID_SIZE).astype(int)
+
+
+    # Start tracking map points at the given pixels, points without ids are added to the map first
+    def _add_tracked(self, px, xyz, ids=None):
+        if ids is None:
+            ids = self.map.add_points(self.map_kf, xyz)
+        self.track_px = np.concatenate((self.track_px, px)).astype(np.float32)
+        self.track_xyz = np.concatenate((self.track_xyz, xyz))
+        self.track_ids = np.concatenate((self.track_ids, ids))
+
+
+    # FAST corners in grid cells that don't already hold a feature, strongest per cell
+    def _detect(self, gray):
+        keypoints = self.detector.detect(gray)
+        if len(keypoints) == 0:
+            return np.zeros((0, 2), np.float32)
+        points = np.array([kp.pt for kp in keypoints], np.float32)
+        response = np.array([kp.response for kp in keypoints])
+
+        cells = self._cells(points)
+        taken = self._cells(np.concatenate((self.track_px, self.cand_px)))
+
+        # Sort by strength so np.unique's first index is the best corner of each cell
+        order = np.argsort(-response)
+        cells, points = cells[order], points[order]
+        keep = ~np.isin(cells, taken)
+        cells, points = cells[keep], points[keep]
+        first = np.unique(cells, return_index=True)[1]
+        return points[first]
+
+
+    # Make the current frame a keyframe and fill empty cells with new candidates
+    def _add_keyframe(self, gray):
+        self.keyframes.append((self.R.copy(), self.t.copy()))
+        self.since_keyframe = 0
+
+        # The map keyframe sees every tracked point, keyframes far from the camera are dropped
+        self.map_kf = self.map.add_keyframe(self.R, self.t)
+        self.map.add_observations(self.map_kf, self.track_ids)
+        self.map.cull_keyframes(self.R, self.t)
+
+        new = self._detect(gray)
+        origin = self._rectify(new)
+        self.cand_px = np.concatenate((self.cand_px, new)).astype(np.float32)
+        self.cand_origin = np.concatenate((self.cand_origin, origin))
+        self.cand_kf = np.concatenate((self.cand_kf, np.full(len(new), len(self.keyframes) - 1, int)))
+        self.logs['dropout'] = 1
+
+        # Seed the depth filter once the map gives a depth range
+        if self.depth_filter is not None and len(self.track_xyz) > 0:
+            depth = (self.track_xyz @ self.R.T + self.t)[:, 2]
+            self.depth_filter.add_keyframe(self._rectify_image(gray), self.R.copy(), self.t.copy(), origin,
+                                           np.median(depth), max(np.min(depth), 1e-3))
+
+
+    # Two-view initialization from the essential matrix between the first keyframe and now
+    def _initialize(self, gray):
+        if len(self.cand_px) < self.MIN_INIT_FEATURES:
+            self.reset()
+            return None
+        ref = self.cand_origin
+        cur = self._rectify(self.cand_px)
+        if np.median(np.linalg.norm(cur - ref, axis=1)) < self.INIT_DISPARITY:
+            return None
+
+        self._start('pose_optimizer')
+        K = self.camera_matrix
+        E, mask = cv2.findEssentialMat(ref, cur, K, cv2.RANSAC, 0.999, self.MAX_REPROJ_ERROR)
+        if E is None or E.shape != (3, 3):
+            self._stop('pose_optimizer')
+            return None
+        inliers, R, t, mask = cv2.recoverPose(E, ref, cur, K, mask=mask)
+        self._stop('pose_optimizer')
+        if inliers < self.MIN_INIT_FEATURES:
+            return None
+
+        # Triangulate the inliers and keep those in front of both cameras
+        self._start('point_optimizer')
+        xyz = self._triangulate(np.eye(3), np.zeros(3), R, t.ravel(), ref, cur)
+        good = (mask.ravel() > 0) & (xyz[:, 2] > 0) & ((xyz @ R.T + t.ravel())[:, 2] > 0)
+        self._stop('point_optimizer')
+        if np.count_nonzero(good) < self.MIN_INIT_FEATURES:
+            return None
+
+        # Fix the map scale by the median depth
+        scale = self.MAP_SCALE / np.median(xyz[good, 2])
+        self._add_tracked(self.cand_px[good], xyz[good] * scale)
+        self.R = R
+        self.t = t.ravel() * scale
+
+        # Old candidates are dropped, the current frame becomes the second keyframe
+        self.cand_px = np.zeros((0, 2), np.float32)
+        self.cand_origin = np.zeros((0, 2))
+        self.cand_kf = np.zeros(0, int)
+        self._add_keyframe(gray)
+        self.stage = 'tracking'
+        self.logs['repr_n_mps'] = len(self.track_px)
+        return self.R, self.t
+
+
+    # Linear triangulation of matched rectified pixels between two poses
+    def _triangulate(self, R0, t0, R1, t1, px0, px1):
+        K = self.camera_matrix
+        P0 = K @ np.hstack((R0, t0.reshape(3, 1)))
+        P1 = K @ np.hstack((R1, t1.reshape(3, 1)))
+        X = cv2.triangulatePoints(P0, P1, px0.T.astype(np.float64), px1.T.astype(np.float64))
+        w = np.where(np.abs(X[3]) > 1e-12, X[3], 1e-12)
+        return (X[:3] / w).T
+
+
+    # PnP pose from the tracked map points, then promote candidates and take keyframes
+    def _track_pose(self, gray):
+        if len(self.track_px) < self.MIN_POSE_FEATURES:
+            self.reset()
+            return None
+
+        self._start('reproject')
+        rvec, _ = cv2.Rodrigues(self.R)
+        tvec = self.t.reshape(3, 1).copy()
+        ok, rvec, tvec, inliers = cv2.solvePnPRansac(self.track_xyz, self._rectify(self.track_px), self.camera_matrix,
+                                                     None, rvec, tvec, useExtrinsicGuess=True, iterationsCount=50,
+                                                     reprojectionError=self.MAX_REPROJ_ERROR)
+        self._stop('reproject')
+        if not ok or inliers is None or len(inliers) < self.MIN_POSE_FEATURES:
+            self.reset()
+            return None
+
+        # Outliers are dropped from tracking
+        keep = np.zeros(len(self.track_px), bool)
+        keep[inliers.ravel()] = True
+        self.track_px = self.track_px[keep]
+        self.track_xyz = self.track_xyz[keep]
+        self.track_ids = self.track_ids[keep]
+        self.R = cv2.Rodrigues(rvec)[0]
+        self.t = tvec.ravel()
+        self.logs['repr_n_mps'] = len(self.track_px)
+        self.logs['sfba_n_edges_final'] = len(self.track_px)
+
+        self._start('reproject_candidates')
+        self._promote_candidates()
+        self._stop('reproject_candidates')
+
+        if self.depth_filter is not None:
+            self.depth_filter.add_frame(self._rectify_image(gray), self.R.copy(), self.t.copy())
+            self._add_converged()
+
+        # Few points left: pick lost map points back up from the close keyframes, then take a keyframe if still short
+        self.since_keyframe += 1
+        if len(self.track_px) < self.MIN_TRACKED:
+            self._start('reproject_kfs')
+            self._reproject_map()
+            if len(self.track_px) < self.MIN_TRACKED and self.since_keyframe >= self.KEYFRAME_INTERVAL:
+                self._add_keyframe(gray)
+            self._stop('reproject_kfs')
+        return self.R, self.t
+
+
+    # Track map points of the close keyframes that project into grid cells no tracked point covers
+    def _reproject_map(self):
+        ids, px = self.map.select_candidates(self.R, self.t, self.camera_matrix, self.size, self.GRID_SIZE)
+        untracked = ~np.isin(ids, self.track_ids)
+        ids, px = ids[untracked], self._distort(px[untracked])
+        inside = np.all(px >= 0, axis=1) & (px[:, 0] < self.size[0]) & (px[:, 1] < self.size[1])
+        ids, px = ids[inside], px[inside]
+        free = ~np.isin(self._cells(px), self._cells(self.track_px))
+        self._add_tracked(px[free], self.map.positions[ids[free]], ids[free])
+        self.logs['repr_n_mps'] = len(self.track_px)
+
+
+    # Add points the depth filter converged on to the map and track them where they are visible now
+    def _add_converged(self):
+        xyz, _ = self.depth_filter.pop_converged()
+        if len(xyz) == 0:
+            return
+        cam = xyz @ self.R.T + self.t
+        front = cam[:, 2] > 0
+        xyz, cam = xyz[front], cam[front]
+        proj = cam @ self.camera_matrix.T
+        px = self._distort(proj[:, :2] / proj[:, 2:])
+        inside = np.all(px >= 0, axis=1) & (px[:, 0] < self.size[0]) & (px[:, 1] < self.size[1])
+        px, xyz = px[inside], xyz[inside]
+
+        # Seeds start at candidate corners, skip grid cells a promoted candidate already covers
+        free = ~np.isin(self._cells(px), self._cells(self.track_px))
+        self._add_tracked(px[free], xyz[free])
+        self.logs['repr_n_new_references'] += int(np.count_nonzero(free))
+
+
+    # Triangulate candidates with enough parallax and move them to the tracked map points
+    def _promote_candidates(self):
+        if len(self.cand_px) == 0:
+            return
+        K_inv = np.linalg.inv(self.camera_matrix)
+        cur = self._rectify(self.cand_px)
+        promoted = np.zeros(len(cur), bool)
+        new_xyz = np.zeros((len(cur), 3))
+
+        for kf in np.unique(self.cand_kf):
+            R_kf, t_kf = self.keyframes[kf]
+            index = np.nonzero(self.cand_kf == kf)[0]
+            origin = self.cand_origin[index]
+
+            # Angle between the two viewing rays in the world frame
+            ray_kf = np.hstack((origin, np.ones((len(index), 1)))) @ K_inv.T @ R_kf
+            ray_cur = np.hstack((cur[index], np.ones((len(index), 1)))) @ K_inv.T @ self.R
+            cos = np.sum(ray_kf * ray_cur, axis=1) / (np.linalg.norm(ray_kf, axis=1) * np.linalg.norm(ray_cur, axis=1))
+            wide = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0))) > self.MIN_PARALLAX
+            if not np.any(wide):
+                continue
+            index, origin = index[wide], origin[wide]
+
+            # Keep points in front of both cameras that reproject well
+            xyz = self._triangulate(R_kf, t_kf, self.R, self.t, origin, cur[index])
+            cam_kf = xyz @ R_kf.T + t_kf
+            cam_cur = xyz @ self.R.T + self.t
+            proj = cam_cur @ self.camera_matrix.T
+            depth = np.where(proj[:, 2] > 0, proj[:, 2], 1.0)
+            error = np.linalg.norm(proj[:, :2] / depth[:, None] - cur[index], axis=1)
+            good = (cam_kf[:, 2] > 0) & (cam_cur[:, 2] > 0) & (error < self.MAX_REPROJ_ERROR)
+            promoted[index[good]] = True
+            new_xyz[index[good]] = xyz[good]
+
+        self._add_tracked(self.cand_px[promoted], new_xyz[promoted])
+        self.cand_px = self.cand_px[~promoted]
+        self.cand_origin = self.cand_origin[~promoted]
+        self.cand_kf = self.cand_kf[~promoted]
+        self.logs['repr_n_new_references'] = int(np.count_nonzero(promoted))
+
+
+    # Append this frame's timers and logs to trace.csv
+    def _write_trace(self):
+        if self.trace_dir is None:
+            return
+        if self.trace_file is None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            self.trace_file = open(os.path.join(self.trace_dir, 'trace.csv'), 'w')
+            self.trace_file.write(','.join(self.TIMERS + self.LOGS) + '\n')
+        row = [repr(float(self.timings[name])) for name in self.TIMERS]
+        row += [repr(float(self.logs[name])) for name in self.LOGS]
+        self.trace_file.write(','.join(row) + '\n')
+
+
+    # Save the camera trajectory as "stamp tx ty tz qx qy qz qw" (camera in world frame)
+    def save_trajectory(self, filename: str='traj_estimate.txt'):
+        with open(filename, 'w') as file:
+            for stamp, R, t in self.trajectory:
+                R_wc = R.T
+                p = -R_wc @ t
+                q = rotation_to_quaternion(R_wc)
+                file.write('%.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f\n' % (stamp, p[0], p[1], p[2], q[0], q[1], q[2], q[3]))
+
+
+    # Flush and close the trace file
+    def close(self):
+        self.stop()
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+# Convert a rotation matrix to a unit quaternion (qx, qy, qz, qw)
+def rotation_to_quaternion(R):
+    trace = R[0, 0] + R[1, 1] + R[2, 2]
+    if trace > 0:
+        s = 2.0 * np.sqrt(trace + 1.0)
+        q = ((R[2, 1] - R[1, 2]) / s, (R[0, 2] - R[2, 0]) / s, (R[1, 0] - R[0, 1]) / s, 0.25 * s)
+    elif R[0, 0] > R[1, 1] and R[0, 0] > R[2, 2]:
+        s = 2.0 * np.sqrt(1.0 + R[0, 0] - R[1, 1] - R[2, 2])
+        q = (0.25 * s, (R[0, 1] + R[1, 0]) / s, (R[0, 2] + R[2, 0]) / s, (R[2, 1] - R[1, 2]) / s)
+    elif R[1, 1] > R[2, 2]:
+        s = 2.0 * np.sqrt(1.0 + R[1, 1] - R[0, 0] - R[2, 2])
+        q = ((R[0, 1] + R[1, 0]) / s, 0.25 * s, (R[1, 2] + R[2, 1]) / s, (R[0, 2] - R[2, 0]) / s)
+    else:
+        s = 2.0 * np.sqrt(1.0 + R[2, 2] - R[0, 0] - R[1, 1])
+        q = ((R[0, 2] + R[2, 0]) / s, (R[1, 2] + R[2, 1]) / s, 0.25 * s, (R[1, 0] - R[0, 1]) / s)
+    q = np.array(q)
+    return q / np.linalg.norm(q)
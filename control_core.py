@@ -0,0 +1,208 @@
+"""
+Description:
+    This module contains the DroneControlCore class, the part of the Xbox controller GUI that flies the drone. It owns
+    the drone connection, the controller, the RC sender thread, takeoff/land handling and a telemetry cache, and runs
+    without any window. A view such as GameControllerGUI only reads the frame reader and the telemetry snapshot at its
+    own pace, so a minimized, dragged or slow window never holds up control. Blocking drone commands such as
+    takeoff and land run one at a time on the CommandExecutor's single worker thread.
+"""
+import queue
+import threading
+import time
+from djitellopy import tello
+from MjpegServer import MjpegServer
+from PreviewStream import PreviewStream
+from xbox_one_controller import XboxController
+from rc_sender import RCSender
+
+
+class CommandExecutor(object):
+    # Most commands waiting to run, submissions beyond this are refused
+    MAX_PENDING = 8
+
+    def __init__(self, max_pending=MAX_PENDING):
+        """Create the executor and start its worker thread."""
+        self.commands = queue.Queue(max_pending)
+        self.pending = set()  # keys of commands waiting in the queue
+        self.running_key = None  # key of the command the worker is running
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'coalesced': 0, 'refused': 0, 'completed': 0, 'failed': 0}
+
+        self._worker_thread = threading.Thread(target=self._worker, args=())
+        self._worker_thread.daemon = True
+        self._worker_thread.start()
+
+    def submit(self, key, command):
+        """Queue command() to run on the worker thread without waiting for it. A command whose key is already
+           waiting is coalesced into that one (it reads its arguments when it runs). Returns False if refused."""
+        with self.lock:
+            if key in self.pending:
+                self.stats['coalesced'] += 1
+                return True
+            try:
+                self.commands.put_nowait((key, command))
+            except queue.Full:
+                self.stats['refused'] += 1
+                print(f"Command executor is full, dropped command: {key}")
+                return False
+            self.pending.add(key)
+            self.stats['submitted'] += 1
+            return True
+
+    def busy(self, key):
+        """Whether a command with this key is waiting or running."""
+        with self.lock:
+            return key in self.pending or self.running_key == key
+
+    def _worker(self):
+        """Run the queued commands one at a time."""
+        while True:
+            key, command = self.commands.get()
+            with self.lock:
+                self.pending.discard(key)
+                self.running_key = key
+            try:
+                command()
+                self.stats['completed'] += 1
+            except Exception as commandException:
+                self.stats['failed'] += 1
+                print(f"Exception occurred when running command {key}.\ncommandException: {commandException}")
+            finally:
+                with self.lock:
+                    self.running_key = None
+
+
+class DroneControlCore(object):
+    # Telemetry cache refreshes per second
+    TELEMETRY_RATE = 5.0
+
+    def __init__(self, drone=None, controller=None, preview_size=PreviewStream.SIZE, grayscale=False, serve_port=None,
+                 serve_host=MjpegServer.HOST):
+        """Connect to the drone (a djitellopy Tello unless one is given), start its video stream and prepare the
+           joystick control. Viewers share one reduced preview of the video of preview_size, optionally grayscale,
+           which is also served to browsers at http://<serve_host>:serve_port/ when a port is given. The server only
+           listens on this machine unless another serve_host ('' for every interface) is given."""
+        self.xbox_controller = controller if controller is not None else XboxController()
+
+        # Prepare our drone object
+        if drone is None:
+            drone = tello.Tello()  # Initialize the drone
+            drone.connect()  # Connect to the drone
+            drone.streamon()  # Turn on the drones video stream
+        self.drone = drone
+
+        # Frame reader the views display from
+        self.frame_read = self.drone.get_frame_read()
+        self.preview = PreviewStream(self.frame_read, preview_size, grayscale)
+        self.preview_server = None if serve_port is None else MjpegServer(self.preview, serve_host, serve_port)
+
+        # RC values are sent from their own thread as soon as the joysticks change
+        self.rc_sender = RCSender(self.xbox_controller, self.drone.send_rc_control)
+        self.start_pressed = False  # last seen state of the start button, to act on presses only
+
+        # Takeoff and land run on a single worker; presses only move the flying state we want to reach
+        self.executor = CommandExecutor()
+        self.target_flying = self.drone.is_flying
+
+        # Latest telemetry, replaced as a whole so views never see a half-updated dict
+        self.telemetry = {'battery': None, 'height': None, 'rc': (0, 0, 0, 0), 'latency_ms': None, 'stamp': None}
+
+        self._running = False
+        self._stopped = threading.Event()
+        self._telemetry_thread = None
+
+    def start(self):
+        """Start the RC sender, the start button listener and the telemetry thread."""
+        self._running = True
+        self._stopped.clear()
+        self.xbox_controller.add_listener(self.on_controller_change)
+        self.rc_sender.start()
+        self.preview.start()
+        if self.preview_server is not None:
+            self.preview_server.start()
+        self._telemetry_thread = threading.Thread(target=self._telemetry_loop, args=())
+        self._telemetry_thread.daemon = True
+        self._telemetry_thread.start()
+
+    def run(self):
+        """Fly without a window until stop() is called (or Ctrl-C)."""
+        self.start()
+        try:
+            self._stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop control, leave the drone hovering and save the input latency histograms."""
+        if not self._running:
+            return
+        self._running = False
+        self._stopped.set()
+        self.xbox_controller.remove_listener(self.on_controller_change)
+        self.rc_sender.stop()
+        if self.preview_server is not None:
+            self.preview_server.stop()
+        self.preview.stop()
+        self.rc_sender.save_histogram()
+
+    def takeoff_land(self):
+        """Toggle the flying state we want and let the executor reach it. Presses made while a takeoff or land is
+           waiting or running toggle the target again instead of queueing another command, so a double press before
+           the worker gets to it cancels out and a press during takeoff lands right after it."""
+        busy = self.executor.busy('takeoff_land')
+        self.target_flying = not (self.target_flying if busy else self.drone.is_flying)
+        self.executor.submit('takeoff_land', self._reach_target)
+
+    def _reach_target(self):
+        """Executor command: take off or land if the drone isn't in the target flying state."""
+        target = self.target_flying
+        if target and not self.drone.is_flying:
+            self.drone.takeoff()
+        elif not target and self.drone.is_flying:
+            self.drone.land()
+
+    def on_controller_change(self, state):
+        """Controller change listener (runs on the controller's monitor thread) that toggles takeoff/land when the
+           start button goes down."""
+        try:
+            start_button = state.Start
+            if start_button and not self.start_pressed:
+                self.takeoff_land()  # Call the takeoff/land method if the start button is pressed
+            self.start_pressed = bool(start_button)
+
+        # Handle exceptions that may occur during joystick update
+        except Exception as joystickUpdateException:
+            print(f"Exception occurred when updating joystick values.\nJoystickUpdateException: {joystickUpdateException}")
+
+    def _telemetry_loop(self):
+        """Refresh the telemetry cache at TELEMETRY_RATE."""
+        while self._running:
+            try:
+                stats = self.rc_sender.latency_stats()
+                self.telemetry = {'battery': self.drone.get_battery(), 'height': self.drone.get_height(),
+                                  'rc': self.rc_sender.last_rc or (0, 0, 0, 0),
+                                  'latency_ms': None if stats is None else stats['latency_p50'],
+                                  'stamp': time.monotonic()}
+            except Exception as telemetryException:
+                print(f"Exception occurred when updating telemetry.\ntelemetryException: {telemetryException}")
+            self._stopped.wait(1.0 / self.TELEMETRY_RATE)
+
+    def end(self):
+        """Stop control and close the drone connection."""
+        self.stop()
+        self.drone.end()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Fly with the Xbox controller without any window
+    #   python control_core.py [serve_port [serve_host]] also serves the video at http://<serve_host>:<serve_port>/
+    #   (this machine only unless a host is given, '0.0.0.0' lets anyone on the network watch)
+    serve_port = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    serve_host = sys.argv[2] if len(sys.argv) > 2 else MjpegServer.HOST
+    core = DroneControlCore(serve_port=serve_port, serve_host=serve_host)
+    core.run()
+    core.end()
@@ -19,6 +19,7 @@
 
 # Imports:
 import DroneFlightController
+import KeepaliveScheduler
 import threading
 import keyboard
 
@@ -34,6 +35,10 @@ if __name__ == "__main__":
     # Setup a new drone object and establish a connection to the drone
     drone = DroneFlightController.DroneFlightController()
 
+    # Keep the drone from auto-landing during long pauses between commands
+    keepalive = KeepaliveScheduler.KeepaliveScheduler(drone)
+    keepalive.start()
+
     # Create a thread to listen for keyboard input continuously
     key_thread = threading.Thread(target=key_listener, daemon=True)
     key_thread.start()
@@ -0,0 +1,180 @@
+"""
+Description:
+    This module contains the RCSender class which sends the joystick RC values to the drone from its own thread.
+    It wakes up on controller change events instead of polling, sends immediately when the sticks moved by a
+    significant amount and otherwise repeats the current values at a steady keepalive rate, so manual control does
+    not depend on the Tk main loop. Every send records how long the input it carries took to get from the gamepad
+    to the datagram, and how evenly spaced the sends are.
+"""
+import threading
+import time
+import numpy as np
+from TextHistogram import text_histogram
+
+
+class RCSender(object):
+    # Smallest change on any channel (rc units) that is sent right away
+    SEND_THRESHOLD = 3
+
+    # Rate (Hz) the current values are repeated at when nothing changes
+    KEEPALIVE_RATE = 10.0
+
+    # Never send faster than this (Hz), bursts of changes are coalesced into the newest values
+    MAX_RATE = 50.0
+
+    # Sends kept for the latency and jitter statistics
+    HISTORY = 4096
+
+    # Histogram bin width (ms)
+    BIN_WIDTH = 1
+
+    def __init__(self, controller, send_rc_control, send_threshold=SEND_THRESHOLD, keepalive_rate=KEEPALIVE_RATE,
+                 max_rate=MAX_RATE):
+        """Create the sender for an XboxController. send_rc_control is called as send_rc_control(lr, fb, ud, yaw),
+           e.g. a djitellopy Tello's send_rc_control or DroneFlightController.rc_control."""
+        self.controller = controller
+        self.send_rc_control = send_rc_control
+        self.send_threshold = send_threshold
+        self.keepalive_period = 1.0 / keepalive_rate
+        self.min_interval = 1.0 / max_rate
+
+        # Last values sent and when (perf_counter seconds)
+        self.last_rc = None
+        self.last_send = 0.0
+        self.sends = 0
+
+        # Instrumentation rings: input to datagram latency (first send of each new snapshot), time the input waited
+        # in the OS before it was read, and the spacing of keepalive sends relative to the keepalive period (seconds)
+        self.last_seq = None
+        self.latency = np.zeros(self.HISTORY)
+        self.input_delay = np.full(self.HISTORY, np.nan)
+        self.latency_count = 0
+        self.jitter = np.zeros(self.HISTORY)
+        self.jitter_count = 0
+
+        # Set by the controller's monitor thread, cleared by the sender thread
+        self._changed = threading.Event()
+        self._running = False
+        self._sender_thread = None
+
+    def start(self):
+        """Subscribe to controller changes and start the sender thread."""
+        self._running = True
+        self.controller.add_listener(self._on_change)
+        self._sender_thread = threading.Thread(target=self._send_loop, args=())
+        self._sender_thread.daemon = True
+        self._sender_thread.start()
+
+    def stop(self):
+        """Stop the sender thread and leave the drone hovering."""
+        self._running = False
+        self.controller.remove_listener(self._on_change)
+        self._changed.set()
+        if self._sender_thread is not None:
+            self._sender_thread.join()
+        self.send((0, 0, 0, 0))
+
+    def _on_change(self, state):
+        """Controller change listener, only wakes the sender thread which reads the newest snapshot itself."""
+        self._changed.set()
+
+    @staticmethod
+    def rc_from_state(state):
+        """Map the joysticks to the RC channels: right stick moves (lr, fb), left stick climbs and yaws (ud, yaw)."""
+        return state.RightJoystickX, state.RightJoystickY, state.LeftJoystickY, state.LeftJoystickX
+
+    def read_rc(self):
+        """Return the RC values for the current controller snapshot."""
+        return self.rc_from_state(self.controller.snapshot())
+
+    def _send_loop(self):
+        """Wait for a change or the next keepalive, then send if the change is significant or a keepalive is due."""
+        while self._running:
+            timeout = self.last_send + self.keepalive_period - time.perf_counter()
+            if timeout > 0:
+                self._changed.wait(timeout)
+            if not self._running:
+                break
+            self._changed.clear()
+
+            state = self.controller.snapshot()
+            rc = self.rc_from_state(state)
+            now = time.perf_counter()
+            significant = self._significant(rc)
+            if not significant and now - self.last_send < self.keepalive_period:
+                continue
+
+            # Hold back until the minimum interval has passed, then send the newest values
+            wait = self.last_send + self.min_interval - now
+            if wait > 0:
+                time.sleep(wait)
+                state = self.controller.snapshot()
+                rc = self.rc_from_state(state)
+            self.send(rc, state, keepalive=not significant)
+
+    def _significant(self, rc):
+        """Whether the values differ enough from the last ones sent (returning to hover always counts)."""
+        if self.last_rc is None:
+            return True
+        if rc == (0, 0, 0, 0):
+            return self.last_rc != rc
+        return max(abs(a - b) for a, b in zip(rc, self.last_rc)) >= self.send_threshold
+
+    def send(self, rc, state=None, keepalive=False):
+        """Send one set of RC values, recording latency for the snapshot they came from."""
+        previous = self.last_send
+        self.send_rc_control(*rc)
+        sent = time.monotonic()
+        self.last_rc = rc
+        self.last_send = time.perf_counter()
+        self.sends += 1
+
+        # Input to datagram latency, once per snapshot (keepalive repeats carry no new input)
+        if state is not None and state.seq != self.last_seq and state.seq > 0:
+            index = self.latency_count % self.HISTORY
+            self.latency[index] = sent - state.stamp
+            self.input_delay[index] = np.nan if state.input_delay is None else state.input_delay
+            self.latency_count += 1
+        if state is not None:
+            self.last_seq = state.seq
+
+        # How far a keepalive send landed from its planned time
+        if keepalive and previous > 0:
+            self.jitter[self.jitter_count % self.HISTORY] = self.last_send - previous - self.keepalive_period
+            self.jitter_count += 1
+
+    def latency_stats(self):
+        """Return input to send latency and keepalive jitter percentiles in milliseconds (None before any data)."""
+        count = min(self.latency_count, self.HISTORY)
+        if count == 0:
+            return None
+        latency = self.latency[:count] * 1000.0
+        stats = {'sends': self.sends, 'inputs': self.latency_count,
+                 'latency_p50': float(np.percentile(latency, 50)), 'latency_p99': float(np.percentile(latency, 99))}
+        jitter_count = min(self.jitter_count, self.HISTORY)
+        if jitter_count:
+            jitter = np.abs(self.jitter[:jitter_count]) * 1000.0
+            stats['jitter_p50'] = float(np.percentile(jitter, 50))
+            stats['jitter_p99'] = float(np.percentile(jitter, 99))
+        return stats
+
+    def save_histogram(self, filename='InputLatencyLog.txt'):
+        """Write histograms of the input to datagram latency, the OS input delay, their sum and the keepalive
+           jitter to a local file."""
+        count = min(self.latency_count, self.HISTORY)
+        latency = self.latency[:count]
+        delay = self.input_delay[:count]
+        known = ~np.isnan(delay)
+        sections = [('Gamepad read to datagram sent', latency),
+                    ('Input waiting in the OS before it was read', delay[known]),
+                    ('Gamepad event to datagram sent', latency[known] + delay[known]),
+                    ('Keepalive send jitter', self.jitter[:min(self.jitter_count, self.HISTORY)])]
+        with open(filename, 'w') as file:
+            file.write("Sends: " + str(self.sends) + "  Inputs: " + str(self.latency_count) + "\n\n")
+            for title, values in sections:
+                file.write(title + "\n")
+                if len(values):
+                    file.write(text_histogram(values, self.BIN_WIDTH))
+                else:
+                    file.write("  No data\n")
+                file.write("\n")
@@ -4,12 +4,24 @@ date: 1/30/24
 Description:
     This module contains the XboxController class used for receiving inputs from an Xbox one game controller,
     normalizing the values returned from the joystick input and filtering any low values from these to exclude
-    noise.
+    noise. The raw event stream can be recorded to a compact file and played back through GamepadReplay in place of
+    the real gamepad.
 """
 import time
 from inputs import get_gamepad
 import math
+import struct
 import threading
+from collections import namedtuple
+
+# Controller input fields in the order read() returns them
+FIELDS = ('LeftJoystickX', 'LeftJoystickY', 'RightJoystickX', 'RightJoystickY', 'LeftTrigger', 'RightTrigger',
+          'LeftBumper', 'RightBumper', 'A', 'X', 'Y', 'B', 'LeftThumb', 'RightThumb', 'Back', 'Start',
+          'LeftDPad', 'RightDPad', 'UpDPad', 'DownDPad')
+
+# Immutable snapshot of every input plus its sequence number, the monotonic time the events that produced it were
+# read, and how long the oldest of those events had been waiting in the OS before that (None if unknown)
+ControllerState = namedtuple('ControllerState', FIELDS + ('seq', 'stamp', 'input_delay'))
 
 
 class XboxController(object):
@@ -17,30 +29,49 @@ class XboxController(object):
     MAX_TRIG_VAL = math.pow(2, 8)
     MAX_JOY_VAL = math.pow(2, 15)
 
-    def __init__(self):
+    # Event timestamps further than this (seconds) from our own clock are treated as unknown
+    MAX_INPUT_DELAY = 1.0
+
+    # Event code -> (field index, whether the value is an axis to normalize and filter)
+    EVENT_FIELDS = {
+        'ABS_X': (FIELDS.index('LeftJoystickX'), True),
+        'ABS_Y': (FIELDS.index('LeftJoystickY'), True),
+        'ABS_RX': (FIELDS.index('RightJoystickX'), True),
+        'ABS_RY': (FIELDS.index('RightJoystickY'), True),
+        'ABS_Z': (FIELDS.index('LeftTrigger'), True),
+        'ABS_RZ': (FIELDS.index('RightTrigger'), True),
+        'BTN_TL': (FIELDS.index('LeftBumper'), False),
+        'BTN_TR': (FIELDS.index('RightBumper'), False),
+        'BTN_SOUTH': (FIELDS.index('A'), False),
+        'BTN_WEST': (FIELDS.index('X'), False),
+        'BTN_NORTH': (FIELDS.index('Y'), False),
+        'BTN_EAST': (FIELDS.index('B'), False),
+        'BTN_THUMBL': (FIELDS.index('LeftThumb'), False),
+        'BTN_THUMBR': (FIELDS.index('RightThumb'), False),
+        'BTN_SELECT': (FIELDS.index('Back'), False),
+        'BTN_START': (FIELDS.index('Start'), False),
+        'BTN_TRIGGER_HAPPY1': (FIELDS.index('LeftDPad'), False),
+        'BTN_TRIGGER_HAPPY2': (FIELDS.index('RightDPad'), False),
+        'BTN_TRIGGER_HAPPY3': (FIELDS.index('UpDPad'), False),
+        'BTN_TRIGGER_HAPPY4': (FIELDS.index('DownDPad'), False),
+    }
+
+    def __init__(self, event_source=None):
         """Initialize all input values to zero then create and start a thread to call the method
-           for monitoring the controller for inputs."""
-
-        self.LeftJoystickY = 0
-        self.LeftJoystickX = 0
-        self.RightJoystickY = 0
-        self.RightJoystickX = 0
-        self.LeftTrigger = 0
-        self.RightTrigger = 0
-        self.LeftBumper = 0
-        self.RightBumper = 0
-        self.A = 0
-        self.X = 0
-        self.Y = 0
-        self.B = 0
-        self.LeftThumb = 0
-        self.RightThumb = 0
-        self.Back = 0
-        self.Start = 0
-        self.LeftDPad = 0
-        self.RightDPad = 0
-        self.UpDPad = 0
-        self.DownDPad = 0
+           for monitoring the controller for inputs. event_source replaces inputs.get_gamepad, e.g. a GamepadReplay."""
+        self._event_source = event_source if event_source is not None else get_gamepad
+
+        # Open recording file and the monotonic time the recording started
+        self._record_file = None
+        self._record_start = None
+        self._record_lock = threading.Lock()  # stop_recording never closes the file in the middle of a write
+
+        # The current snapshot is replaced as a whole, so readers never see half of an update
+        self._state = ControllerState(*([0] * len(FIELDS)), seq=0, stamp=time.monotonic(), input_delay=None)
+        self._changed = threading.Condition()
+
+        # Functions called (on the monitor thread) with the new snapshot after each batch of controller events
+        self._listeners = []
 
         self._monitor_thread = threading.Thread(target=self._monitor_controller, args=())
         self._monitor_thread.daemon = True
@@ -48,28 +79,66 @@ class XboxController(object):
 
     def read(self):
         """Return the current input values from the controller as a list."""
-        return [
-            self.LeftJoystickX,
-            self.LeftJoystickY,
-            self.RightJoystickX,
-            self.RightJoystickY,
-            self.LeftTrigger,
-            self.RightTrigger,
-            self.LeftBumper,
-            self.RightBumper,
-            self.A,
-            self.X,
-            self.Y,
-            self.B,
-            self.LeftThumb,
-            self.RightThumb,
-            self.Back,
-            self.Start,
-            self.LeftDPad,
-            self.RightDPad,
-            self.UpDPad,
-            self.DownDPad
-        ]
+        return list(self._state[:len(FIELDS)])
+
+    def snapshot(self):
+        """Return the current ControllerState (named fields, e.g. state.Start, plus seq and stamp)."""
+        return self._state
+
+    def read_if_changed(self, last_seq):
+        """Return the current ControllerState if it is newer than last_seq, otherwise None."""
+        state = self._state
+        return state if state.seq != last_seq else None
+
+    def wait_for_change(self, last_seq, timeout=None):
+        """Block until there is a ControllerState newer than last_seq and return it (None on timeout)."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._state.seq != last_seq, timeout)
+            return self.read_if_changed(last_seq)
+
+    def add_listener(self, callback):
+        """Register a function to be called with the new ControllerState whenever the controller state changes.
+           Events that arrive together are applied first and reported with a single call."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Remove a previously registered change listener."""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start_recording(self, filename='GamepadRecording.xbr'):
+        """Start writing every raw gamepad event with its arrival time to a file that GamepadReplay can play."""
+        record_file = open(filename, 'wb')
+        record_file.write(RECORD_MAGIC + b' ' + ','.join(RECORD_CODES).encode('ascii') + b'\n')
+        with self._record_lock:
+            self._record_start = time.monotonic()
+            self._record_file = record_file
+
+    def stop_recording(self):
+        """Stop recording and close the file."""
+        with self._record_lock:
+            record_file, self._record_file = self._record_file, None
+            if record_file is not None:
+                record_file.close()
+
+    def _record(self, events, stamp):
+        """Append a batch of events as fixed size records (seconds since the start, code index, raw state).
+           Runs on the monitor thread, so a failed write only stops the recording, never the controller."""
+        with self._record_lock:
+            # Read the file once under the lock, stop_recording may have cleared it since the caller checked
+            record_file = self._record_file
+            if record_file is None:
+                return
+            offset = stamp - self._record_start
+            try:
+                for event in events:
+                    code = RECORD_INDEX.get(event.code)
+                    if code is not None:
+                        record_file.write(RECORD.pack(offset, code, int(event.state)))
+            except (OSError, ValueError) as recordException:
+                print(f"Exception occurred when recording gamepad events, recording stopped.\nrecordException: {recordException}")
+                self._record_file = None
+                record_file.close()
 
     @staticmethod
     def _normalize(value):
@@ -90,54 +159,104 @@ class XboxController(object):
         return filtered_value
 
     def _monitor_controller(self):
-        """Execute an infinite loop that checks the controller (gamepad) for events and updates the XboxController
-           classes input values to the event state for each respective button/input sensors event code."""
+        """Execute an infinite loop that checks the controller (gamepad) for events, applies each batch of events to
+           a working copy of the input values and publishes it as a new snapshot if anything changed."""
+        values = list(self._state[:len(FIELDS)])
         while True:
-            events = get_gamepad()
+            events = self._event_source()
+            # Stamp the batch as soon as it arrives, the stamp travels with the snapshot to the RC datagram
+            stamp = time.monotonic()
+            if self._record_file is not None:
+                self._record(events, stamp)
+            wall_time = time.time()
+            oldest = None
             for event in events:
-                if event.code == 'ABS_Y':
-                    print(f"To get max values for normalizing, print the left joystick y before normalizing giving:\nvalue = {event.state}")
-                    self.LeftJoystickY = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'ABS_X':
-                    self.LeftJoystickX = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'ABS_RY':
-                    self.RightJoystickY = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'ABS_RX':
-                    self.RightJoystickX = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'ABS_Z':
-                    self.LeftTrigger = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'ABS_RZ':
-                    self.RightTrigger = self._filter_noise(self._normalize(event.state))
-                elif event.code == 'BTN_START':
-                    self.Start = event.state
-                elif event.code == 'BTN_TL':
-                    self.LeftBumper = event.state
-                elif event.code == 'BTN_TR':
-                    self.RightBumper = event.state
-                elif event.code == 'BTN_SOUTH':
-                    self.A = event.state
-                elif event.code == 'BTN_NORTH':
-                    self.Y = event.state
-                elif event.code == 'BTN_WEST':
-                    self.X = event.state
-                elif event.code == 'BTN_EAST':
-                    self.B = event.state
-                elif event.code == 'BTN_THUMBL':
-                    self.LeftThumb = event.state
-                elif event.code == 'BTN_THUMBR':
-                    self.RightThumb = event.state
-                elif event.code == 'BTN_SELECT':
-                    self.Back = event.state
-                elif event.code == 'BTN_START':
-                    self.Start = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY1':
-                    self.LeftDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY2':
-                    self.RightDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY3':
-                    self.UpDPad = event.state
-                elif event.code == 'BTN_TRIGGER_HAPPY4':
-                    self.DownDPad = event.state
+                field = self.EVENT_FIELDS.get(event.code)
+                if field is None:
+                    continue
+                index, is_axis = field
+                value = self._filter_noise(self._normalize(event.state)) if is_axis else event.state
+                if values[index] != value:
+                    values[index] = value
+                    # The OS stamps each event (wall clock), which shows how long it waited to be read
+                    event_time = getattr(event, 'timestamp', None) or wall_time
+                    oldest = event_time if oldest is None else min(oldest, event_time)
+            if oldest is not None:
+                input_delay = wall_time - oldest
+                if not 0.0 <= input_delay < self.MAX_INPUT_DELAY:
+                    input_delay = None
+                self._publish(values, stamp, input_delay)
+
+    def _publish(self, values, stamp, input_delay=None):
+        """Publish a new snapshot, wake any waiters and call the listeners."""
+        state = ControllerState(*values, seq=self._state.seq + 1, stamp=stamp, input_delay=input_delay)
+        with self._changed:
+            self._state = state
+            self._changed.notify_all()
+        for callback in list(self._listeners):
+            callback(state)
+
+
+# Read-only attributes (e.g. controller.Start) taken from the current snapshot
+for _index, _name in enumerate(FIELDS):
+    setattr(XboxController, _name, property(lambda self, i=_index: self._state[i]))
+
+
+# Recording file layout: a header line with the magic and the event codes, then one record per event
+RECORD_MAGIC = b'XBOXREC1'
+RECORD = struct.Struct('<dBi')
+RECORD_CODES = tuple(XboxController.EVENT_FIELDS) + ('SYN_REPORT',)
+RECORD_INDEX = {code: index for index, code in enumerate(RECORD_CODES)}
+
+# Event as handed to XboxController by GamepadReplay (same attributes the inputs package's events have)
+ReplayEvent = namedtuple('ReplayEvent', ('code', 'state', 'timestamp'))
+
+
+class GamepadReplay(object):
+    def __init__(self, filename='GamepadRecording.xbr', speed=1.0):
+        """Load a recording made with XboxController.start_recording. The object is called like
+           inputs.get_gamepad, returning each recorded batch of events at its recorded time divided by speed."""
+        with open(filename, 'rb') as record_file:
+            header = record_file.readline().split(b' ', 1)
+            if header[0] != RECORD_MAGIC:
+                raise ValueError(f"{filename} is not a gamepad recording")
+            codes = header[1].strip().decode('ascii').split(',')
+            data = record_file.read()
+
+        # Group the records into batches by their arrival time
+        self.batches = []
+        count = len(data) // RECORD.size
+        for offset, code, state in RECORD.iter_unpack(data[:count * RECORD.size]):
+            if not self.batches or self.batches[-1][0] != offset:
+                self.batches.append((offset, []))
+            self.batches[-1][1].append((codes[code], state))
+
+        self.speed = speed
+        self.index = 0
+        self.start = None
+        self.done = threading.Event()  # set once the last batch has been handed out
+        self._stop = threading.Event()
+
+    def __call__(self):
+        """Return the next batch of events at its (scaled) recorded time. After the last one, or once stopped, block
+           like an idle gamepad would."""
+        if self.start is None:
+            self.start = time.monotonic()
+        if self.index >= len(self.batches) or self._stop.is_set():
+            self.done.set()
+            threading.Event().wait()
+        offset, events = self.batches[self.index]
+        self.index += 1
+        delay = self.start + offset / self.speed - time.monotonic()
+        if delay > 0 and self._stop.wait(delay):
+            threading.Event().wait()
+        now = time.time()
+        return [ReplayEvent(code, state, now) for code, state in events]
+
+    def stop(self):
+        """Stop handing out events."""
+        self._stop.set()
+        self.done.set()
 
 
 if __name__ == '__main__':
@@ -146,11 +265,11 @@ if __name__ == '__main__':
     joy = XboxController()
     # Run a loop to read input from the controller until the program is terminated.
     while True:
-        # Get a list of controller values in real-time by calling read()
-        controller_values = joy.read()
+        # Wait for the next change and get it as a snapshot with named fields
+        controller_state = joy.wait_for_change(joy.snapshot().seq)
         """
-        # Access the start button from the list returned from read()
-        start_button = controller_values[14]
+        # Access the start button from the snapshot
+        start_button = controller_state.Start
             
         ### HERE IS HOW I FOUND THE PERFECT DELAY TO USE WHEN THE START BUTTON IS PRESSED ###
         print(f"start button before sleeping")
@@ -159,11 +278,11 @@ if __name__ == '__main__':
             time.sleep(0.15)
         print("after sleeping")
 
-        # Access controller values by their index in the list returned from read().
-        left_joy_x = controller_values[0]
-        left_joy_y = controller_values[1]
-        right_joy_x = controller_values[2]
-        right_joy_y = controller_values[3]
+        # Access controller values by name.
+        left_joy_x = controller_state.LeftJoystickX
+        left_joy_y = controller_state.LeftJoystickY
+        right_joy_x = controller_state.RightJoystickX
+        right_joy_y = controller_state.RightJoystickY
         # print(f"Left y = {left_joy_y}, Left x = {left_joy_x}")
         # print(f"Right y = {right_joy_y}, Right x = {right_joy_x}")
 